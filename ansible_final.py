@@ -1,8 +1,19 @@
+import json
 import os
+import select
+import shlex
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
+import tracing
+from inventory import router_inventory
+from state_cache import running_config_cache
+
 # ปรับให้ตรงกับเครื่องแล็บของคุณ
 ROUTER_USER = "admin"
 ROUTER_PASS = "cisco"
@@ -10,29 +21,55 @@ ROUTER_PASS = "cisco"
 USE_ENABLE = False
 ENABLE_SECRET = "cisco"
 
+# network_cli แบบ persistent: ค้าง SSH ไว้ให้ run ถัดไปใช้ต่อ (วินาทีที่ยอมให้ idle)
+PERSISTENT_IDLE_TIMEOUT = 300
+PLAYBOOK_TIMEOUT = 120
+
+# warm worker process (ดู _PlayWorker)
+MAX_WORKERS = 4                                # worker process / play ที่รันพร้อมกันได้สูงสุด (ทั้งบอท)
+WORKER_IDLE_TIMEOUT = PERSISTENT_IDLE_TIMEOUT  # ปิด worker ที่ไม่ได้ใช้นานเกินนี้ (วินาที)
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ต้องตั้ง env ก่อน import ansible ครั้งแรก (ansible อ่าน config ตอน import)
+os.environ.setdefault("ANSIBLE_HOST_KEY_CHECKING", "False")
+os.environ.setdefault("ANSIBLE_PERSISTENT_CONNECT_TIMEOUT", str(PERSISTENT_IDLE_TIMEOUT))
+os.environ.setdefault("ANSIBLE_PERSISTENT_COMMAND_TIMEOUT", str(PLAYBOOK_TIMEOUT))
+os.environ.setdefault("ANSIBLE_STRATEGY_PLUGINS", os.path.join(_BASE_DIR, "strategy_plugins"))
+
 def _write_file(path: str, content: str):
     with open(path, "w", encoding="utf-8") as f:
         f.write(content)
 
+def _host_vars(ip: str) -> dict:
+    """
+    ใช้ network_cli ต่อ Cisco IOS-XE (ชุดเดียวกับที่เขียนลง hosts.ini)
+    ตัวแปร ansible_* ของเครื่องใน inventory (ansible_user, ansible_password, ansible_port, ...) ทับค่าเริ่มต้น
+    """
+    hv = {
+        "ansible_connection": "ansible.netcommon.network_cli",
+        "ansible_network_os": "cisco.ios.ios",
+        "ansible_user": ROUTER_USER,
+        "ansible_password": ROUTER_PASS,
+        "ansible_ssh_common_args": "-o StrictHostKeyChecking=no",
+        "ansible_python_interpreter": "/usr/bin/python3",
+    }
+    if USE_ENABLE:
+        hv["ansible_become"] = True
+        hv["ansible_become_method"] = "enable"
+        hv["ansible_become_password"] = ENABLE_SECRET
+    device = router_inventory.by_ip(ip)
+    if device is not None:
+        hv.update({k: v for k, v in device.vars.items() if k.startswith("ansible_") and k != "ansible_host"})
+    return hv
+
 def _build_inventory(ip: str) -> str:
     """
-    ใช้ network_cli ต่อ Cisco IOS-XE
+    ใช้ network_cli ต่อ Cisco IOS-XE (ตัวแปรชุดเดียวกับ _host_vars)
     ปิด host key checking เพื่อกัน interactive prompt
     """
-    lines = [
-        "[routers]",
-        f"{ip} ansible_connection=ansible.netcommon.network_cli "
-        f"ansible_network_os=cisco.ios.ios ansible_user={ROUTER_USER} ansible_password={ROUTER_PASS} "
-        "ansible_ssh_common_args='-o StrictHostKeyChecking=no'",
-        "",
-        "[routers:vars]",
-        "ansible_python_interpreter=/usr/bin/python3",
-    ]
-    if USE_ENABLE:
-        lines.append("ansible_become=true")
-        lines.append("ansible_become_method=enable")
-        lines.append(f"ansible_become_password={ENABLE_SECRET}")
-    return "\n".join(lines) + "\n"
+    host_vars = " ".join(f"{k}={shlex.quote(str(v))}" for k, v in _host_vars(ip).items())
+    return "\n".join(["[routers]", f"{ip} {host_vars}", ""])
 
 def _playbook_ios_banner(message: str) -> str:
     """
@@ -42,6 +79,7 @@ def _playbook_ios_banner(message: str) -> str:
     - name: Configure MOTD banner via ios_banner
       hosts: routers
       gather_facts: no
+      strategy: linear_persistent
       collections:
         - cisco.ios
       tasks:
@@ -69,6 +107,7 @@ def _playbook_ios_config_fallback(message: str) -> str:
     - name: Configure MOTD banner via ios_config (fallback)
       hosts: routers
       gather_facts: no
+      strategy: linear_persistent
       collections:
         - ansible.netcommon
         - cisco.ios
@@ -79,72 +118,383 @@ def _playbook_ios_config_fallback(message: str) -> str:
               - "banner motd {delim}{message}{delim}"
     """).strip() + "\n"
 
-def write_motd(student_id: str, ip: str, message: str) -> str:
+# ------------------------------
+# Play engine (โหลด Ansible ครั้งเดียว ใช้ซ้ำทุก request) — รันใน warm worker process ของแต่ละ router
+# ------------------------------
+# ข้อความ error ที่แปลว่า "ไม่มี module ios_banner" => ไปใช้ ios_config แทน
+_FALLBACK_HINTS = (
+    "couldn't resolve module/action 'ios_banner'",
+    "collection cisco.ios was not found",
+    "the task includes an option with an undefined variable",
+    "module not found",
+)
+
+
+def _needs_fallback(text: str) -> bool:
+    text = text.lower()
+    return any(hint in text for hint in _FALLBACK_HINTS)
+
+
+class _AnsibleEngine:
     """
-    ใช้ Ansible ตั้งค่า MOTD ให้เป็นข้อความที่รับมา
-    คืนค่า:
-      "Ok: success" ถ้าสำเร็จ
-      "Error: <รายละเอียด>" ถ้าล้มเหลว
+    รัน play ใน process เดียวกันซ้ำ ๆ แทนการ fork ansible-playbook ทุกครั้ง
+      - import ansible / โหลด collection / DataLoader / Inventory แค่ครั้งแรก
+      - host อยู่ใน inventory ที่ค้างไว้ (เพิ่มตอนเจอครั้งแรก)
+      - ใช้ strategy linear_persistent => socket network_cli ไม่ถูก reset
+        ทุกครั้งที่จบ run ทำให้ run ถัดไปไม่ต้อง SSH login ใหม่
+    Ansible (TaskQueueManager) ไม่ thread-safe จึงรันทีละ play ต่อ process (ถือ lock)
+    => บอทไม่รัน engine ใน process ตัวเอง แต่ให้ _PlayWorker ของแต่ละ router รัน
     """
-    # กันเคสกลุ่ม user ส่งว่าง ๆ มา
-    message = (message or "").strip()
-    if not message:
-        return "Error: Empty MOTD"
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def _load(self):
+        if self._ready:
+            return
+        from ansible import context
+        from ansible.inventory.manager import InventoryManager
+        from ansible.module_utils.common.collections import ImmutableDict
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.playbook.play import Play
+        from ansible.plugins.callback import CallbackBase
+        from ansible.plugins.loader import init_plugin_loader
+        from ansible.executor.task_queue_manager import TaskQueueManager
+        from ansible.vars.manager import VariableManager
+
+        # เหมือนที่ ansible-playbook ทำตอนเริ่ม: ติดตั้ง collection loader (ansible.builtin, cisco.ios, ...)
+        init_plugin_loader()
+
+        context.CLIARGS = ImmutableDict(
+            connection="smart", module_path=None, forks=5, verbosity=0,
+            become=USE_ENABLE, become_method="enable", become_user=None,
+            check=False, diff=False, syntax=False, start_at_task=None,
+        )
+
+        class _Collector(CallbackBase):
+            CALLBACK_VERSION = 2.0
+            CALLBACK_TYPE = "stdout"
+            CALLBACK_NAME = "motd_collector"
+
+            def __init__(self):
+                super().__init__()
+                self.errors = []
+
+            def v2_runner_on_failed(self, result, ignore_errors=False):
+                if not ignore_errors:
+                    self.errors.append(result._result.get("msg") or str(result._result))
+
+            def v2_runner_on_unreachable(self, result):
+                self.errors.append(result._result.get("msg") or "host unreachable")
+
+        self._Play = Play
+        self._TaskQueueManager = TaskQueueManager
+        self._Collector = _Collector
+        self._loader = DataLoader()
+        self._inventory = InventoryManager(loader=self._loader, sources=[])
+        self._inventory.add_group("routers")
+        self._variable_manager = VariableManager(loader=self._loader, inventory=self._inventory)
+        self._ready = True
+
+    def _ensure_host(self, ip: str, host_vars: dict):
+        host = self._inventory.get_host(ip)
+        if host is None:
+            self._inventory.add_host(ip, group="routers")
+            host = self._inventory.get_host(ip)
+        for k, v in host_vars.items():
+            host.set_variable(k, v)
+
+    def run_play(self, ip: str, playbook_yaml: str, host_vars: dict):
+        """
+        คืนค่า: (ok: bool, detail: str)
+        """
+        with self._lock:
+            if not self._ready:
+                self._load()
+            self._ensure_host(ip, host_vars)
+            play_ds = self._loader.load(playbook_yaml)[0]
+            play_ds["hosts"] = ip  # เทียบเท่า -l ip
+            play = self._Play().load(play_ds, variable_manager=self._variable_manager,
+                                     loader=self._loader)
+            collector = self._Collector()
+            tqm = self._TaskQueueManager(
+                inventory=self._inventory,
+                variable_manager=self._variable_manager,
+                loader=self._loader,
+                passwords={},
+            )
+            # ansible-core 2.19 รับแค่ชื่อ stdout callback => โหลดตามปกติแล้วแทนตัว stdout ด้วย collector
+            tqm.load_callbacks()
+            collector._init_callback_methods()
+            tqm._callback_plugins[0] = collector
+            try:
+                rc = tqm.run(play)
+            finally:
+                tqm.cleanup()
+                self._loader.cleanup_all_tmp_files()
+        if rc == 0 and not collector.errors:
+            return True, ""
+        return False, "; ".join(str(e) for e in collector.errors) or f"ansible rc={rc}"
+
+
+_engine = _AnsibleEngine()
+
+
+def _worker_main():
+    """
+    ตัว worker process (python ansible_final.py --worker)
+    รับ request ทาง stdin ทีละบรรทัด (JSON: ip, vars, playbook) ตอบทาง stdout ทีละบรรทัด
+      {"ok": bool, "detail": str} หรือ {"unavailable": str} ถ้า import ansible ไม่ได้
+    stdin ปิด (บอทปิด/ตาย) => จบ process
+    """
+    out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)  # ข้อความที่ ansible print ออก stdout ไปลง stderr แทน ไม่ปนกับคำตอบ
+    for line in sys.stdin:
+        req = json.loads(line)
+        try:
+            ok, detail = _engine.run_play(req["ip"], req["playbook"], req["vars"])
+            reply = {"ok": ok, "detail": detail}
+        except ImportError as e:
+            # import ansible ไม่ได้ตั้งแต่แรก => บอทไปใช้ ansible-playbook แทน
+            # (ImportError ระหว่างรัน play เช่นหา collection ไม่เจอ ถือเป็นผลของ play นั้น)
+            reply = {"ok": False, "detail": str(e)} if _engine.ready else {"unavailable": str(e)}
+        except Exception as e:
+            # parse error (เช่น resolve module ไม่ได้) มาในรูป exception
+            reply = {"ok": False, "detail": str(e)}
+        out.write(json.dumps(reply) + "\n")
+        out.flush()
+
+
+class _PlayWorker:
+    """
+    warm worker process ค้างไว้ 1 ตัวต่อ router (เริ่มตอนเขียน MOTD ครั้งแรก)
+      - import ansible / โหลด collection ครั้งเดียวต่อ process
+      - persistent connection (network_cli) ของ router นั้นค้างอยู่กับ process นี้
+      - router ต่างตัวรัน play พร้อมกันได้จริง (คนละ process ไม่มี lock กลาง)
+    play ค้างเกิน PLAYBOOK_TIMEOUT หรือ process ตาย => ปิดทิ้ง ครั้งหน้าเริ่มใหม่
+    มีพร้อมกันได้ไม่เกิน MAX_WORKERS ตัว และตัวที่ idle เกิน WORKER_IDLE_TIMEOUT ถูกปิด (ดู _lease_worker)
+    """
+
+    def __init__(self, ip):
+        self.ip = ip
+        self._lock = threading.Lock()  # router เดียวกันทีละ play
+        self._proc = None
+        self.users = 0                 # จำนวน play ที่ยืม worker นี้อยู่ (แก้ภายใต้ _workers_lock)
+        self.last_used = time.monotonic()
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            cwd=_BASE_DIR,
+        )
+
+    def run_play(self, playbook_yaml: str):
+        """
+        คืนค่า: (ok, detail) หรือ None ถ้า worker ใช้ Ansible ไม่ได้ (ไม่มี lib)
+        """
+        request = json.dumps({"ip": self.ip, "vars": _host_vars(self.ip), "playbook": playbook_yaml})
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self._start()
+            try:
+                self._proc.stdin.write(request + "\n")
+                self._proc.stdin.flush()
+                ready, _, _ = select.select([self._proc.stdout], [], [], PLAYBOOK_TIMEOUT)
+                line = self._proc.stdout.readline() if ready else ""
+            except (OSError, ValueError):
+                line = ""
+            if not line:
+                self._close()
+                return False, f"ansible worker for {self.ip} gave no result within {PLAYBOOK_TIMEOUT}s"
+        reply = json.loads(line)
+        if "unavailable" in reply:
+            return None
+        return reply["ok"], reply["detail"]
+
+    def _close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()  # worker จบเองเมื่อ stdin ปิด
+            proc.wait(5)
+        except Exception:
+            proc.kill()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+_workers = {}  # router_ip -> _PlayWorker
+_workers_lock = threading.Lock()
+_play_slots = threading.BoundedSemaphore(MAX_WORKERS)  # play ที่รันพร้อมกันทั้งบอท
+_reaper = None
+
+
+def _lease_worker(ip: str) -> _PlayWorker:
+    """
+    (ถือ _play_slots แล้ว) ยืม worker ของ router นี้ ไม่มี => สร้างใหม่
+    ครบ MAX_WORKERS ตัวแล้ว => ปิดตัวที่ว่างและใช้ล่าสุดนานที่สุดก่อน
+    (play รันพร้อมกันได้ไม่เกิน MAX_WORKERS จึงมีตัวที่ว่างให้ปิดเสมอ)
+    """
+    global _reaper
+    evicted = None
+    with _workers_lock:
+        worker = _workers.get(ip)
+        if worker is None:
+            if len(_workers) >= MAX_WORKERS:
+                evicted = min((w for w in _workers.values() if not w.users), key=lambda w: w.last_used)
+                del _workers[evicted.ip]
+            worker = _workers[ip] = _PlayWorker(ip)
+        worker.users += 1
+        if _reaper is None:
+            _reaper = threading.Thread(target=_reap_loop, name="ansible-reaper", daemon=True)
+            _reaper.start()
+    if evicted is not None:
+        evicted.close()
+    return worker
+
+
+def _release_worker(worker: _PlayWorker):
+    with _workers_lock:
+        worker.users -= 1
+        worker.last_used = time.monotonic()
+
+
+def _reap_loop():
+    """ปิด worker ที่ไม่มีใครใช้นานเกิน WORKER_IDLE_TIMEOUT"""
+    interval = max(1.0, min(WORKER_IDLE_TIMEOUT / 2, 30))
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        with _workers_lock:
+            idle = [w for w in _workers.values() if not w.users and now - w.last_used >= WORKER_IDLE_TIMEOUT]
+            for worker in idle:
+                del _workers[worker.ip]
+        for worker in idle:
+            worker.close()
+
+
+def close_workers():
+    """ปิด worker process ทุกตัว (ตอนบอทปิด)"""
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for worker in workers:
+        worker.close()
+
+
+def _run_in_worker(ip: str, playbook_yaml: str):
+    """
+    คืนค่า: (ok, detail) หรือ None ถ้าใช้ Ansible ผ่าน worker ไม่ได้ (ไม่มี lib)
+    """
+    with _play_slots:
+        try:
+            worker = _lease_worker(ip)
+        except Exception as e:
+            return False, str(e)
+        try:
+            return worker.run_play(playbook_yaml)
+        except Exception as e:
+            return False, str(e)
+        finally:
+            _release_worker(worker)
+
+
+def _run_subprocess(ip: str, playbook_yaml: str):
+    """
+    ทางเดิม: fork ansible-playbook (ใช้เมื่อ worker import ansible ไม่ได้)
+    """
     # เตรียม temp dir สำหรับ inventory + playbook
     tmpdir = tempfile.mkdtemp(prefix="ans_motd_")
     inv_path = os.path.join(tmpdir, "hosts.ini")
-    pb1_path = os.path.join(tmpdir, "pb_banner.yml")
-    pb2_path = os.path.join(tmpdir, "pb_fallback.yml")
-
+    pb_path = os.path.join(tmpdir, "pb.yml")
     _write_file(inv_path, _build_inventory(ip))
-    _write_file(pb1_path, _playbook_ios_banner(message))
-    _write_file(pb2_path, _playbook_ios_config_fallback(message))
+    _write_file(pb_path, playbook_yaml)
 
     env = os.environ.copy()
     env["ANSIBLE_HOST_KEY_CHECKING"] = "False"  # ไม่ถาม host key
-    # ทำให้ output สั้นลง (ถ้าอยากอ่าน JSON ก็ใส่ stdout callback json ได้)
-    # env["ANSIBLE_STDOUT_CALLBACK"] = "yaml"
-
-    # 1) ลองวิธีหลัก ios_banner ก่อน
-    try:
+    with tracing.span("playbook", method="ansible", router=ip):
         res = subprocess.run(
-            ["ansible-playbook", "-i", inv_path, pb1_path, "-l", ip],
+            ["ansible-playbook", "-i", inv_path, pb_path, "-l", ip],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
             env=env,
-            timeout=120,
+            timeout=PLAYBOOK_TIMEOUT,
         )
-        if res.returncode == 0:
+    if res.returncode == 0:
+        return True, ""
+    return False, res.stderr.strip() or res.stdout.strip()
+
+
+def _run_playbook(ip: str, playbook_yaml: str):
+    with tracing.span("playbook", method="ansible", router=ip):
+        result = _run_in_worker(ip, playbook_yaml)
+    if result is None:
+        result = _run_subprocess(ip, playbook_yaml)
+    return result
+
+
+def write_motd(student_id: str, ip: str, message: str) -> str:
+    """
+    ใช้ Ansible ตั้งค่า MOTD ให้เป็นข้อความที่รับมา
+    คืนค่า:
+      "Ok: success" ถ้าสำเร็จ
+      "Error: <รายละเอียด>" ถ้าล้มเหลว
+    """
+    # กันเคสกลุ่ม user ส่งว่าง ๆ มา
+    message = (message or "").strip()
+    if not message:
+        return "Error: Empty MOTD"
+
+    # 1) ลองวิธีหลัก ios_banner ก่อน
+    try:
+        # playbook แก้ config => snapshot running-config ของเครื่องนี้ใช้ไม่ได้แล้ว
+        with running_config_cache.writing(ip):
+            ok, detail = _run_playbook(ip, _playbook_ios_banner(message))
+        if ok:
             return "Ok: success"
         # ถ้า error เกี่ยวกับ collection/module ไม่เจอ ค่อย fallback
-        txt = (res.stdout + "\n" + res.stderr).lower()
-        if "couldn't resolve module/action 'ios_banner'" in txt or \
-           "collection cisco.ios was not found" in txt or \
-           "the task includes an option with an undefined variable" in txt or \
-           "module not found" in txt:
-            # ไป fallback
-            pass
-        else:
-            return f"Error: {res.stderr.strip() or res.stdout.strip()}"
-    except Exception as e:
+        if not _needs_fallback(detail):
+            return f"Error: {detail}"
+    except Exception:
         # ถ้ารันไม่ขึ้น ลอง fallback ต่อ
         pass
 
     # 2) Fallback: ios_config
     try:
-        res2 = subprocess.run(
-            ["ansible-playbook", "-i", inv_path, pb2_path, "-l", ip],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            env=env,
-            timeout=120,
-        )
-        if res2.returncode == 0:
+        with running_config_cache.writing(ip):
+            ok, detail = _run_playbook(ip, _playbook_ios_config_fallback(message))
+        if ok:
             return "Ok: success"
-        return f"Error: {res2.stderr.strip() or res2.stdout.strip()}"
+        return f"Error: {detail}"
     except Exception as e2:
         return f"Error: {str(e2)}"
-    
+
+
+def write_motd_many(student_id: str, ips, message: str):
+    """
+    write_motd กับหลาย router พร้อมกันทีละไม่เกิน MAX_WORKERS ตัว (แต่ละตัวรันบน worker ของตัวเอง)
+    => router ไม่เกิน MAX_WORKERS ตัว: เวลารวม ≈ router ที่ช้าที่สุด ไม่ใช่ผลรวมของทุกตัว
+    คืนค่า: list ผลของ write_motd เรียงตาม ips
+    """
+    ips = list(ips)
+    if not ips:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(ips), MAX_WORKERS), thread_name_prefix="motd") as pool:
+        return list(pool.map(lambda ip: write_motd(student_id, ip, message), ips))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--worker"]:
+        _worker_main()
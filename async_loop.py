@@ -0,0 +1,89 @@
+import asyncio
+import threading
+
+import tracing
+
+
+# ------------------------------
+# Event loop กลางของบอท (รันใน thread เบื้องหลัง 1 ตัว)
+# ------------------------------
+# งาน I/O ของ restconf_final / netconf_final ทุกตัวรันบน loop นี้
+#   - โค้ดแบบ blocking (worker ของ dispatcher) เรียก run(coro) แล้วรอผล
+#   - โค้ด async (loop อื่น) เรียก await call(coro) => งานถูกส่งมารันที่ loop นี้
+# session ที่ผูกกับ loop (aiohttp, asyncio.Lock ของ NETCONF pool) จึงมีชุดเดียวใช้ร่วมกัน
+_loop = None
+_thread = None
+_guard = threading.Lock()
+_cleanups = []  # coroutine function ที่ต้อง await ก่อนปิด loop (ปิด session ต่าง ๆ)
+
+
+def get_loop():
+    global _loop, _thread
+    with _guard:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="async-io", daemon=True)
+            _thread.start()
+        return _loop
+
+
+def in_loop_thread() -> bool:
+    return _thread is not None and threading.current_thread() is _thread
+
+
+async def _with_trace(coro, trace):
+    # run_coroutine_threadsafe ไม่พา contextvar ของผู้เรียกมาด้วย => activate trace เดิมซ้ำใน task นี้
+    with tracing.activate(trace):
+        return await coro
+
+
+def run(coro, timeout=None):
+    """
+    รัน coroutine บน loop กลางแล้วรอผล (ใช้จาก thread ธรรมดา)
+    ห้ามเรียกจากในตัว loop เอง (จะ deadlock) => ใช้ await call(coro) แทน
+    """
+    if in_loop_thread():
+        coro.close()
+        raise RuntimeError("async_loop.run() called from the event loop thread; use 'await call()'")
+    future = asyncio.run_coroutine_threadsafe(_with_trace(coro, tracing.current()), get_loop())
+    return future.result(timeout)
+
+
+async def call(coro):
+    """await งานบน loop กลาง จาก coroutine ใดก็ได้ (loop เดียวกันก็ await ตรง ๆ)"""
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    future = asyncio.run_coroutine_threadsafe(_with_trace(coro, tracing.current()), loop)
+    return await asyncio.wrap_future(future)
+
+
+def on_shutdown(cleanup):
+    """ลงทะเบียน coroutine function ที่ stop() จะ await ก่อนปิด loop"""
+    _cleanups.append(cleanup)
+
+
+async def _run_cleanups():
+    for cleanup in _cleanups:
+        try:
+            await cleanup()
+        except Exception as e:
+            print(f"[ASYNC] cleanup failed: {e}")
+
+
+def stop(timeout=10):
+    """ปิด session ที่ลงทะเบียนไว้ แล้วหยุด loop (ตอนบอทปิด)"""
+    global _loop, _thread
+    with _guard:
+        loop, thread = _loop, _thread
+        _loop = _thread = None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_run_cleanups(), loop).result(timeout)
+    except Exception as e:
+        print(f"[ASYNC] shutdown: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout)
+    if not loop.is_running():
+        loop.close()
@@ -0,0 +1,106 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+import tracing
+
+# backend ที่ run.py ใช้ (ชื่อ module) — import จริงตอนใช้ครั้งแรกเท่านั้น
+# ncclient/lxml/netmiko/paramiko/textfsm/aiohttp/ansible รวมกันหลายร้อย ms => ไม่ให้ขวางการเริ่มบอท
+BACKENDS = ("restconf_final", "netconf_final", "netmiko_final", "ansible_final")
+
+# โหลดล่วงหน้าใน thread เบื้องหลังหลังบอทพร้อมรับข้อความ
+#   "all" (ค่าเริ่มต้น) | "none" | รายชื่อคั่นด้วย , เช่น "restconf_final,netmiko_final"
+PREWARM = os.getenv("BOT_PREWARM", "all")
+
+
+class LazyModule:
+    """
+    ตัวแทน module ที่ import ตอนมีคนอ่าน attribute ครั้งแรก (เช่น restconf_final.create_interface)
+    import ครั้งแรกถูกบันทึกเป็น span "backend_import" ของคำสั่งที่ทำให้โหลด
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def load(self):
+        module = self._module
+        if module is not None:
+            return module
+        with self._lock:
+            if self._module is None:
+                t0 = time.perf_counter()
+                with tracing.span("backend_import"):
+                    self._module = importlib.import_module(self._name)
+                tracing.registry.observe("bot_backend_import_seconds", time.perf_counter() - t0,
+                                         backend=self._name)
+            return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+_modules = {name: LazyModule(name) for name in BACKENDS}
+
+restconf_final = _modules["restconf_final"]
+netconf_final = _modules["netconf_final"]
+netmiko_final = _modules["netmiko_final"]
+ansible_final = _modules["ansible_final"]
+
+
+def _prewarm_names(spec):
+    spec = (spec or "").strip().lower()
+    if spec in ("", "none", "0", "false", "no"):
+        return []
+    if spec == "all":
+        return list(BACKENDS)
+    names = [n.strip() for n in spec.split(",") if n.strip()]
+    unknown = [n for n in names if n not in _modules]
+    if unknown:
+        print(f"[BACKENDS] Ignoring unknown prewarm backends: {', '.join(unknown)}")
+    return [n for n in names if n in _modules]
+
+
+def prewarm(spec=PREWARM):
+    """
+    import backend ตาม spec ใน daemon thread (คืนค่า thread หรือ None ถ้าไม่มีอะไรต้องโหลด)
+    คำสั่งที่มาระหว่างนี้ไม่ต้องรอทั้งชุด: แต่ละ module มี lock ของตัวเอง
+    """
+    names = [n for n in _prewarm_names(spec) if not _modules[n].loaded]
+    if not names:
+        return None
+
+    def _run():
+        t0 = time.perf_counter()
+        for name in names:
+            try:
+                _modules[name].load()
+            except Exception as e:
+                # ยังลองใหม่ได้ตอนใช้จริง (error จะไปโผล่ในคำตอบของคำสั่งนั้น)
+                print(f"\n[BACKENDS] Prewarm {name} failed: {e}")
+        print(f"\n[BACKENDS] Prewarmed {', '.join(names)} in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    thread = threading.Thread(target=_run, name="backend-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def shutdown():
+    """ปิด event loop ของ restconf/netconf และ worker ของ ansible — เฉพาะเมื่อเคยถูกโหลด (ไม่ import เพื่อจะปิด)"""
+    async_loop = sys.modules.get("async_loop")
+    if async_loop is not None:
+        async_loop.stop()  # ปิด HTTP/NETCONF session ที่ค้างอยู่ใน event loop
+    ansible_final = sys.modules.get("ansible_final")
+    if ansible_final is not None:
+        ansible_final.close_workers()  # ปิด worker process ของ ansible
@@ -0,0 +1,90 @@
+"""
+Benchmark เวลา import ตอนบอทเริ่ม (cold start) — ทุกรอบรัน python process ใหม่
+
+แถว:
+  python            = interpreter เปล่า (ฐาน)
+  run.py startup    = import ระดับบนสุดของ run.py (อ่านจาก run.py เอง => แก้ import แล้วตัวเลขตามทันที)
+  eager backends    = startup + import backend ทุกตัวทันที (แบบเดิมก่อน lazy)
+  <backend>         = import backend ตัวเดียว (ต้นทุนที่คำสั่งแรกของ backend นั้นจ่าย ถ้าไม่ prewarm)
+ms = wall time ของ process ลบด้วย python เปล่า
+
+--top N: แสดง module ที่ใช้เวลามากสุดของ run.py startup (จาก python -X importtime)
+
+ใช้: python -m bench.import_bench --iterations 10 --top 15
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+import time
+
+from bench.stats import percentile
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def startup_imports(path=os.path.join(_ROOT, "run.py")):
+    """statement import ระดับบนสุดของ run.py (ไม่รวม import ในฟังก์ชัน)"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def _run(code, extra_args=()):
+    env = dict(os.environ, PYTHONPATH=_ROOT, PYTHONDONTWRITEBYTECODE="")
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, *extra_args, "-c", code], cwd=_ROOT, env=env,
+                          capture_output=True, text=True)
+    dt = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(f"import failed:\n{code}\n{proc.stderr.strip()}")
+    return dt, proc.stderr
+
+
+def _measure(code, iterations):
+    _run(code)  # warm-up: .pyc + page cache (วัด restart จริง ไม่ใช่ติดตั้งครั้งแรก)
+    return [_run(code)[0] for _ in range(iterations)]
+
+
+def _top_modules(code, n):
+    """(self µs, cumulative µs, module) ของ module ที่ import นานสุด"""
+    _, stderr = _run(code, ("-X", "importtime"))
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(self_us), int(cumulative_us), name))
+    return sorted(rows, key=lambda r: r[1], reverse=True)[:n]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=5)
+    ap.add_argument("--top", type=int, default=0, help="show N slowest modules of run.py startup")
+    args = ap.parse_args()
+
+    import backends  # แค่อ่านรายชื่อ backend (ไม่ import backend จริง)
+
+    startup = "\n".join(startup_imports())
+    cases = [("python", "pass"), ("run.py startup", startup),
+             ("eager backends", startup + "\n" + "\n".join(f"import {name}" for name in backends.BACKENDS))]
+    cases += [(name, f"import {name}") for name in backends.BACKENDS]
+
+    base = percentile(_measure("pass", args.iterations), 50)
+    print(f"{'imports':<22}{'n':>4}{'p50 ms':>10}{'p99 ms':>10}{'- python ms':>13}")
+    for name, code in cases:
+        lat = _measure(code, args.iterations)
+        p50 = percentile(lat, 50)
+        print(f"{name:<22}{len(lat):>4}{p50 * 1000:>10.1f}{percentile(lat, 99) * 1000:>10.1f}"
+              f"{(p50 - base) * 1000:>13.1f}")
+
+    if args.top:
+        print(f"\n{'run.py startup module':<48}{'self ms':>10}{'cum ms':>10}")
+        for self_us, cumulative_us, name in _top_modules(startup, args.top):
+            print(f"{name:<48}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Cisco IOS (SSH CLI) จำลองสำหรับ benchmark netmiko_final
+เปิด shell แล้วได้ prompt "<hostname>#" (privileged exec) ตอบคำสั่ง:
+  terminal length 0 / terminal width 511     (session_preparation ของ Netmiko)
+  show banner motd                           ข้อความ motd
+  show running-config                        config ยาว config_lines บรรทัด (มี banner motd ^C..^C)
+  show ip interface brief                    ตาราง interfaces (GigabitEthernet1-4 เป็นค่าเริ่มต้น)
+  exit / logout                              ปิด channel
+ตั้งค่าได้:
+  - command_latency: เวลาคิดก่อนเริ่มตอบ (วินาที ต่อคำสั่ง)
+  - line_delay: หน่วงต่อบรรทัดของ output (จำลองอุปกรณ์ที่พ่น output ช้า)
+  - show_banner=False: "show banner motd" ตอบ "% No banner configured"
+    => บังคับให้ read_motd ไปทาง fallback show running-config
+device_time สะสมเวลาที่ "อุปกรณ์" ใช้จริง (latency + line delay) ไว้เทียบกับเวลาที่ client วัดได้
+
+รันเดี่ยว: python -m bench.mock_ios --port 2222 --config-lines 2000 --line-delay 0.0005
+"""
+import argparse
+import threading
+import time
+
+from bench.ssh_server import MockSSHServer
+
+DEFAULT_MOTD = "Authorized users only! Managed by IPA2025 bot"
+# (ชื่อ, IP, status, protocol) แบบที่เห็นใน show ip interface brief
+DEFAULT_INTERFACES = (
+    ("GigabitEthernet1", "10.0.15.61", "up", "up"),
+    ("GigabitEthernet2", "unassigned", "up", "up"),
+    ("GigabitEthernet3", "unassigned", "down", "down"),
+    ("GigabitEthernet4", "unassigned", "administratively down", "down"),
+)
+
+
+class MockIosDevice(MockSSHServer):
+    supports_shell = True
+
+    def __init__(self, host="127.0.0.1", port=0, hostname="R1", motd=DEFAULT_MOTD,
+                 config_lines=300, line_delay=0.0, command_latency=0.0, show_banner=True,
+                 interfaces=DEFAULT_INTERFACES, username="admin", password="cisco"):
+        super().__init__(host, port, username, password)
+        self.hostname = hostname
+        self.motd = motd
+        self.config_lines = config_lines
+        self.line_delay = line_delay
+        self.command_latency = command_latency
+        self.show_banner = show_banner
+        self.interfaces = list(interfaces)
+        self.commands = {}      # คำสั่ง -> จำนวนครั้ง
+        self.device_time = 0.0  # วินาทีที่ใช้สร้าง output (ไม่รวม network/SSH)
+        self._stats_lock = threading.Lock()
+        self._running_config = None
+
+    @property
+    def prompt(self):
+        return f"{self.hostname}#"
+
+    # ---------- เนื้อหา ----------
+    def running_config(self):
+        """สร้างครั้งเดียว (cache ไว้) — ห้ามมี '#' ในเนื้อหา เพราะ Netmiko ใช้ # หา prompt"""
+        if self._running_config is None:
+            body = ["version 17.3", "service timestamps debug datetime msec",
+                    f"hostname {self.hostname}", "!"]
+            n = 0
+            while len(body) < max(self.config_lines - 8, 0):
+                n += 1
+                body += [f"interface Loopback{n}",
+                         f" description bench-filler-{n}",
+                         f" ip address 10.{n // 250 % 250}.{n % 250}.1 255.255.255.255",
+                         "!"]
+            if self.motd:
+                body += [f"banner motd ^C{self.motd}^C", "!"]
+            body += ["line vty 0 4", " login local", " transport input ssh", "!", "end"]
+            size = sum(len(line) + 1 for line in body)
+            header = ["Building configuration...", "", f"Current configuration : {size} bytes", "!"]
+            self._running_config = header + body
+        return self._running_config
+
+    def respond(self, command):
+        """คืนค่า list ของบรรทัด output หรือ None => ปิด session"""
+        cmd = " ".join(command.split())
+        if not cmd:
+            return []
+        with self._stats_lock:
+            self.commands[cmd] = self.commands.get(cmd, 0) + 1
+        if cmd in ("exit", "logout", "quit"):
+            return None
+        if cmd.startswith("terminal length") or cmd.startswith("terminal width"):
+            return []
+        if cmd == "show banner motd":
+            if not self.show_banner or not self.motd:
+                return ["% No banner configured"]
+            return self.motd.splitlines()
+        if cmd in ("show running-config", "show run"):
+            return self.running_config()
+        if cmd == "show ip interface brief":
+            lines = [f"{'Interface':<27}{'IP-Address':<16}{'OK?':<4}{'Method':<7}{'Status':<22}Protocol"]
+            for name, address, status, proto in self.interfaces:
+                method = "unset" if address == "unassigned" else "manual"
+                lines.append(f"{name:<27}{address:<16}{'YES':<4}{method:<7}{status:<22}{proto}")
+            return lines
+        return [" " * len(self.prompt) + "^", "% Invalid input detected at '^' marker.", ""]
+
+    # ---------- shell ----------
+    def handle_shell(self, channel):
+        channel.sendall(f"\r\n{self.motd}\r\n\r\n{self.prompt}".encode() if self.motd
+                        else f"\r\n{self.prompt}".encode())
+        line = ""
+        last = ""
+        while True:
+            data = channel.recv(4096)
+            if not data:
+                return
+            echo = ""
+            for ch in data.decode("utf-8", "replace"):
+                if ch == "\n" and last == "\r":
+                    last = ch
+                    continue  # \r\n = Enter ครั้งเดียว
+                last = ch
+                if ch == "\x00":
+                    continue  # Netmiko is_alive() ส่ง NUL มาเช็ก channel — IOS ไม่สนใจ
+                if ch not in "\r\n":
+                    line += ch
+                    echo += ch
+                    continue
+                # Enter: ส่ง echo ที่ค้าง + ขึ้นบรรทัดใหม่ แล้วค่อยตอบ
+                channel.sendall((echo + "\r\n").encode())
+                echo = ""
+                output = self.respond(line)
+                line = ""
+                if output is None:
+                    return
+                self._send_output(channel, output)
+            if echo:
+                channel.sendall(echo.encode())
+
+    def _send_output(self, channel, lines):
+        t0 = time.perf_counter()
+        if self.command_latency:
+            time.sleep(self.command_latency)
+        if self.line_delay and lines:
+            for line in lines:
+                channel.sendall(f"{line}\r\n".encode())
+                time.sleep(self.line_delay)
+        elif lines:
+            channel.sendall(("\r\n".join(lines) + "\r\n").encode())
+        with self._stats_lock:
+            self.device_time += time.perf_counter() - t0
+        channel.sendall(self.prompt.encode())
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mock Cisco IOS SSH CLI")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=2222)
+    ap.add_argument("--hostname", default="R1")
+    ap.add_argument("--config-lines", type=int, default=300)
+    ap.add_argument("--line-delay", type=float, default=0.0, help="seconds per output line")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds before each command's output")
+    ap.add_argument("--no-show-banner", action="store_true",
+                    help="'show banner motd' answers '% No banner configured' (forces the running-config fallback)")
+    args = ap.parse_args()
+    dev = MockIosDevice(args.host, args.port, args.hostname, config_lines=args.config_lines,
+                        line_delay=args.line_delay, command_latency=args.latency,
+                        show_banner=not args.no_show_banner).start()
+    print(f"Mock IOS device on {dev.host}:{dev.port} (admin/cisco, Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        dev.stop()
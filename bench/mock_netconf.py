@@ -0,0 +1,427 @@
+"""
+NETCONF-over-SSH device จำลอง (paramiko subsystem "netconf") สำหรับ benchmark netconf_final
+datastore อยู่ใน memory รองรับเท่าที่ netconf_final ใช้:
+  - hello base:1.0 (framing ]]>]]>) และ base:1.1 (chunked) ถ้า client รองรับ
+  - get-config + subtree filter: native/hostname, native/interface/Loopback[name],
+    ietf-interfaces:interfaces/interface[name]
+  - edit-config (merge / nc:operation="delete" ที่ Loopback หรือ shutdown)
+    ลบของที่ไม่มี => rpc-error data-missing
+  - close-session, lock/unlock
+  - candidate=True: เพิ่ม :candidate/:validate (edit target candidate, validate, commit, discard-changes)
+ตั้งค่าได้: latency ต่อ RPC (วินาที)
+
+รันเดี่ยว: python -m bench.mock_netconf --port 8830 --latency 0.01
+"""
+import argparse
+import copy
+import threading
+import time
+
+import paramiko
+from lxml import etree
+
+from bench.ssh_server import MockSSHServer, close_channel
+
+NC = "urn:ietf:params:xml:ns:netconf:base:1.0"
+NATIVE = "http://cisco.com/ns/yang/Cisco-IOS-XE-native"
+IETF_IF = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+IANA_IFT = "urn:ietf:params:xml:ns:yang:iana-if-type"
+
+BASE_10 = "urn:ietf:params:netconf:base:1.0"
+BASE_11 = "urn:ietf:params:netconf:base:1.1"
+
+_EOM = b"]]>]]>"
+
+
+def _q(ns, tag):
+    return f"{{{ns}}}{tag}"
+
+
+class RpcError(Exception):
+    def __init__(self, tag, message, error_type="application"):
+        super().__init__(message)
+        self.tag = tag
+        self.error_type = error_type
+
+
+# ------------------------------
+# Datastore
+# ------------------------------
+class NetconfDatastore:
+    """
+    loopbacks: {num(int): {"description", "address", "mask", "shutdown"}}
+    running กับ candidate แยกกัน (candidate ใช้เมื่อเปิด :candidate)
+    """
+
+    def __init__(self, hostname="CSR1kv-mock"):
+        self.hostname = hostname
+        self.running = {}
+        self.candidate = {}
+        self.lock = threading.Lock()
+
+    def store(self, name):
+        if name == "running":
+            return self.running
+        if name == "candidate":
+            return self.candidate
+        raise RpcError("invalid-value", f"unknown datastore {name}", "protocol")
+
+    # ---------- get-config ----------
+    def render(self, source, filt):
+        """คืน <data> ตาม subtree filter (filt=None => ทั้งหมด)"""
+        with self.lock:
+            loops = copy.deepcopy(self.store(source))
+        data = etree.Element(_q(NC, "data"), nsmap={None: NC})
+        native_f = ietf_f = None
+        if filt is None:
+            native_f = ietf_f = True
+        else:
+            native_f = filt.find(_q(NATIVE, "native"))
+            ietf_f = filt.find(_q(IETF_IF, "interfaces"))
+
+        if native_f is not None:
+            self._render_native(data, loops, native_f)
+        if ietf_f is not None:
+            self._render_ietf(data, loops, ietf_f)
+        return data
+
+    def _render_native(self, data, loops, filt):
+        want_host = want_if = True
+        loop_f = None
+        if filt is not True:
+            want_host = filt.find(_q(NATIVE, "hostname")) is not None
+            if_f = filt.find(_q(NATIVE, "interface"))
+            want_if = if_f is not None
+            loop_f = if_f.find(_q(NATIVE, "Loopback")) if want_if else None
+            if want_if and loop_f is None and len(if_f):
+                want_if = False  # ขอ interface ชนิดอื่นที่ mock ไม่มี
+        native = etree.SubElement(data, _q(NATIVE, "native"), nsmap={None: NATIVE})
+        if want_host:
+            etree.SubElement(native, _q(NATIVE, "hostname")).text = self.hostname
+        if not want_if:
+            return
+
+        name_match = None
+        selected = None  # None => ส่งทั้ง entry
+        if loop_f is not None:
+            name_el = loop_f.find(_q(NATIVE, "name"))
+            if name_el is not None and (name_el.text or "").strip():
+                name_match = name_el.text.strip()
+            kids = [etree.QName(c).localname for c in loop_f if etree.QName(c).localname != "name"]
+            selected = set(kids) or None
+
+        iface = None
+        for num in sorted(loops):
+            if name_match is not None and str(num) != name_match:
+                continue
+            if iface is None:
+                iface = etree.SubElement(native, _q(NATIVE, "interface"))
+            entry = loops[num]
+            lb = etree.SubElement(iface, _q(NATIVE, "Loopback"))
+            etree.SubElement(lb, _q(NATIVE, "name")).text = str(num)
+            if (selected is None or "description" in selected) and entry.get("description"):
+                etree.SubElement(lb, _q(NATIVE, "description")).text = entry["description"]
+            if (selected is None or "ip" in selected) and entry.get("address"):
+                ip = etree.SubElement(lb, _q(NATIVE, "ip"))
+                primary = etree.SubElement(etree.SubElement(ip, _q(NATIVE, "address")), _q(NATIVE, "primary"))
+                etree.SubElement(primary, _q(NATIVE, "address")).text = entry["address"]
+                etree.SubElement(primary, _q(NATIVE, "mask")).text = entry.get("mask") or ""
+            if (selected is None or "shutdown" in selected) and entry.get("shutdown"):
+                etree.SubElement(lb, _q(NATIVE, "shutdown"))
+
+    def _render_ietf(self, data, loops, filt):
+        name_match = None
+        if filt is not True:
+            if_f = filt.find(_q(IETF_IF, "interface"))
+            name_el = if_f.find(_q(IETF_IF, "name")) if if_f is not None else None
+            if name_el is not None and (name_el.text or "").strip():
+                name_match = name_el.text.strip()
+        root = etree.SubElement(data, _q(IETF_IF, "interfaces"), nsmap={None: IETF_IF})
+        for num in sorted(loops):
+            name = f"Loopback{num}"
+            if name_match is not None and name != name_match:
+                continue
+            entry = loops[num]
+            itf = etree.SubElement(root, _q(IETF_IF, "interface"))
+            etree.SubElement(itf, _q(IETF_IF, "name")).text = name
+            etree.SubElement(itf, _q(IETF_IF, "type"), nsmap={"ianaift": IANA_IFT}).text = "ianaift:softwareLoopback"
+            etree.SubElement(itf, _q(IETF_IF, "enabled")).text = "false" if entry.get("shutdown") else "true"
+
+    # ---------- edit-config ----------
+    def edit(self, target, config, default_operation="merge"):
+        """apply ทั้งก้อน หรือไม่ apply เลย (ทำบนสำเนาแล้วค่อยสลับ)"""
+        with self.lock:
+            work = copy.deepcopy(self.store(target))
+            for native in config.findall(_q(NATIVE, "native")):
+                for iface in native.findall(_q(NATIVE, "interface")):
+                    for lb in iface.findall(_q(NATIVE, "Loopback")):
+                        self._edit_native_loopback(work, lb, default_operation)
+            for interfaces in config.findall(_q(IETF_IF, "interfaces")):
+                for itf in interfaces.findall(_q(IETF_IF, "interface")):
+                    self._edit_ietf_interface(work, itf, default_operation)
+            if target == "running":
+                self.running = work
+            else:
+                self.candidate = work
+
+    @staticmethod
+    def _operation(el, inherited):
+        return el.get(_q(NC, "operation"), inherited)
+
+    def _edit_native_loopback(self, work, lb, default_op):
+        name_el = lb.find(_q(NATIVE, "name"))
+        try:
+            num = int((name_el.text or "").strip())
+        except (AttributeError, ValueError):
+            raise RpcError("missing-element", "Loopback/name is required")
+        op = self._operation(lb, default_op)
+        if op in ("delete", "remove"):
+            if num not in work and op == "delete":
+                raise RpcError("data-missing", f"Loopback{num} does not exist")
+            work.pop(num, None)
+            return
+        if op == "create" and num in work:
+            raise RpcError("data-exists", f"Loopback{num} already exists")
+        entry = work.setdefault(num, {"description": None, "address": None, "mask": None, "shutdown": False})
+
+        desc = lb.find(_q(NATIVE, "description"))
+        if desc is not None:
+            entry["description"] = (desc.text or "").strip()
+        primary = lb.find(f"{_q(NATIVE, 'ip')}/{_q(NATIVE, 'address')}/{_q(NATIVE, 'primary')}")
+        if primary is not None:
+            entry["address"] = (primary.findtext(_q(NATIVE, "address")) or "").strip()
+            entry["mask"] = (primary.findtext(_q(NATIVE, "mask")) or "").strip()
+        shut = lb.find(_q(NATIVE, "shutdown"))
+        if shut is not None:
+            shut_op = self._operation(shut, op)
+            if shut_op in ("delete", "remove"):
+                if not entry["shutdown"] and shut_op == "delete":
+                    raise RpcError("data-missing", f"Loopback{num}/shutdown does not exist")
+                entry["shutdown"] = False
+            else:
+                entry["shutdown"] = True
+
+    def _edit_ietf_interface(self, work, itf, default_op):
+        name = (itf.findtext(_q(IETF_IF, "name")) or "").strip()
+        if not name.lower().startswith("loopback") or not name[len("Loopback"):].isdigit():
+            raise RpcError("invalid-value", f"unsupported interface {name!r}")
+        num = int(name[len("Loopback"):])
+        op = self._operation(itf, default_op)
+        if op in ("delete", "remove"):
+            if num not in work and op == "delete":
+                raise RpcError("data-missing", f"{name} does not exist")
+            work.pop(num, None)
+            return
+        entry = work.setdefault(num, {"description": None, "address": None, "mask": None, "shutdown": False})
+        desc = itf.findtext(_q(IETF_IF, "description"))
+        if desc is not None:
+            entry["description"] = desc.strip()
+        enabled = itf.findtext(_q(IETF_IF, "enabled"))
+        if enabled is not None:
+            entry["shutdown"] = enabled.strip().lower() != "true"
+
+
+# ------------------------------
+# Framing (RFC 6242)
+# ------------------------------
+class _Framer:
+    def __init__(self, channel):
+        self.channel = channel
+        self.buf = b""
+        self.chunked = False
+
+    def _fill(self):
+        data = self.channel.recv(65536)
+        if not data:
+            raise EOFError("client closed the channel")
+        self.buf += data
+
+    def read(self) -> bytes:
+        if not self.chunked:
+            while _EOM not in self.buf:
+                self._fill()
+            msg, _, self.buf = self.buf.partition(_EOM)
+            return msg
+
+        parts = []
+        while True:
+            while len(self.buf) < 4:
+                self._fill()
+            if not self.buf.startswith(b"\n#"):
+                raise RpcError("malformed-message", "bad chunk header", "rpc")
+            if self.buf[2:4] == b"#\n":
+                self.buf = self.buf[4:]
+                return b"".join(parts)
+            while b"\n" not in self.buf[2:]:
+                self._fill()
+            end = self.buf.index(b"\n", 2)
+            size = int(self.buf[2:end])
+            while len(self.buf) < end + 1 + size:
+                self._fill()
+            parts.append(self.buf[end + 1:end + 1 + size])
+            self.buf = self.buf[end + 1 + size:]
+
+    def send(self, data: bytes):
+        if self.chunked:
+            self.channel.sendall(b"\n#%d\n%s\n##\n" % (len(data), data))
+        else:
+            self.channel.sendall(data + _EOM)
+
+
+# ------------------------------
+# Subsystem (1 ตัวต่อ SSH session)
+# ------------------------------
+class NetconfSubsystem(paramiko.SubsystemHandler):
+
+    def __init__(self, channel, name, server, device):
+        super().__init__(channel, name, server)
+        self.device = device
+
+    def start_subsystem(self, name, transport, channel):
+        device = self.device
+        framer = _Framer(channel)
+        try:
+            framer.send(device.hello())
+            client_hello = etree.fromstring(framer.read())
+            caps = {c.text.strip() for c in client_hello.iter(_q(NC, "capability")) if c.text}
+            framer.chunked = device.base11 and BASE_11 in caps
+
+            while True:
+                raw = framer.read()
+                reply, close = device.handle_rpc(raw)
+                framer.send(reply)
+                if close:
+                    return
+        except (EOFError, OSError, paramiko.SSHException):
+            return
+        finally:
+            close_channel(channel)
+
+
+class MockNetconfDevice(MockSSHServer):
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, base11=True,
+                 candidate=False, username="admin", password="cisco"):
+        super().__init__(host, port, username, password)
+        self.latency = latency
+        self.base11 = base11
+        self.candidate = candidate
+        self.datastore = NetconfDatastore()
+        self.rpcs = 0  # จำนวน RPC ที่รับ (ไม่นับ hello)
+        self._session_ids = 0
+        self._count_lock = threading.Lock()
+
+    def configure_transport(self, transport):
+        transport.set_subsystem_handler("netconf", NetconfSubsystem, self)
+
+    # ---------- protocol ----------
+    def capabilities(self):
+        caps = [BASE_10]
+        if self.base11:
+            caps.append(BASE_11)
+        if self.candidate:
+            caps += ["urn:ietf:params:netconf:capability:candidate:1.0",
+                     "urn:ietf:params:netconf:capability:validate:1.1"]
+        caps += [f"{NATIVE}?module=Cisco-IOS-XE-native&revision=2019-11-01",
+                 f"{IETF_IF}?module=ietf-interfaces&revision=2014-05-08"]
+        return caps
+
+    def hello(self) -> bytes:
+        with self._count_lock:
+            self._session_ids += 1
+            sid = self._session_ids
+        hello = etree.Element(_q(NC, "hello"), nsmap={None: NC})
+        caps = etree.SubElement(hello, _q(NC, "capabilities"))
+        for c in self.capabilities():
+            etree.SubElement(caps, _q(NC, "capability")).text = c
+        etree.SubElement(hello, _q(NC, "session-id")).text = str(sid)
+        return etree.tostring(hello, xml_declaration=True, encoding="UTF-8")
+
+    def handle_rpc(self, raw):
+        """คืนค่า (reply bytes, ปิด session หรือไม่)"""
+        with self._count_lock:
+            self.rpcs += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        rpc = etree.fromstring(raw)
+        reply = etree.Element(_q(NC, "rpc-reply"), nsmap={None: NC})
+        for k, v in rpc.attrib.items():
+            reply.set(k, v)  # message-id (และ attribute อื่น) ต้องสะท้อนกลับ
+        op = rpc[0] if len(rpc) else None
+        close = False
+        try:
+            if op is None:
+                raise RpcError("missing-element", "empty rpc", "rpc")
+            name = etree.QName(op).localname
+            if name == "get-config":
+                source = self._datastore_name(op, "source")
+                filt = op.find(_q(NC, "filter"))
+                reply.append(self.datastore.render(source, filt))
+            elif name == "edit-config":
+                target = self._datastore_name(op, "target")
+                # ncclient ส่ง <config> แบบไม่มี namespace มาตามที่ผู้เรียกเขียน
+                config = op.find(_q(NC, "config"))
+                if config is None:
+                    config = op.find("config")
+                if config is None:
+                    raise RpcError("missing-element", "edit-config/config is required", "protocol")
+                default_op = (op.findtext(_q(NC, "default-operation")) or "merge").strip()
+                self.datastore.edit(target, config, default_op)
+                etree.SubElement(reply, _q(NC, "ok"))
+            elif name in ("lock", "unlock"):
+                self._datastore_name(op, "target")
+                etree.SubElement(reply, _q(NC, "ok"))
+            elif name == "validate" and self.candidate:
+                etree.SubElement(reply, _q(NC, "ok"))
+            elif name == "commit" and self.candidate:
+                with self.datastore.lock:
+                    self.datastore.running = copy.deepcopy(self.datastore.candidate)
+                etree.SubElement(reply, _q(NC, "ok"))
+            elif name == "discard-changes" and self.candidate:
+                with self.datastore.lock:
+                    self.datastore.candidate = copy.deepcopy(self.datastore.running)
+                etree.SubElement(reply, _q(NC, "ok"))
+            elif name == "close-session":
+                etree.SubElement(reply, _q(NC, "ok"))
+                close = True
+            else:
+                raise RpcError("operation-not-supported", f"{name} is not supported", "protocol")
+        except RpcError as e:
+            for child in list(reply):
+                reply.remove(child)
+            err = etree.SubElement(reply, _q(NC, "rpc-error"))
+            etree.SubElement(err, _q(NC, "error-type")).text = e.error_type
+            etree.SubElement(err, _q(NC, "error-tag")).text = e.tag
+            etree.SubElement(err, _q(NC, "error-severity")).text = "error"
+            etree.SubElement(err, _q(NC, "error-message")).text = str(e)
+        return etree.tostring(reply, xml_declaration=True, encoding="UTF-8"), close
+
+    def _datastore_name(self, op, which):
+        holder = op.find(_q(NC, which))
+        if holder is None or not len(holder):
+            raise RpcError("missing-element", f"{which} is required", "protocol")
+        name = etree.QName(holder[0]).localname
+        if name == "candidate" and not self.candidate:
+            raise RpcError("operation-not-supported", "candidate datastore is not enabled", "protocol")
+        if name not in ("running", "candidate"):
+            raise RpcError("invalid-value", f"unknown datastore {name}", "protocol")
+        return name
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mock NETCONF-over-SSH device (Loopback / ietf-interfaces)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8830)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds per RPC")
+    ap.add_argument("--base10", action="store_true", help="advertise base:1.0 only (]]>]]> framing)")
+    ap.add_argument("--candidate", action="store_true", help="enable :candidate / :validate")
+    args = ap.parse_args()
+    dev = MockNetconfDevice(args.host, args.port, args.latency,
+                            base11=not args.base10, candidate=args.candidate).start()
+    print(f"Mock NETCONF device on {dev.host}:{dev.port} (admin/cisco, Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        dev.stop()
@@ -0,0 +1,214 @@
+"""
+RESTCONF device จำลอง (HTTPS, self-signed) สำหรับ benchmark restconf_final
+ทำตัวเหมือน resource ietf-interfaces ที่ _if_res_path / _interfaces_collection ใช้:
+  GET    .../ietf-interfaces:interfaces/interface=<name>            200 | 404
+  PUT    .../interface=<name>                                      201 | 204
+  POST   .../ietf-interfaces:interfaces                            201 | 409
+  PATCH  .../interface=<name>   (If-Match: * => 412 ถ้าไม่มี)        204 | 404
+  PUT    .../interface=<name>/enabled                              204 | 404
+  DELETE .../interface=<name>                                      204 | 404
+ตั้งค่าได้: latency ต่อ request (วินาที) และ error_rate (ตอบ 500 แบบสุ่ม)
+
+รันเดี่ยว: python -m bench.mock_restconf --port 8443 --latency 0.02
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import ssl
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+_PREFIX = "/restconf/data/ietf-interfaces:interfaces"
+
+
+def _self_signed_cert(tmpdir):
+    """สร้าง cert/key ชั่วคราวด้วย cryptography (มีใน requirements.txt แล้ว)"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "mock-restconf")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=7))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(tmpdir, "cert.pem")
+    key_path = os.path.join(tmpdir, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM,
+                                  serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class MockRestconfDevice:
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.interfaces = {}  # name -> ietf-interfaces:interface dict
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._rand = random.Random(seed)
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        """ใช้แทน router_ip ตอนเรียก restconf_final (เช่น 127.0.0.1:8443)"""
+        return f"{self.host}:{self.port}"
+
+    # ---------- logic ของ datastore ----------
+    def handle(self, method, path, headers, body):
+        """คืนค่า (status, dict|None)"""
+        with self._lock:
+            self.requests += 1
+            fail = self.error_rate and self._rand.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 500, {"errors": {"error": [{"error-tag": "operation-failed"}]}}
+        if not path.startswith(_PREFIX):
+            return 404, None
+
+        rest = path[len(_PREFIX):]
+        leaf = None
+        name = None
+        if rest.startswith("/interface="):
+            name = unquote(rest[len("/interface="):])
+            if "/" in name:
+                name, leaf = name.split("/", 1)
+        elif rest not in ("", "/"):
+            return 404, None
+
+        with self._lock:
+            iface = self.interfaces.get(name) if name else None
+
+            if name is None:
+                if method == "POST":
+                    new = (body or {}).get("ietf-interfaces:interface") or {}
+                    if not new.get("name"):
+                        return 400, None
+                    if new["name"] in self.interfaces:
+                        return 409, {"errors": {"error": [{"error-tag": "data-exists"}]}}
+                    self.interfaces[new["name"]] = dict(new)
+                    return 201, None
+                if method == "GET":
+                    return 200, {"ietf-interfaces:interfaces": {"interface": list(self.interfaces.values())}}
+                return 405, None
+
+            if leaf == "enabled":
+                if method != "PUT":
+                    return 405, None
+                if iface is None:
+                    return 404, None
+                iface["enabled"] = bool((body or {}).get("ietf-interfaces:enabled"))
+                return 204, None
+            if leaf:
+                return 404, None
+
+            if method == "GET":
+                if iface is None:
+                    return 404, None
+                return 200, {"ietf-interfaces:interface": iface}
+            if method == "PUT":
+                new = (body or {}).get("ietf-interfaces:interface") or {}
+                created = iface is None
+                self.interfaces[name] = dict(new, name=name)
+                return (201 if created else 204), None
+            if method == "PATCH":
+                if iface is None:
+                    return (412 if headers.get("If-Match") == "*" else 404), None
+                iface.update((body or {}).get("ietf-interfaces:interface") or {})
+                return 204, None
+            if method == "DELETE":
+                if iface is None:
+                    return 404, None
+                del self.interfaces[name]
+                return 204, None
+            return 405, None
+
+    # ---------- HTTPS server ----------
+    def start(self):
+        device = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive เหมือนอุปกรณ์จริง
+            # header+body ออกไปใน write เดียว ไม่งั้นโดน Nagle/delayed ACK (~40 ms) ปนตัวเลข
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+                status, payload = device.handle(self.command, self.path, self.headers, body)
+                data = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                if data:
+                    self.send_header("Content-Type", "application/yang-data+json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if data:
+                    self.wfile.write(data)
+
+            do_GET = do_PUT = do_POST = do_PATCH = do_DELETE = _serve
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._tmpdir = tempfile.mkdtemp(prefix="mock_restconf_")
+        cert_path, key_path = _self_signed_cert(self._tmpdir)
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cert_path, key_path)
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.socket = ctx.wrap_socket(self._server.socket, server_side=True)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="mock-restconf", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mock RESTCONF device (ietf-interfaces)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8443)
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    dev = MockRestconfDevice(args.host, args.port, args.latency, args.error_rate).start()
+    print(f"Mock RESTCONF device on https://{dev.address}{_PREFIX}  (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        dev.stop()
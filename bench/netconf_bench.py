@@ -0,0 +1,142 @@
+"""
+Benchmark netconf_final กับ NETCONF device จำลองในเครื่อง (ไม่ต้องมี CSR1KV)
+
+แยกต้นทุน 2 ส่วนออกจากกัน:
+  - session setup: TCP + SSH handshake + auth + hello (manager.connect -> close_session)
+  - per-RPC: เวลาของแต่ละ entry point เมื่อมี session ค้างอยู่ใน pool แล้ว (warm)
+เทียบกับ cold = ทิ้ง session ใน pool ก่อนทุก call (เหมือนการต่อใหม่ทุกคำสั่ง)
+ส่วนต่าง cold - warm คือ overhead ของ handshake ต่อ 1 คำสั่ง
+
+หมายเหตุ: ncclient (0.7) ส่งข้อความในคิวเฉพาะตอนครบรอบ select(timeout=TICK=0.1s)
+ของ thread session => แม้ --latency 0 แต่ละ RPC ก็ยังกินได้ถึง ~100 ms ฝั่ง client
+
+bulk: สร้างแล้วลบ Loopback --bulk ตัวบน router เดียวพร้อมกัน (create_interface_async ฯลฯ)
+=> edit ที่มาพร้อมกันถูกรวมเป็น batch (--candidate: mock มี :candidate => validate/commit ครั้งเดียว)
+จำนวน RPC ควรโตตามจำนวน batch ไม่ใช่จำนวน edit
+
+ใช้: python -m bench.netconf_bench --iterations 50 --latency 0.005 --bulk 100 --candidate
+"""
+import argparse
+import asyncio
+import time
+
+import async_loop
+import netconf_final
+from bench.mock_netconf import MockNetconfDevice
+from bench.stats import percentile, print_table, summarize, timed
+from state_cache import interface_cache
+
+OPS = ("create_interface", "get_interface_status", "set_interface_state(False)",
+       "set_interface_state(True)", "delete_interface")
+
+
+def _steps(router, student_id):
+    name = f"Loopback{student_id}"
+    return (
+        ("create_interface", lambda: netconf_final.create_interface(router, student_id)),
+        # use_cache=False => วัดเส้นทางที่ยิง get-config ไปที่อุปกรณ์จริง
+        ("get_interface_status", lambda: netconf_final.get_interface_status(router, name, use_cache=False)),
+        ("set_interface_state(False)", lambda: netconf_final.set_interface_state(router, student_id, False)),
+        ("set_interface_state(True)", lambda: netconf_final.set_interface_state(router, student_id, True)),
+        ("delete_interface", lambda: netconf_final.delete_interface(router, student_id)),
+    )
+
+
+def measure_setup(router, iterations):
+    """เวลาเปิด session อย่างเดียว (ไม่มี RPC ของงานจริง)"""
+    connect, close = [], []
+    for _ in range(iterations):
+        dt, conn = timed(netconf_final.get_netconf_connection, router)
+        if conn is None:
+            raise SystemExit("cannot connect to mock device")
+        connect.append(dt)
+        dt, _ = timed(conn.close_session)
+        close.append(dt)
+    return [summarize("connect (ssh + auth + hello)", connect),
+            summarize("close-session", close)]
+
+
+def run_cycles(router, iterations, cold):
+    lat = {}
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        for op, fn in _steps(router, f"6607{i % 1000:04d}"):
+            if cold:
+                # เหมือนโค้ดก่อนมี pool: ทุกคำสั่งต้องต่อ session ใหม่
+                netconf_final._pool.discard(router)
+            # ล้าง cache ก่อนทุก op => ทุก op ต้องคุยกับอุปกรณ์จริง
+            interface_cache.invalidate(router)
+            dt, _ = timed(fn)
+            lat.setdefault(op, []).append(dt)
+    return lat, time.perf_counter() - t0
+
+
+def run_bulk(router, n):
+    sids = [f"6608{i:04d}" for i in range(n)]
+
+    async def _all(fn):
+        return await asyncio.gather(*[fn(router, sid) for sid in sids])
+
+    rows = []
+    for op, fn in (("bulk create_interface", netconf_final.create_interface_async),
+                   ("bulk delete_interface", netconf_final.delete_interface_async)):
+        interface_cache.invalidate(router)
+        dt, results = timed(async_loop.run, _all(fn))
+        failed = [r for r in results if "successfully" not in r]
+        if failed:
+            raise SystemExit(f"{op} failed: {failed[0]}")
+        rows.append(summarize(op, [dt], dt))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=30, help="create..delete cycles per mode")
+    ap.add_argument("--latency", type=float, default=0.0, help="mock device latency per RPC (s)")
+    ap.add_argument("--base10", action="store_true", help="mock advertises base:1.0 only (]]>]]> framing)")
+    ap.add_argument("--bulk", type=int, default=0, help="concurrent edits on one router (0 = skip)")
+    ap.add_argument("--candidate", action="store_true", help="mock advertises :candidate / :validate")
+    args = ap.parse_args()
+
+    device = MockNetconfDevice(latency=args.latency, base11=not args.base10, candidate=args.candidate).start()
+    netconf_final.ROUTER_PORT = device.port
+    router = device.host
+    framing = "base:1.0 ]]>]]>" if args.base10 else "base:1.1 chunked"
+    print(f"mock device {router}:{device.port}  latency={args.latency * 1000:.1f} ms/RPC  framing={framing}")
+
+    try:
+        # warm-up: host key / import / JIT ของ paramiko ไม่ให้ปนกับตัวเลข
+        for _, fn in _steps(router, "66079999"):
+            fn()
+        netconf_final._pool.close_all()
+
+        print_table(f"session setup ({args.iterations} sessions)", measure_setup(router, args.iterations))
+
+        results = {}
+        for mode, cold in (("cold", True), ("warm", False)):
+            logins, rpcs = device.connections, device.rpcs
+            lat, _ = run_cycles(router, args.iterations, cold)
+            results[mode] = lat
+            print_table(f"{mode}: {'new session per call' if cold else 'pooled session'} "
+                        f"({device.connections - logins} ssh logins, {device.rpcs - rpcs} RPCs)",
+                        [summarize(op, lat.get(op, [])) for op in OPS])
+            netconf_final._pool.close_all()
+
+        print("\n== handshake overhead per call (cold p50 - warm p50) ==")
+        for op in OPS:
+            cold_p50 = percentile(results["cold"].get(op, []), 50) * 1000
+            warm_p50 = percentile(results["warm"].get(op, []), 50) * 1000
+            print(f"{op:<34}{cold_p50 - warm_p50:>10.2f} ms")
+
+        if args.bulk:
+            rpcs = device.rpcs
+            rows = run_bulk(router, args.bulk)
+            print_table(f"bulk: {args.bulk} creates + {args.bulk} deletes on one router "
+                        f"({device.rpcs - rpcs} RPCs)", rows)
+    finally:
+        async_loop.stop()  # ปิด session ที่เหลือใน pool ด้วย
+        device.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark netmiko_final.read_motd กับ IOS จำลองในเครื่อง (ไม่ต้องมี router จริง)
+
+เทียบ:
+  - settings: fast_cli / global_delay_factor (ตั้งผ่าน netmiko_final.DEVICE_SETTINGS)
+  - path: show banner motd  vs  fallback show running-config (ยาว --config-lines บรรทัด)
+  - reuse: cold (disconnect ก่อนทุก call => SSH login ใหม่) vs warm (channel ค้างใน _manager)
+แต่ละแถวแยกเวลาเป็น
+  device ms  = เวลาที่อุปกรณ์จำลองใช้สร้าง output จริง (latency + line delay)
+  pacing ms  = ส่วนที่เหลือ (SSH, sleep/poll ของ Netmiko, health check ก่อนใช้ channel ซ้ำ)
+
+ใช้: python -m bench.netmiko_bench --iterations 10 --config-lines 2000 --line-delay 0.0002
+"""
+import argparse
+import time
+
+import netmiko_final
+from bench.mock_ios import MockIosDevice
+from bench.stats import percentile, timed
+from state_cache import running_config_cache
+
+SETTINGS = (
+    ("fast_cli=True  gdf=1", {"fast_cli": True, "global_delay_factor": 1}),
+    ("fast_cli=False gdf=1", {"fast_cli": False, "global_delay_factor": 1}),
+    ("fast_cli=False gdf=2", {"fast_cli": False, "global_delay_factor": 2}),
+)
+
+
+def _measure(device, ip, iterations, cold):
+    lat = []
+    device_before = device.device_time
+    for _ in range(iterations):
+        if cold:
+            netmiko_final._manager.disconnect(ip)
+        # วัดทางที่คุยกับอุปกรณ์จริง ไม่ใช่ snapshot ใน memory
+        running_config_cache.invalidate(ip)
+        dt, result = timed(netmiko_final.read_motd, ip)
+        if result.startswith("Error:") and result != "Error: No MOTD Configured":
+            raise SystemExit(f"read_motd failed: {result}")
+        lat.append(dt)
+    return lat, (device.device_time - device_before) / max(iterations, 1)
+
+
+def _measure_send_command(ip, command, iterations):
+    """send_command อย่างเดียวบน channel ที่เปิดค้างไว้ (ไม่มี is_alive/find_prompt นำหน้า)"""
+    lat = []
+    with netmiko_final._manager.session(ip) as (conn, settings, _):
+        for _ in range(iterations):
+            dt, _ = timed(conn.send_command, command, expect_string=r"#|\$",
+                          read_timeout=settings["read_timeout"])
+            lat.append(dt)
+    return lat
+
+
+def _row(name, lat, device_s):
+    p50 = percentile(lat, 50) * 1000
+    device_ms = device_s * 1000
+    print(f"{name:<46}{len(lat):>4}{p50:>10.1f}{percentile(lat, 99) * 1000:>10.1f}"
+          f"{device_ms:>11.1f}{p50 - device_ms:>11.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=5)
+    ap.add_argument("--config-lines", type=int, default=1000, help="size of show running-config")
+    ap.add_argument("--line-delay", type=float, default=0.0, help="mock seconds per output line")
+    ap.add_argument("--latency", type=float, default=0.0, help="mock seconds before each command's output")
+    args = ap.parse_args()
+
+    device = MockIosDevice(config_lines=args.config_lines, line_delay=args.line_delay,
+                           command_latency=args.latency).start()
+    ip = device.host
+    print(f"mock IOS {ip}:{device.port}  config={args.config_lines} lines  "
+          f"line_delay={args.line_delay * 1000:.2f} ms  latency={args.latency * 1000:.1f} ms")
+    print(f"\n{'read_motd':<46}{'n':>4}{'p50 ms':>10}{'p99 ms':>10}{'device ms':>11}{'pacing ms':>11}")
+
+    try:
+        for label, overrides in SETTINGS:
+            netmiko_final.DEVICE_SETTINGS[ip] = dict(overrides, port=device.port)
+            for path, show_banner in (("banner", True), ("showrun", False)):
+                device.show_banner = show_banner
+                netmiko_final.read_motd(ip)  # warm-up + login ให้ warm มี channel รอ
+                for mode, cold in (("cold", True), ("warm", False)):
+                    logins = device.connections
+                    lat, device_s = _measure(device, ip, args.iterations, cold)
+                    _row(f"{label} {path:<7} {mode} ({device.connections - logins} logins)", lat, device_s)
+
+            # running-config snapshot ยังสด => ไม่แตะอุปกรณ์เลย
+            netmiko_final.get_running_config(ip)
+            before = device.device_time
+            lat = [timed(netmiko_final.read_motd, ip)[0] for _ in range(args.iterations)]
+            _row(f"{label} snapshot hit", lat, (device.device_time - before) / args.iterations)
+
+            # ต้นทุน health check ก่อนใช้ channel ซ้ำ = warm read_motd - send_command เปล่า ๆ
+            device.show_banner = True
+            before = device.device_time
+            lat = _measure_send_command(ip, "show banner motd", args.iterations)
+            _row(f"{label} send_command only", lat, (device.device_time - before) / args.iterations)
+            netmiko_final._manager.close_all()
+    finally:
+        netmiko_final._manager.close_all()
+        device.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark restconf_final กับ RESTCONF device จำลองในเครื่อง (ไม่ต้องมี CSR1KV)
+
+วัด p50/p99 latency และ ops/sec ของ
+  get_interface_status, create_interface, delete_interface, set_interface_state
+ทั้งแบบทีละคำสั่ง (sequential) และหลาย thread พร้อมกัน (concurrent)
+
+ใช้: python -m bench.restconf_bench --iterations 200 --concurrency 8 --latency 0.005
+"""
+import argparse
+import time
+
+import async_loop
+import restconf_final
+from bench.mock_restconf import MockRestconfDevice
+from bench.stats import print_table, run_concurrently, summarize, timed
+from state_cache import interface_cache
+
+OPS = ("create_interface", "get_interface_status", "set_interface_state(False)",
+       "set_interface_state(True)", "delete_interface")
+
+
+def _cycle(router, student_id, lat):
+    """1 รอบ = create -> status -> disable -> enable -> delete (วัดทีละ op)"""
+    name = f"Loopback{student_id}"
+    steps = (
+        ("create_interface", lambda: restconf_final.create_interface(router, student_id)),
+        # use_cache=False => วัดเส้นทางที่ยิง GET ไปที่อุปกรณ์จริง
+        ("get_interface_status", lambda: restconf_final.get_interface_status(router, name, use_cache=False)),
+        ("set_interface_state(False)", lambda: restconf_final.set_interface_state(router, student_id, False)),
+        ("set_interface_state(True)", lambda: restconf_final.set_interface_state(router, student_id, True)),
+        ("delete_interface", lambda: restconf_final.delete_interface(router, student_id)),
+    )
+    for op, fn in steps:
+        # ล้าง cache ก่อนทุก op => เทียบกันที่จำนวน round trip ไปอุปกรณ์
+        interface_cache.invalidate(router, name)
+        dt, _ = timed(fn)
+        lat.setdefault(op, []).append(dt)
+
+
+def run_sequential(router, iterations):
+    lat = {}
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        _cycle(router, f"6607{i % 1000:04d}", lat)
+    return lat, time.perf_counter() - t0
+
+
+def run_concurrent(router, iterations, concurrency):
+    per_worker = max(1, iterations // concurrency)
+
+    def worker(w):
+        lat = {}
+        for i in range(per_worker):
+            # interface ของใครของมัน ไม่ชนกันระหว่าง thread
+            _cycle(router, f"{w + 1:02d}{i % 1000:06d}", lat)
+        return lat
+
+    return run_concurrently(worker, concurrency)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, default=100, help="create..delete cycles")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.0, help="mock device latency per request (s)")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--pessimistic", action="store_true",
+                    help="GET before every write (restconf_final.OPTIMISTIC_WRITES=False)")
+    args = ap.parse_args()
+
+    restconf_final.OPTIMISTIC_WRITES = not args.pessimistic
+    # mock ตอบ If-Match: * ตาม RFC => วัดทาง PATCH ได้ (บนอุปกรณ์จริงยังปิดไว้เป็นค่าเริ่มต้น)
+    restconf_final.OPTIMISTIC_STATE_WRITES = not args.pessimistic
+    # เฉพาะ bench: ไม่อ่าน env ของเครื่องที่รัน (HTTP(S)_PROXY ไม่ควรได้ request ไป mock ที่ 127.0.0.1
+    # และ REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE จะทับ verify=False => cert self-signed ของ mock ไม่ผ่าน)
+    # session ของ aiohttp สร้างตอนใช้ครั้งแรก และอ่านค่านี้ตามไปด้วย
+    restconf_final._session.trust_env = False
+    device = MockRestconfDevice(latency=args.latency, error_rate=args.error_rate, seed=1).start()
+    router = device.address
+    mode = "pessimistic" if args.pessimistic else "optimistic"
+    print(f"mock device https://{router}  latency={args.latency * 1000:.1f} ms  "
+          f"error_rate={args.error_rate}  writes={mode}")
+
+    try:
+        # warm-up: TLS handshake / keep-alive ไม่ให้ปนกับตัวเลข
+        _cycle(router, "66079999", {})
+
+        before = device.requests
+        lat, _ = run_sequential(router, args.iterations)
+        print_table(f"sequential ({args.iterations} cycles, {device.requests - before} device requests)",
+                    [summarize(op, lat.get(op, [])) for op in OPS])
+
+        before = device.requests
+        lat, _ = run_concurrent(router, args.iterations, args.concurrency)
+        print_table(f"concurrent x{args.concurrency} ({device.requests - before} device requests)",
+                    [summarize(op, lat.get(op, []), concurrency=args.concurrency) for op in OPS])
+    finally:
+        async_loop.stop()
+        device.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+โครง SSH server (paramiko) ที่ใช้ร่วมกันระหว่าง device จำลองใน bench/
+  - รับ password auth (username/password ตั้งได้)
+  - เปิด session channel ได้ทั้งแบบ subsystem (เช่น netconf) และ shell (CLI)
+คลาสลูก override configure_transport() และ/หรือ handle_shell()
+"""
+import logging
+import socket
+import threading
+
+import paramiko
+
+# log ของ transport ฝั่ง server (เช่น client ปิด socket เอง) ไม่ต้องขึ้นจอระหว่าง benchmark
+_LOG_CHANNEL = "bench.mock_ssh"
+logging.getLogger(_LOG_CHANNEL).addHandler(logging.NullHandler())
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def host_key():
+    """RSA host key ชั่วคราว สร้างครั้งเดียวต่อ process (gen key ช้า)"""
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+def close_channel(channel):
+    """ปิด channel โดยไม่สนว่า client ปิดไปก่อนแล้ว (paramiko จะโยน EOFError)"""
+    try:
+        channel.close()
+    except (EOFError, OSError, paramiko.SSHException):
+        pass
+
+
+class _ServerInterface(paramiko.ServerInterface):
+
+    def __init__(self, server):
+        self.server = server
+        self.shell_requested = threading.Event()
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.server.username and password == self.server.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height,
+                                  pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.shell_requested.set()
+        return self.server.supports_shell
+
+
+class MockSSHServer:
+    supports_shell = False
+
+    def __init__(self, host="127.0.0.1", port=0, username="admin", password="cisco"):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connections = 0  # จำนวน SSH login ทั้งหมด (ใช้ดูว่ามีการต่อใหม่กี่ครั้ง)
+        self._sock = None
+        self._thread = None
+        self._transports = []
+        self._lock = threading.Lock()
+
+    # ---------- hooks ----------
+    def configure_transport(self, transport):
+        """ลงทะเบียน subsystem handler ฯลฯ ก่อน start_server"""
+
+    def handle_shell(self, channel):
+        """รัน CLI บน channel (เรียกใน thread ของ connection นั้น)"""
+
+    # ---------- server ----------
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(64)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop,
+                                        name=f"{type(self).__name__}-accept", daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while self._sock is not None:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_client, args=(client,), daemon=True).start()
+
+    def _serve_client(self, client):
+        client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(client)
+        transport.set_log_channel(_LOG_CHANNEL)
+        transport.add_server_key(host_key())
+        self.configure_transport(transport)
+        iface = _ServerInterface(self)
+        try:
+            transport.start_server(server=iface)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+        with self._lock:
+            self.connections += 1
+            self._transports.append(transport)
+        if not self.supports_shell:
+            return  # subsystem handler ทำงานใน thread ของ paramiko เอง
+
+        # shell: รอ client ขอ channel + shell แล้วค่อยส่งให้ handle_shell
+        while transport.is_active():
+            channel = transport.accept(timeout=1)
+            if channel is None:
+                continue
+            if not iface.shell_requested.wait(timeout=10):
+                close_channel(channel)
+                continue
+            iface.shell_requested.clear()
+            try:
+                self.handle_shell(channel)
+            except (OSError, EOFError, paramiko.SSHException):
+                pass
+            finally:
+                close_channel(channel)
+
+    def stop(self):
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for t in transports:
+            t.close()
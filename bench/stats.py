@@ -0,0 +1,62 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(name, latencies, wall=None, concurrency=1):
+    """
+    latencies เป็นวินาที
+    ops/s: wall = เวลารวมของชุดที่มีแต่ op นี้ (เช่น bulk) ไม่ส่ง => คิดจากเวลาที่ op นี้ใช้เอง
+    = len / (sum(latencies) / concurrency) (concurrency = จำนวน thread ที่ยิง op นี้พร้อมกัน)
+    """
+    if wall is None:
+        busy = sum(latencies) / concurrency
+        ops_per_sec = (len(latencies) / busy) if busy > 0 else 0.0
+    else:
+        ops_per_sec = (len(latencies) / wall) if wall > 0 else 0.0
+    return {
+        "name": name,
+        "n": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.fmean(latencies) * 1000) if latencies else 0.0,
+        "ops_per_sec": ops_per_sec,
+    }
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+def run_concurrently(worker, n_workers):
+    """
+    เรียก worker(i) พร้อมกัน n_workers ตัว แต่ละตัวคืน dict[op] -> list[latency]
+    คืนค่า (dict รวม, wall time)
+    """
+    merged = {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for part in pool.map(worker, range(n_workers)):
+            for op, lat in part.items():
+                merged.setdefault(op, []).extend(lat)
+    return merged, time.perf_counter() - t0
+
+
+def print_table(title, rows):
+    print(f"\n== {title} ==")
+    print(f"{'operation':<34}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'ops/s':>10}")
+    for r in rows:
+        print(f"{r['name']:<34}{r['n']:>6}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['mean_ms']:>10.2f}{r['ops_per_sec']:>10.1f}")
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ไฟล์ checkpoint (append-only, 1 บรรทัด = 1 JSON record)
+CHECKPOINT_FILE = os.getenv("BOT_CHECKPOINT", os.path.join(_BASE_DIR, ".bot_checkpoint.jsonl"))
+# รวม fsync เป็นรอบ ๆ (วินาที): record ถึง OS ทันทีที่เขียน (process crash ไม่หาย)
+# แต่ลงดิสก์จริงทุก ๆ ช่วงนี้ => ไฟดับเสียได้ไม่เกินช่วงนี้
+CHECKPOINT_FSYNC_INTERVAL = float(os.getenv("BOT_CHECKPOINT_FSYNC", "0.2"))
+# record สะสมเกินนี้ => เขียนไฟล์ใหม่ให้เหลือแค่ state ปัจจุบัน
+CHECKPOINT_COMPACT_AFTER = int(os.getenv("BOT_CHECKPOINT_COMPACT", "1000"))
+
+
+class CheckpointState:
+    """
+    state ที่ได้จากการ replay record ทั้งไฟล์
+      last_id / last_created: ข้อความล่าสุดที่บอทรับเข้ามาแล้ว (ให้ poller เริ่มต่อจากตรงนี้)
+      inflight: คำสั่งที่รับแล้วแต่ยังไม่ได้ตอบ {message id: record} เรียงตามลำดับที่รับ
+      values: ค่าอื่นที่ต้องรอด restart เช่น method ที่เลือกไว้ (restconf/netconf)
+    record:
+      {"t": "msg", "id": ..., "created": ISO, "text": ..., "method": ...}
+                                                             text/method มีเฉพาะคำสั่งที่บอทต้องทำ
+                                                             (method = restconf/netconf ที่เลือกไว้ตอนรับคำสั่ง)
+      {"t": "done", "id": ...}                               ตอบคำสั่งนั้นแล้ว
+      {"t": "set", "key": ..., "value": ...}
+    """
+
+    def __init__(self):
+        self.last_id = None
+        self.last_created = None
+        self.inflight = OrderedDict()
+        self.values = {}
+
+    def apply(self, record):
+        kind = record.get("t")
+        if kind == "msg":
+            self.last_id = record["id"]
+            self.last_created = record.get("created")
+            if record.get("text") is not None:
+                self.inflight[record["id"]] = record
+        elif kind == "done":
+            self.inflight.pop(record.get("id"), None)
+        elif kind == "set":
+            self.values[record["key"]] = record.get("value")
+
+    def last_created_datetime(self):
+        if not self.last_created:
+            return None
+        try:
+            return datetime.fromisoformat(self.last_created.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+    def records(self):
+        """record ชุดเล็กที่สุดที่ replay แล้วได้ state เดิม (ใช้ตอน compact)"""
+        out = [{"t": "set", "key": k, "value": v} for k, v in self.values.items()]
+        out += [r for msg_id, r in self.inflight.items() if msg_id != self.last_id]
+        if self.last_id is not None:
+            out.append(self.inflight.get(self.last_id) or
+                       {"t": "msg", "id": self.last_id, "created": self.last_created})
+        return out
+
+
+class CheckpointStore:
+    """
+    checkpoint ของ message loop แบบ append-only + fsync เป็นรอบ
+      - load(): replay ไฟล์ (บรรทัดท้ายที่เขียนไม่จบเพราะ crash จะถูกข้าม) แล้ว compact
+      - message(): บันทึกข้อความที่รับ (command=True => เก็บ text + method ไว้รันซ้ำถ้ายังไม่ได้ตอบ)
+      - done(): บันทึกว่าตอบคำสั่งนั้นแล้ว
+      - thread เบื้องหลัง fsync ทุก fsync_interval และ compact เมื่อ record เยอะ
+    เปิด/เขียนไฟล์ไม่ได้ => พิมพ์เตือนแล้วทำงานแบบ memory อย่างเดียว (เหมือนไม่มี checkpoint)
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE, fsync_interval=CHECKPOINT_FSYNC_INTERVAL,
+                 compact_after=CHECKPOINT_COMPACT_AFTER):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+        self.state = CheckpointState()
+        self._file = None
+        self._records = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self) -> CheckpointState:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        self.state.apply(json.loads(line))
+                    except (ValueError, KeyError, AttributeError):
+                        print(f"[CHECKPOINT] Ignoring damaged record at line {line_no}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[CHECKPOINT] Cannot read {self.path}: {e}")
+        with self._lock:
+            self._compact_locked()
+        if self._file is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="checkpoint-fsync", daemon=True)
+            self._thread.start()
+        return self.state
+
+    def message(self, msg, command=False, method=None):
+        created = getattr(msg, "created", None)
+        record = {"t": "msg", "id": msg.id,
+                  "created": created.isoformat() if hasattr(created, "isoformat") else created}
+        if command:
+            record["text"] = msg.text
+            record["method"] = method
+        self._append(record)
+
+    def done(self, msg_id):
+        if msg_id in self.state.inflight:
+            self._append({"t": "done", "id": msg_id})
+
+    def set(self, key, value):
+        if self.state.values.get(key) != value:
+            self._append({"t": "set", "key": key, "value": value})
+
+    def _append(self, record):
+        with self._lock:
+            self.state.apply(record)
+            if self._file is None:
+                return
+            try:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()  # ถึง OS แล้ว => process ตายก็ไม่หาย
+                self._dirty = True
+                self._records += 1
+            except OSError as e:
+                print(f"[CHECKPOINT] Write failed, continuing without checkpoint: {e}")
+                self._close_locked()
+
+    def sync(self):
+        """fsync record ที่ค้างอยู่ลงดิสก์ (thread เบื้องหลังเรียกเป็นรอบ ๆ)"""
+        with self._lock:
+            if self._file is None or not self._dirty:
+                return
+            try:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+            except OSError as e:
+                print(f"[CHECKPOINT] fsync failed: {e}")
+
+    def compact(self):
+        with self._lock:
+            if self._file is not None:
+                self._compact_locked()
+
+    def _compact_locked(self):
+        """เขียน state ปัจจุบันลงไฟล์ใหม่ (tmp + fsync + rename) แล้วเปิดต่อท้ายไฟล์นั้น"""
+        self._close_locked()
+        records = self.state.records()
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+        except OSError as e:
+            print(f"[CHECKPOINT] Cannot write {self.path}, running without checkpoint: {e}")
+            self._file = None
+            return
+        self._records = len(records)
+        self._dirty = False
+
+    def _close_locked(self):
+        f, self._file = self._file, None
+        if f is None:
+            return
+        try:
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError:
+            pass
+        f.close()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+            if self._records > self.compact_after:
+                self.compact()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._close_locked()
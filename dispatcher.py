@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import tracing
+
+# lane เริ่มต้น: ชื่อ -> จำนวน worker (ลำดับแรก = lane ของงานที่ไม่ระบุ lane)
+DEFAULT_LANES = {"read": 4, "write": 2, "slow": 2}
+
+
+class _Job:
+    __slots__ = ("fn", "future", "reply", "trace", "lane", "submitted", "coalesce", "followers", "closed",
+                 "keys", "blocked")
+
+    def __init__(self, fn, future, reply, trace, lane, coalesce=None):
+        self.fn = fn
+        self.future = future
+        self.reply = reply
+        self.trace = trace
+        self.lane = lane
+        self.submitted = time.perf_counter()
+        self.coalesce = coalesce
+        self.followers = []  # [(future, reply, trace)] ของคำสั่งที่มารอผลของงานนี้
+        self.closed = False  # ได้ผลแล้ว => ไม่รับคนมาร่วมอีก
+        self.keys = ()
+        self.blocked = 0     # จำนวน key ที่งานนี้ยังไม่ได้อยู่หัวคิว (0 = รันได้)
+
+
+class _Lane:
+    """worker pool ของงานประเภทหนึ่ง + ตัวนับสำหรับ metrics (แก้ภายใต้ lock ของ dispatcher)"""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"cmd-{name}")
+        self.queued = 0   # รับแล้ว ยังไม่เริ่ม (รอคิวของ router หรือรอ worker ว่าง)
+        self.running = 0
+
+
+class CommandDispatcher:
+    """
+    รันคำสั่งของบอทแบบขนาน แยก lane ตามต้นทุนของงาน
+      - แต่ละ lane มี worker ของตัวเอง (เช่น read / write / slow)
+        => playbook ที่ใช้เวลาเป็นนาทีกิน worker ได้แค่ใน lane ของมัน คำสั่งอ่านยังมี worker ว่างเสมอ
+      - งานที่ key เดียวกันรันทีละงาน ตามลำดับที่ submit เข้ามา ไม่ว่าอยู่ lane ไหน
+        key = สิ่งที่งานแตะ เช่น (router IP, "loopback") / (router IP, "motd")
+        => คำสั่งแก้สิ่งเดียวกันบน router ตัวเดียวกันไม่มีทางซ้อนกัน และอ่านหลังเขียนเห็นผลที่เขียนเสมอ
+      - งานต่าง key รันพร้อมกันได้ (จำกัดด้วยจำนวน worker ของ lane)
+        => status ของ Loopback ไม่ต้องรอ playbook motd ที่ค้างอยู่บน router เดียวกัน
+      - reply: ของ key เดียวกันส่งตามลำดับที่รับคำสั่ง, ต่าง key ส่งตามลำดับที่เสร็จ
+        (การส่งทุกครั้งถือ lock เดียวกัน ข้อความจึงไม่ทับกัน)
+    งาน (fn) ต้องคืนค่า (msg_type, content) แบบเดียวกับ loop เดิมใน run.py
+    trace (tracing.Trace): ถ้าส่งมา จะ active ตลอดช่วงรันงาน + ส่ง reply แล้ว finish ให้
+    lanes: {ชื่อ: จำนวน worker} ไม่ส่ง => DEFAULT_LANES
+    """
+
+    def __init__(self, on_reply, lanes=None):
+        self._on_reply = on_reply
+        self._lanes = {name: _Lane(name, workers) for name, workers in (lanes or DEFAULT_LANES).items()}
+        self._default_lane = next(iter(self._lanes))
+        self._queues = {}  # key -> deque[_Job] ของงานที่รอ/กำลังรัน (ตัวแรก = กำลังรันหรือรอ worker)
+                           # งานกลุ่ม (submit_group) อยู่ในคิวของทุก key ของมัน
+        self._lock = threading.Lock()
+        self._reply_lock = threading.Lock()
+
+    def submit(self, key, fn, reply=True, trace=None, lane=None, coalesce=None) -> Future:
+        """
+        reply=False: ไม่ส่งผลเข้าห้องเอง (ผู้เรียกเอาผลจาก Future ไปใช้ต่อ)
+        lane: ชื่อ lane ที่งานนี้รัน (ไม่ระบุ => lane แรก)
+        coalesce: key ของคำถามแบบอ่านอย่างเดียว (เช่น ("status", "netconf"))
+          งานท้ายคิวของ key นี้ถามเรื่องเดียวกันและยังไม่เสร็จ => ไม่รันซ้ำ รอผลของงานนั้นแทน
+          (ดูแค่ท้ายคิว: ถ้ามีงานเขียนคั่นอยู่ คำถามใหม่ต้องเห็นผลหลังเขียน จึงรันเอง)
+        """
+        job = _Job(fn, Future(), reply, trace, self._lane(lane), coalesce)
+        with self._lock:
+            queue = self._queues.get(key)
+            if coalesce is not None and queue:
+                tail = queue[-1]
+                if tail.coalesce == coalesce and not tail.closed:
+                    tail.followers.append((job.future, reply, trace))
+                    tracing.registry.inc("bot_coalesced_total", lane=job.lane.name)
+                    return job.future
+            self._enqueue(job, (key,))
+        return job.future
+
+    def submit_group(self, keys, fn, reply=True, trace=None, lane=None) -> Future:
+        """
+        งานเดียวที่แตะหลาย key พร้อมกัน (เช่น playbook เดียวกับ router หลายตัว)
+        เข้าคิวของทุก key แล้วรันเมื่อเป็นหัวคิวของทุก key => ลำดับเทียบกับงานอื่นของแต่ละ key ยังเหมือน submit
+        ใช้ worker ตัวเดียว (ไม่กิน worker ตามจำนวน key แบบ submit_all)
+        """
+        job = _Job(fn, Future(), reply, trace, self._lane(lane))
+        with self._lock:
+            self._enqueue(job, tuple(dict.fromkeys(keys)))
+        return job.future
+
+    def submit_all(self, jobs, combine, trace=None, lane=None, coalesce=None):
+        """
+        Fan-out: jobs = [(key, fn), (key, fn, trace) หรือ (key, fn, trace, coalesce), ...] รันพร้อมกันใน lane เดียวกัน
+        (แต่ละตัวยังเข้าคิวของ key ตัวเอง และรวมกับคำถามเดียวกันได้ตาม coalesce ของตัวเอง
+         ไม่ระบุ => coalesce ที่ส่งมากับ submit_all)
+        key เป็น list => งานนั้นแตะหลาย key (เข้าคิวแบบ submit_group)
+        ไม่ส่ง reply รายตัว — รอครบทุกตัวแล้วเรียก combine(results) ครั้งเดียว
+        results เรียงตามลำดับ jobs, combine ต้องคืนค่า (msg_type, content)
+        trace: ของคำสั่งรวม (จับเวลาตั้งแต่รับคำสั่งจนส่ง reply รวม)
+        คืนค่า Future ที่เสร็จหลังส่ง reply รวมแล้ว (ผลเป็น (msg_type, content) เหมือน submit)
+        """
+        done = Future()
+        done.set_running_or_notify_cancel()
+        results = [None] * len(jobs)
+        remaining = [len(jobs)]
+        done_lock = threading.Lock()
+
+        def _collect(index, fut):
+            results[index] = fut.result()
+            with done_lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            # ช่วงรอทุก router เสร็จ = fan_out (ไม่ใช่ queue_wait)
+            with tracing.activate(trace, first_phase="fan_out"):
+                try:
+                    msg_type, content = combine(results)
+                except Exception as e:
+                    print(f"!!! UNHANDLED ERROR: {e} !!!")
+                    msg_type, content = ('error', f'Internal Bot Error: {e}')
+                self.reply(msg_type, content)
+            if trace is not None:
+                trace.finish(msg_type)
+            done.set_result((msg_type, content))
+
+        for index, (key, fn, *extra) in enumerate(jobs):
+            job_trace = extra[0] if extra else None
+            job_coalesce = extra[1] if len(extra) > 1 else coalesce
+            if isinstance(key, list):
+                fut = self.submit_group(key, fn, reply=False, trace=job_trace, lane=lane)
+            else:
+                fut = self.submit(key, fn, reply=False, trace=job_trace, lane=lane, coalesce=job_coalesce)
+            fut.add_done_callback(lambda f, i=index: _collect(i, f))
+        return done
+
+    def reply(self, msg_type, content):
+        """ส่ง reply ทันที (ใช้กับคำสั่งที่ไม่ต้องแตะอุปกรณ์)"""
+        with self._reply_lock:
+            try:
+                self._on_reply(msg_type, content)
+            except Exception as e:
+                print(f"\n[REPLY ERROR] {e}")
+
+    def _lane(self, name):
+        name = name or self._default_lane
+        lane = self._lanes.get(name)
+        if lane is None:
+            raise ValueError(f"Unknown lane: {name!r}")
+        return lane
+
+    def _enqueue(self, job, keys):
+        """(ถือ self._lock) ต่อท้ายคิวของทุก key; เป็นหัวคิวทุก key แล้ว => ส่งเข้า lane ได้เลย"""
+        job.keys = keys
+        job.lane.queued += 1
+        for key in keys:
+            queue = self._queues.setdefault(key, deque())
+            queue.append(job)
+            if len(queue) > 1:
+                job.blocked += 1
+        if not job.blocked:
+            job.lane.pool.submit(self._run, job)
+
+    def _run(self, job):
+        """รันงาน (เป็นหัวคิวของทุก key แล้ว) ใน worker ของ lane งานนั้น แล้วปล่อยงานถัดไปของแต่ละ key"""
+        with self._lock:
+            lane = job.lane
+            lane.queued -= 1
+            lane.running += 1
+        tracing.registry.observe("bot_lane_wait_seconds", time.perf_counter() - job.submitted, lane=lane.name)
+
+        try:
+            result = None
+            if job.future.set_running_or_notify_cancel():
+                result = self._execute(job.fn, job.trace, job.reply)
+                job.future.set_result(result)
+            with self._lock:
+                job.closed = True
+                followers = job.followers
+            for future, reply, trace in followers:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if result is None:  # งานหลักถูก cancel => คนแรกที่ยังรออยู่รันเอง
+                    result = self._execute(job.fn, trace, reply)
+                else:
+                    self._deliver(result, trace, reply)
+                future.set_result(result)
+        finally:
+            with self._lock:
+                lane.running -= 1
+                for key in job.keys:
+                    queue = self._queues[key]
+                    queue.popleft()
+                    if not queue:
+                        del self._queues[key]
+                        continue
+                    nxt = queue[0]
+                    nxt.blocked -= 1
+                    if not nxt.blocked:
+                        nxt.lane.pool.submit(self._run, nxt)
+
+    def _execute(self, fn, trace, reply):
+        with tracing.activate(trace):
+            try:
+                msg_type, content = fn()
+            except Exception as e:
+                print(f"!!! UNHANDLED ERROR: {e} !!!")
+                msg_type, content = ('error', f'Internal Bot Error: {e}')
+            if reply:
+                self.reply(msg_type, content)
+        if trace is not None:
+            trace.finish(msg_type)
+        return msg_type, content
+
+    def _deliver(self, result, trace, reply):
+        """ส่งผลของงานที่รวมไว้ให้คำสั่งที่มารอ (เวลารอนับเป็น phase "coalesced")"""
+        with tracing.activate(trace, first_phase="coalesced"):
+            if reply:
+                self.reply(*result)
+        if trace is not None:
+            trace.finish(result[0])
+
+    def pending(self) -> int:
+        with self._lock:
+            return len({id(job) for q in self._queues.values() for job in q})
+
+    def lane_stats(self):
+        """{lane: {"workers", "queued", "running"}} สำหรับ metrics / log"""
+        with self._lock:
+            return {lane.name: {"workers": lane.workers, "queued": lane.queued, "running": lane.running}
+                    for lane in self._lanes.values()}
+
+    def shutdown(self, wait=True):
+        for lane in self._lanes.values():
+            lane.pool.shutdown(wait=wait)
@@ -0,0 +1,285 @@
+import csv
+import os
+import threading
+import time
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ไฟล์ inventory: INI แบบ Ansible (ค่าเริ่มต้น = hosts ของ playbook), .yaml/.yml หรือ .csv
+INVENTORY_FILE = os.getenv("BOT_INVENTORY", os.path.join(_BASE_DIR, "hosts"))
+# เช็ก mtime ของไฟล์ไม่ถี่กว่านี้ (วินาที) — แก้ไฟล์แล้วบอทเห็นเองโดยไม่ต้อง restart
+INVENTORY_RELOAD_INTERVAL = float(os.getenv("BOT_INVENTORY_RELOAD", "2"))
+
+
+class InventoryError(Exception):
+    """อ่าน/parse ไฟล์ inventory ไม่ได้"""
+
+
+class Device:
+    """
+    router 1 ตัวใน inventory
+      name: ชื่อ (inventory_hostname), ip: ansible_host (ไม่มี => ใช้ name)
+      groups: กลุ่มทั้งหมดที่อยู่ (รวมกลุ่มแม่จาก :children)
+      vars: ตัวแปรหลังรวม group vars + host vars แล้ว เช่น ansible_user, ansible_port, bot_method
+    """
+
+    __slots__ = ("name", "ip", "groups", "vars")
+
+    def __init__(self, name, ip, groups=(), host_vars=None):
+        self.name = name
+        self.ip = ip
+        self.groups = tuple(groups)
+        self.vars = dict(host_vars or {})
+
+    def get(self, key, default=None):
+        return self.vars.get(key, default)
+
+    @property
+    def username(self):
+        return self.vars.get("ansible_user")
+
+    @property
+    def password(self):
+        return self.vars.get("ansible_password")
+
+    @property
+    def method(self):
+        """restconf / netconf ที่อยากให้ใช้กับเครื่องนี้ (bot_method) ไม่ระบุ => None"""
+        return self.vars.get("bot_method")
+
+    def settings(self, prefix):
+        """
+        ตัวแปรที่ขึ้นต้นด้วย prefix โดยตัด prefix ออก
+        เช่น settings("netmiko_") จาก netmiko_fast_cli=false => {"fast_cli": False}
+        """
+        return {k[len(prefix):]: v for k, v in self.vars.items() if k.startswith(prefix)}
+
+    def __repr__(self):
+        return f"Device({self.name!r}, {self.ip!r})"
+
+
+# ------------------------------
+# Parsers (คืนค่า list ของ Device ตามลำดับในไฟล์)
+# ------------------------------
+def _scalar(text):
+    """ค่าใน INI/CSV เป็น string เสมอ => แปลง true/false/ตัวเลข ให้เหมือนที่ Ansible ตีความ"""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    lowered = text.lower()
+    if lowered in ("true", "yes"):
+        return True
+    if lowered in ("false", "no"):
+        return False
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _parse_kv(fields):
+    pairs = {}
+    for field in fields:
+        if "=" in field:
+            key, value = field.split("=", 1)
+            pairs[key.strip()] = _scalar(value)
+    return pairs
+
+
+def _resolve(hosts, group_vars, children, host_groups):
+    """
+    รวมตัวแปรของ host: group vars ของกลุ่มแม่ก่อน -> กลุ่มลูก -> host vars (ตัวหลังทับตัวหน้า)
+    hosts: {name: host vars}, host_groups: {name: [กลุ่มที่ประกาศตรง ๆ]}
+    """
+    parents = {}
+    for parent, kids in children.items():
+        for kid in kids:
+            parents.setdefault(kid, []).append(parent)
+
+    def _lineage(group, seen):
+        # กลุ่มแม่ก่อนลูก (ancestor -> group)
+        if group in seen:
+            return []
+        seen.add(group)
+        chain = []
+        for parent in parents.get(group, ()):
+            chain += _lineage(parent, seen)
+        return chain + [group]
+
+    devices = []
+    for name, host_vars in hosts.items():
+        seen = set()
+        groups = ["all"] if "all" in group_vars else []
+        for group in host_groups.get(name, ()):
+            groups += [g for g in _lineage(group, seen) if g not in groups]
+        merged = {}
+        for group in groups:
+            merged.update(group_vars.get(group, {}))
+        merged.update(host_vars)
+        devices.append(Device(name, str(merged.get("ansible_host", name)), groups, merged))
+    return devices
+
+
+def _load_ini(path):
+    hosts, group_vars, children, host_groups = {}, {}, {}, {}
+    section, kind = "ungrouped", "hosts"
+    with open(path, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section, _, kind = line[1:-1].partition(":")
+                kind = kind or "hosts"
+                continue
+            if kind == "vars":
+                group_vars.setdefault(section, {}).update(_parse_kv([line]))
+            elif kind == "children":
+                children.setdefault(section, []).append(line.split()[0])
+            else:
+                fields = line.split()
+                name = fields[0]
+                hosts.setdefault(name, {}).update(_parse_kv(fields[1:]))
+                host_groups.setdefault(name, []).append(section)
+    return _resolve(hosts, group_vars, children, host_groups)
+
+
+def _load_yaml(path):
+    """รูปแบบ YAML inventory ของ Ansible: all: {hosts: {...}, vars: {...}, children: {...}}"""
+    import yaml
+
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    hosts, group_vars, children, host_groups = {}, {}, {}, {}
+
+    def _walk(group, body):
+        body = body or {}
+        group_vars.setdefault(group, {}).update(body.get("vars") or {})
+        for name, host_vars in (body.get("hosts") or {}).items():
+            hosts.setdefault(name, {}).update(host_vars or {})
+            host_groups.setdefault(name, []).append(group)
+        for child, child_body in (body.get("children") or {}).items():
+            children.setdefault(group, []).append(child)
+            _walk(child, child_body)
+
+    for group, body in data.items():
+        _walk(group, body)
+    return _resolve(hosts, group_vars, children, host_groups)
+
+
+def _load_csv(path):
+    """
+    หัวตาราง: name, ip (หรือ ansible_host/host), groups (คั่นด้วย ; ไม่ใส่ก็ได้)
+    คอลัมน์อื่นทั้งหมดเป็นตัวแปรของ host เช่น ansible_user, netmiko_port, bot_method
+    """
+    devices = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip(): (v or "").strip() for k, v in row.items() if k}
+            name = row.pop("name", "") or row.get("ip") or row.get("ansible_host") or row.get("host")
+            if not name:
+                continue
+            ip = row.pop("ip", "") or row.pop("host", "") or row.get("ansible_host") or name
+            groups = [g for g in row.pop("groups", "").split(";") if g]
+            host_vars = {k: _scalar(v) for k, v in row.items() if v != ""}
+            host_vars.setdefault("ansible_host", ip)
+            devices.append(Device(name, ip, groups, host_vars))
+    return devices
+
+
+def load_devices(path):
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in (".yaml", ".yml"):
+            return _load_yaml(path)
+        if ext == ".csv":
+            return _load_csv(path)
+        return _load_ini(path)
+    except Exception as e:  # OSError, yaml.YAMLError, csv.Error ฯลฯ
+        raise InventoryError(f"{path}: {e}") from e
+
+
+# ------------------------------
+# Inventory (index by IP / hostname + hot reload)
+# ------------------------------
+class Inventory:
+    """
+    router ทั้งหมดจากไฟล์เดียว พร้อม index
+      - by_ip() / by_name() / resolve(): dict lookup O(1) (ชื่อไม่สนตัวพิมพ์เล็ก-ใหญ่)
+      - ทุกครั้งที่ถูกอ่าน จะเช็ก mtime ของไฟล์ (ไม่ถี่กว่า reload_interval)
+        ไฟล์เปลี่ยน => parse ใหม่แล้วสลับ index ทั้งชุด; parse ไม่ผ่าน => ใช้ชุดเดิมต่อ
+    """
+
+    def __init__(self, path=INVENTORY_FILE, reload_interval=INVENTORY_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._index = ((), {}, {})  # (devices, by_ip, by_name) สลับทีละชุดเดียว
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self, force=True) -> bool:
+        """อ่านไฟล์ใหม่ (force=False: เฉพาะเมื่อ mtime เปลี่ยน) คืนค่า True ถ้า index เปลี่ยน"""
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                if self._mtime is None and force:
+                    print(f"[INVENTORY] {self.path} not readable: {e}")
+                return False
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                devices = load_devices(self.path)
+            except InventoryError as e:
+                print(f"[INVENTORY] Reload failed, keeping {len(self._index[0])} devices: {e}")
+                self._mtime = mtime  # ไม่ parse ไฟล์เสียซ้ำทุกรอบ รอแก้ไฟล์ครั้งถัดไป
+                return False
+            by_ip, by_name = {}, {}
+            for device in devices:
+                by_ip.setdefault(device.ip, device)
+                by_name.setdefault(device.name.lower(), device)
+            changed = self._mtime is not None
+            self._index = (tuple(devices), by_ip, by_name)
+            self._mtime = mtime
+        if changed:
+            print(f"[INVENTORY] Reloaded {self.path}: {len(devices)} devices")
+        return True
+
+    def _current(self):
+        if time.monotonic() - self._checked >= self.reload_interval:
+            if self._lock.acquire(blocking=False):  # มีคนเช็กอยู่แล้ว => ใช้ชุดเดิมไปก่อน
+                self._lock.release()
+                self.reload(force=False)
+        return self._index
+
+    def by_ip(self, ip):
+        return self._current()[1].get(ip)
+
+    def by_name(self, name):
+        return self._current()[2].get(name.lower())
+
+    def resolve(self, token):
+        """IP หรือชื่อ router => Device (ไม่มี => None)"""
+        token = token.strip()
+        _, by_ip, by_name = self._current()
+        return by_ip.get(token) or by_name.get(token.lower())
+
+    def devices(self):
+        return list(self._current()[0])
+
+    def ips(self):
+        return list(self._current()[1])
+
+    def __contains__(self, ip):
+        return ip in self._current()[1]
+
+    def __len__(self):
+        return len(self._current()[1])
+
+
+router_inventory = Inventory()
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime, timezone
+
+
+def retry_after_seconds(error):
+    """
+    ถ้า error เป็น 429 (rate limit) คืนค่าวินาทีที่ต้องรอ, ถ้าไม่ใช่คืน None
+    (webexteamssdk.RateLimitError มี .retry_after, error อื่นดูจาก response header)
+    """
+    retry_after = getattr(error, "retry_after", None)
+    response = getattr(error, "response", None)
+    if retry_after is None and getattr(response, "status_code", None) == 429:
+        retry_after = response.headers.get("Retry-After", 15)
+    if retry_after is None:
+        return None
+    try:
+        return max(1.0, float(retry_after))
+    except (TypeError, ValueError):
+        return 15.0
+
+
+class AdaptivePoller:
+    """
+    ดึงข้อความใหม่ของห้องแบบไม่ตกหล่น และปรับช่วง poll เอง
+      - ไล่อ่านย้อนหลังทีละหน้า (page_size) จนเจอ last_id ไม่ว่าจะมีกี่ข้อความ
+        (ถ้า last_id ถูกลบไปแล้ว จะหยุดที่ข้อความที่เก่ากว่า last_created แทน)
+      - มีข้อความใหม่ => poll ถี่ (min_interval), เงียบ => ห่างขึ้นทีละ backoff เท่า จนถึง max_interval
+      - โดน 429 => รอตาม Retry-After, network error => รอ error_interval
+    max_backlog: ไม่ตั้ง (ค่าเริ่มต้น) = ไล่จนครบทุกข้อความ; ตั้ง => รับใหม่สุดไม่เกินเท่านี้ ที่เก่ากว่าถูกข้าม
+    """
+
+    def __init__(self, api, room_id, last_id=None, last_created=None, page_size=50,
+                 min_interval=1.0, max_interval=15.0, backoff=2.0,
+                 error_interval=5.0, max_backlog=None):
+        self.api = api
+        self.room_id = room_id
+        self.last_id = last_id
+        self.last_created = last_created
+        self.page_size = page_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.error_interval = error_interval
+        self.max_backlog = max_backlog
+        self.next_delay = min_interval
+        # ห้องว่างตอนเริ่ม (ไม่มี last_id): รับเฉพาะข้อความที่มาหลังบอทเริ่ม
+        self._started_at = datetime.now(timezone.utc)
+
+    def _is_old(self, msg) -> bool:
+        created = getattr(msg, "created", None)
+        if created is None:
+            return False
+        if self.last_id is None:
+            return created < self._started_at
+        return self.last_created is not None and created < self.last_created
+
+    def fetch_new(self, page_size=None):
+        """
+        คืนค่า list ข้อความใหม่ เรียงจากเก่า -> ใหม่ (error โยนต่อให้ผู้เรียก)
+        page_size: ขนาดหน้าของรอบนี้ (เช่นหน้าใหญ่ตอนไล่ backlog หลัง restart)
+        """
+        new_messages = []
+        # iterate GeneratorContainer ของ SDK => ขอหน้าถัดไปตาม Link header ให้เอง
+        for msg in self.api.messages.list(roomId=self.room_id, max=page_size or self.page_size):
+            if msg.id == self.last_id or self._is_old(msg):
+                break
+            new_messages.append(msg)
+            if self.max_backlog is not None and len(new_messages) >= self.max_backlog:
+                print(f"\nWarning: backlog > {self.max_backlog} messages, older ones skipped.")
+                break
+        new_messages.reverse()
+        return new_messages
+
+    def mark_processed(self, msg):
+        self.last_id = msg.id
+        self.last_created = getattr(msg, "created", None)
+
+    def poll(self, page_size=None):
+        """
+        ดึงข้อความใหม่ 1 รอบ พร้อมคำนวณ next_delay สำหรับรอบถัดไป
+        error จะไม่โยนออกไป (คืน list ว่างแทน)
+        """
+        try:
+            new_messages = self.fetch_new(page_size)
+        except Exception as e:
+            wait = retry_after_seconds(e)
+            if wait is not None:
+                print(f"\n[RATE LIMIT] Webex asked to wait {wait:.0f}s")
+                self.next_delay = wait
+            else:
+                print(f"\n[NETWORK ERROR] Failed to fetch messages: {e}")
+                print(f"...Will retry in {self.error_interval:.0f} seconds...")
+                self.next_delay = self.error_interval
+            return []
+
+        if new_messages:
+            self.next_delay = self.min_interval
+        else:
+            self.next_delay = min(self.max_interval, self.next_delay * self.backoff)
+        return new_messages
+
+    def sleep(self):
+        time.sleep(self.next_delay)
@@ -1,6 +1,20 @@
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager
+
 from ncclient import manager
 from lxml import etree
+from ncclient.operations.errors import TimeoutExpiredError
 from ncclient.operations.rpc import RPCError
+from ncclient.transport.errors import TransportError
+from ncclient.xml_ import to_ele
+
+import async_loop
+import tracing
+from inventory import router_inventory
+from singleflight import device_reads
+from state_cache import cached_interface_status, interface_cache, running_config_cache
 
 # ------------------------------
 # ค่าคงที่เชื่อมต่ออุปกรณ์
@@ -9,6 +23,11 @@ ROUTER_USER = "admin"
 ROUTER_PASS = "cisco"
 ROUTER_PORT = 830
 
+# Session pool (วินาที)
+POOL_KEEPALIVE = 30        # SSH keepalive ของ session ที่ค้างไว้ใน pool
+POOL_IDLE_TIMEOUT = 300    # ปิด session ที่ไม่ได้ใช้นานเกินนี้
+POOL_PROBE_AFTER = 60      # ถ้า idle นานกว่านี้ ให้ probe ด้วย RPC เล็ก ๆ ก่อนปล่อยให้ใช้
+
 # YANG namespaces
 NS_NATIVE = {"n": "http://cisco.com/ns/yang/Cisco-IOS-XE-native"}
 NS_IETF = {"if": "urn:ietf:params:xml:ns:yang:ietf-interfaces"}
@@ -54,13 +73,26 @@ def _calc_ip_from_student_id(student_id: str):
 # ------------------------------
 # NETCONF Connection
 # ------------------------------
+def _connect_settings(router_ip):
+    """
+    (port, username, password): ansible_user/ansible_password + netconf_port จาก inventory
+    ไม่ระบุ => ROUTER_PORT/ROUTER_USER/ROUTER_PASS
+    """
+    device = router_inventory.by_ip(router_ip)
+    if device is None:
+        return ROUTER_PORT, ROUTER_USER, ROUTER_PASS
+    return (device.get("netconf_port") or ROUTER_PORT,
+            device.username or ROUTER_USER,
+            device.password or ROUTER_PASS)
+
 def get_netconf_connection(router_ip):
+    port, username, password = _connect_settings(router_ip)
     try:
         conn = manager.connect(
             host=router_ip,
-            port=ROUTER_PORT,
-            username=ROUTER_USER,
-            password=ROUTER_PASS,
+            port=port,
+            username=username,
+            password=password,
             hostkey_verify=False,
             device_params={"name": "csr"},
             allow_agent=False,
@@ -73,136 +105,715 @@ def get_netconf_connection(router_ip):
         return None
 
 
+# ------------------------------
+# NETCONF Session Pool
+# ------------------------------
+class NetconfConnectError(Exception):
+    """เปิด session ไปที่ router ไม่ได้"""
+
+
+# error ระดับ transport => session ใช้ต่อไม่ได้แล้ว ต้องทิ้งและต่อใหม่
+_BROKEN_SESSION_ERRORS = (TransportError, TimeoutExpiredError, EOFError, OSError)
+
+# จำนวน RPC ที่ส่งออกไปแล้วใน task ปัจจุบัน (pool ใช้ดูว่า fn คุยกับอุปกรณ์ไปแล้วหรือยัง)
+_rpcs_sent = contextvars.ContextVar("netconf_rpcs_sent", default=0)
+
+# RPC เล็กที่สุดที่ใช้ probe ว่า session ยังตอบได้จริง
+_PROBE_FILTER = """
+  <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+    <hostname/>
+  </native>
+"""
+
+
+async def _await_reply(rpc, timeout):
+    """
+    รอ reply ของ RPC ที่ส่งแบบ async_mode โดยไม่บล็อก thread
+    ncclient ส่ง reply มาทาง thread ของ session แล้วเรียก rpc.event.set()
+    => ห่อ set() ให้ปลุก future บน event loop ด้วย
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def _wake():
+        if not done.done():
+            done.set_result(None)
+
+    event = rpc.event
+    set_event = event.set
+
+    def _set():
+        set_event()
+        loop.call_soon_threadsafe(_wake)
+
+    event.set = _set
+    if event.is_set():  # reply มาก่อนห่อ set() ทัน
+        _wake()
+    try:
+        await asyncio.wait_for(done, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutExpiredError("ncclient timed out while waiting for an rpc reply.") from None
+
+
+async def _rpc(conn, operation, *args, **kwargs):
+    """
+    conn.<operation>(...) แบบไม่บล็อก (conn ต้องเปิด async_mode แล้ว)
+    คืนค่า/โยน error แบบเดียวกับเรียกตรง ๆ ในโหมด sync: RPCReply หรือ RPCError
+    """
+    rpc = getattr(conn, operation)(*args, **kwargs)
+    _rpcs_sent.set(_rpcs_sent.get() + 1)  # ส่งผ่านแล้ว => อุปกรณ์อาจทำไปแล้วแม้ reply จะไม่กลับมา
+    await _await_reply(rpc, conn.timeout)
+    if rpc.error:
+        raise rpc.error
+    reply = rpc.reply
+    reply.parse()
+    if reply.error is not None:
+        errors = reply.errors
+        if len(errors) > 1:
+            raise RPCError(to_ele(reply._raw), errs=errors)
+        raise reply.error
+    return reply
+
+
+class _PooledSession:
+    def __init__(self, router_ip):
+        self.router_ip = router_ip
+        self.lock = asyncio.Lock()  # 1 router = 1 session = ใช้ทีละ RPC chain
+        self.conn = None
+        self.last_used = 0.0
+
+
+class NetconfSessionPool:
+    """
+    เก็บ NETCONF session ค้างไว้ 1 ตัวต่อ router (key = router IP) ใช้บน async_loop
+      - lease(): เช็กสุขภาพก่อนปล่อยให้ใช้ ถ้าเสียก็ต่อใหม่ให้อัตโนมัติ
+      - RPC ส่งแบบ async_mode แล้ว await reply => router หลายร้อยตัวใช้ thread เดียว
+        (เฉพาะ SSH handshake ตอนต่อใหม่ที่ยังรันใน thread pool)
+      - keepalive: ตั้ง SSH keepalive ให้ session ที่ค้างอยู่
+      - idle eviction: task เบื้องหลังปิด session ที่ไม่ได้ใช้นานเกิน idle_timeout
+    """
+
+    def __init__(self, connect, keepalive=POOL_KEEPALIVE,
+                 idle_timeout=POOL_IDLE_TIMEOUT, probe_after=POOL_PROBE_AFTER):
+        self._connect = connect
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.probe_after = probe_after
+        self._entries = {}
+        self._reaper = None
+
+    def _entry(self, router_ip):
+        entry = self._entries.get(router_ip)
+        if entry is None:
+            entry = self._entries[router_ip] = _PooledSession(router_ip)
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_loop())
+        return entry
+
+    async def _open(self, entry):
+        with tracing.span("connect", method="netconf", router=entry.router_ip):
+            conn = await asyncio.get_running_loop().run_in_executor(None, self._connect, entry.router_ip)
+        if conn is None:
+            raise NetconfConnectError(f"Cannot connect to {entry.router_ip}")
+        try:
+            conn._session._transport.set_keepalive(self.keepalive)
+        except Exception:
+            pass  # ไม่ใช่ SSH transport ของ paramiko ก็ข้ามไป
+        conn.async_mode = True
+        entry.conn = conn
+        entry.last_used = time.monotonic()
+        return conn
+
+    async def _healthy(self, entry):
+        conn = entry.conn
+        if conn is None or not conn.connected:
+            return False
+        transport = getattr(getattr(conn, "_session", None), "_transport", None)
+        if transport is not None and not transport.is_active():
+            return False
+        if time.monotonic() - entry.last_used < self.probe_after:
+            return True
+        try:
+            with tracing.span("health_check", method="netconf", router=entry.router_ip):
+                await _rpc(conn, "get_config", source="running", filter=("subtree", _PROBE_FILTER))
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    async def _close(entry):
+        conn, entry.conn = entry.conn, None
+        if conn is None:
+            return
+        try:
+            # async_mode: ส่ง close-session แล้วปิด transport เลย ไม่รอ reply
+            await asyncio.get_running_loop().run_in_executor(None, conn.close_session)
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def lease(self, router_ip):
+        """
+        ยืม session ของ router นี้ (ถือ lock ไว้ตลอดช่วง async with)
+        yield: (conn, reused) — reused=True ถ้าเป็น session เดิมที่ค้างไว้
+        """
+        entry = self._entry(router_ip)
+        async with entry.lock:
+            reused = await self._healthy(entry)
+            if not reused:
+                await self._close(entry)
+                await self._open(entry)
+            try:
+                yield entry.conn, reused
+            except _BROKEN_SESSION_ERRORS:
+                await self._close(entry)
+                raise
+            finally:
+                entry.last_used = time.monotonic()
+
+    async def run(self, router_ip, fn):
+        """
+        await fn(conn) บน session ของ router นี้ (fn เป็น coroutine function)
+        ถ้า session เดิมตาย (stale) ก่อน fn ส่ง RPC แรกออกไปได้ จะต่อใหม่แล้วลองซ้ำอีก 1 ครั้ง
+        ไม่ลองซ้ำเมื่อ timeout หรือ fn ส่ง RPC ไปแล้ว — edit-config/commit อาจถึงอุปกรณ์แล้ว
+        ทำซ้ำจะได้ผล precheck ที่ผิด (เช่น "Cannot create" ทั้งที่สร้างสำเร็จ)
+        """
+        reused, sent = False, None
+        try:
+            async with self.lease(router_ip) as (conn, reused):
+                sent = _rpcs_sent.get()
+                with tracing.span("rpc", method="netconf", router=router_ip):
+                    return await fn(conn)
+        except _BROKEN_SESSION_ERRORS as e:
+            if not reused or isinstance(e, TimeoutExpiredError) or _rpcs_sent.get() != sent:
+                raise
+        async with self.lease(router_ip) as (conn, _):
+            with tracing.span("rpc", method="netconf", router=router_ip):
+                return await fn(conn)
+
+    async def _discard(self, router_ip):
+        entry = self._entries.get(router_ip)
+        if entry is not None:
+            async with entry.lock:
+                await self._close(entry)
+
+    async def _close_all(self):
+        entries, self._entries = list(self._entries.values()), {}
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for entry in entries:
+            async with entry.lock:
+                await self._close(entry)
+
+    def discard(self, router_ip):
+        async_loop.run(self._discard(router_ip))
+
+    def close_all(self):
+        async_loop.run(self._close_all())
+
+    async def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 30))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for entry in list(self._entries.values()):
+                if entry.conn is None or now - entry.last_used < self.idle_timeout:
+                    continue
+                # ถ้ามีคนกำลังใช้อยู่ก็ข้ามไปก่อน รอบหน้าค่อยดูใหม่
+                if not entry.lock.locked():
+                    async with entry.lock:
+                        await self._close(entry)
+
+
+_pool = NetconfSessionPool(get_netconf_connection)
+async_loop.on_shutdown(_pool._close_all)
+
+
 # ------------------------------
 # Safe get_config helpers (รองรับอุปกรณ์ที่ไม่ยอมรับ type="subtree")
 # ------------------------------
-def _safe_get_config_subtree(conn, inner_xml: str):
+async def _safe_get_config_subtree(conn, inner_xml: str):
     """
-    พยายามเรียก get_config โดยใช้ filter แบบ tuple ('subtree', inner_xml)
+    เรียก get_config ด้วย <filter type="subtree">inner_xml</filter>
+    (inner_xml มีได้หลาย subtree ใน filter เดียว)
     ถ้าอุปกรณ์ร้องว่า bad-attribute type/bad-element filter จะ fallback
     ไปใช้ <filter> ธรรมดา (ไม่มี type)
     """
     try:
-        # วิธีมาตรฐานของ ncclient
-        return conn.get_config(source="running", filter=("subtree", inner_xml))
+        return await _rpc(conn, "get_config", source="running",
+                          filter=f'<filter type="subtree">{inner_xml}</filter>')
     except Exception as e:
         msg = str(e)
         # fallback เมื่อโดน bad-attribute type / bad-element filter
         if "bad-attribute" in msg and "type" in msg or "bad-element" in msg and "filter" in msg:
             try:
                 wrapper = f"<filter>{inner_xml}</filter>"
-                return conn.get_config(source="running", filter=wrapper)
+                return await _rpc(conn, "get_config", source="running", filter=wrapper)
             except Exception as e2:
                 raise e2
         raise e
 
 
 # ------------------------------
-# Read status (Robust)
+# Read status (Robust, 1 RPC)
 # ------------------------------
-def get_interface_status(router_ip, interface_name: str):
+# filter เดียวขอทั้ง native และ IETF subtree => ไม่ต้องยิง get-config รอบสอง
+_STATUS_FILTER = """
+  <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+    <interface>
+      <Loopback>
+        <name>{loop_num}</name>
+        <shutdown/>
+      </Loopback>
+    </interface>
+  </native>
+  <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+    <interface>
+      <name>{if_name}</name>
+      <enabled/>
+    </interface>
+  </interfaces>
+"""
+
+# compile XPath ครั้งเดียวตอน import (ไม่ต้อง parse expression ใหม่ทุก call)
+_XP_NATIVE_LOOPBACK = etree.XPath(
+    "//n:native/n:interface/n:Loopback[n:name=$n]", namespaces=NS_NATIVE
+)
+_XP_NATIVE_SHUTDOWN = etree.XPath("n:shutdown", namespaces=NS_NATIVE)
+_XP_IETF_INTERFACE = etree.XPath(
+    "//if:interfaces/if:interface[if:name=$n]", namespaces=NS_IETF
+)
+_XP_IETF_ENABLED = etree.XPath("if:enabled", namespaces=NS_IETF)
+
+
+def _status_from_reply(root, loop_num: int, if_name: str):
+    """
+    ตัดสินสถานะจาก reply เดียว:
+      1) native: มี Loopback[name] => มี <shutdown/> ? disabled : enabled
+      2) ไม่เจอใน native ค่อยดู IETF interface[name]/enabled
+      3) ไม่เจอทั้งคู่ => not_exists
+    """
+    loop_nodes = _XP_NATIVE_LOOPBACK(root, n=str(loop_num))
+    if loop_nodes:
+        # มีอินเทอร์เฟซแล้ว
+        has_shutdown = bool(_XP_NATIVE_SHUTDOWN(loop_nodes[0]))
+        return "exists_disabled" if has_shutdown else "exists_enabled"
+
+    nodes = _XP_IETF_INTERFACE(root, n=if_name)
+    if not nodes:
+        return "not_exists"
+
+    en = _XP_IETF_ENABLED(nodes[0])
+    if not en or (en[0].text or "").strip().lower() == "true":
+        return "exists_enabled"
+    else:
+        return "exists_disabled"
+
+
+async def _status_on(conn, loop_num: int, if_name: str):
+    """
+    เช็กสถานะบน session ที่ยืมมาแล้ว (ไม่เปิด/ปิด session เอง) — 1 get-config
+    """
+    rep = await _safe_get_config_subtree(conn, _STATUS_FILTER.format(loop_num=loop_num, if_name=if_name))
+    root = getattr(rep, "data_ele", None)
+    if root is None:
+        root = etree.fromstring(rep.xml.encode())
+    return _status_from_reply(root, loop_num, if_name)
+
+
+async def _safe_status_on(conn, loop_num: int, if_name: str):
+    """
+    เหมือน _status_on แต่แปลง error ของ RPC เป็น "error"
+    (error ระดับ transport ยังโยนต่อให้ pool ต่อ session ใหม่)
+    """
+    try:
+        return await _status_on(conn, loop_num, if_name)
+    except _BROKEN_SESSION_ERRORS:
+        raise
+    except Exception as e:
+        print(f"NETCONF get_interface_status Error: {e}")
+        return "error"
+
+
+async def _precheck_on(conn, router_ip, loop_num: int, if_name: str):
+    """
+    สถานะก่อนเขียน เมื่อ cache ไม่มี (ผู้เรียกเช็ก cache มาก่อนแล้ว): ยิง RPC แล้วเก็บลง cache
+    """
+    status = await _safe_status_on(conn, loop_num, if_name)
+    interface_cache.put(router_ip, if_name, status)
+    return status
+
+
+def get_interface_status(router_ip, interface_name: str, use_cache=True):
+    return async_loop.run(_get_interface_status(router_ip, interface_name, use_cache))
+
+
+async def get_interface_status_async(router_ip, interface_name: str, use_cache=True):
+    return await async_loop.call(_get_interface_status(router_ip, interface_name, use_cache))
+
+
+async def _get_interface_status(router_ip, interface_name: str, use_cache=True):
     """
     คืนค่า: "exists_enabled" | "exists_disabled" | "not_exists" | "error"
-    กลยุทธ์:
+    กลยุทธ์: get-config ครั้งเดียว ขอทั้ง native และ IETF subtree
       1) เช็ก native ก่อน: /native/interface/Loopback[name=<num>]
-         - ถ้าไม่มี => not_exists
          - ถ้ามีและมี <shutdown/> => exists_disabled
          - ถ้ามีและไม่มี <shutdown/> => exists_enabled
-      2) Fallback (ถ้า native ไม่เจอ): ใช้ IETF ietf-interfaces
+      2) Fallback (ถ้า native ไม่เจอ): ดู IETF ietf-interfaces จาก reply เดียวกัน
+         - ไม่เจอทั้งคู่ => not_exists
+    use_cache=True: ถ้ามีใน interface_cache (หรือ running-config snapshot) ตอบเลย ไม่ต้องยืม session/ยิง RPC
     """
     loop_num, if_name = _parse_loop_name(interface_name)
-    conn = get_netconf_connection(router_ip)
-    if not conn:
-        return "error"
-
+    if use_cache:
+        cached = cached_interface_status(router_ip, if_name)
+        if cached is not None:
+            return cached
     try:
-        # (A) Native check
-        native_inner = f"""
-          <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
-            <interface>
-              <Loopback>
-                <name>{loop_num}</name>
-                <shutdown/>
-              </Loopback>
-            </interface>
-          </native>
-        """
-        rep = _safe_get_config_subtree(conn, native_inner)
-        root = etree.fromstring(rep.xml.encode())
+        status = await device_reads.do_async(
+            device_reads.key("netconf", router_ip, "status", if_name),
+            lambda: _pool.run(router_ip, lambda conn: _safe_status_on(conn, loop_num, if_name)))
+    except Exception as e:
+        print(f"NETCONF get_interface_status Error: {e}")
+        status = "error"
+    interface_cache.put(router_ip, if_name, status)
+    return status
 
-        loop_nodes = root.xpath(
-            "//n:native/n:interface/n:Loopback[n:name=$n]",
-            namespaces=NS_NATIVE,
-            n=str(loop_num),
-        )
-        if loop_nodes:
-            # มีอินเทอร์เฟซแล้ว
-            has_shutdown = (
-                loop_nodes[0].find("{http://cisco.com/ns/yang/Cisco-IOS-XE-native}shutdown")
-                is not None
-            )
-            return "exists_disabled" if has_shutdown else "exists_enabled"
-
-        # (B) IETF fallback
-        ietf_inner = f"""
-          <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-            <interface>
-              <name>{if_name}</name>
-              <enabled/>
-            </interface>
-          </interfaces>
+
+# ------------------------------
+# Edits (1 edit = เปลี่ยน Loopback 1 ตัว) + batching ต่อ router
+# ------------------------------
+# edit ของ router เดียวกันที่มาระหว่าง session ยังทำงานอยู่ ถูกรวมเป็น batch เดียวตอนรอบถัดไป
+# EDIT_BATCH_WINDOW > 0: รอรวม edit เพิ่มอีกเท่านี้ (วินาที) ก่อนเริ่ม batch
+EDIT_BATCH_WINDOW = 0.0
+EDIT_BATCH_MAX = 50
+
+# ขอ Loopback ทุกตัว (ชื่อ + shutdown) และ IETF interface ทุกตัว => precheck ทั้ง batch ด้วย get-config เดียว
+_ALL_LOOPBACKS_FILTER = """
+  <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+    <interface>
+      <Loopback>
+        <name/>
+        <shutdown/>
+      </Loopback>
+    </interface>
+  </native>
+  <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+    <interface>
+      <name/>
+      <enabled/>
+    </interface>
+  </interfaces>
+"""
+
+
+def _edit_config(loopbacks):
+    """<Loopback> หลายตัว => <config> เดียว (native/interface)"""
+    return f"""
+    <config>
+      <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native"
+              xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+        <interface>
+          {"".join(loopbacks)}
+        </interface>
+      </native>
+    </config>
+    """
+
+
+class _Edit:
+    """
+    การแก้ Loopback 1 ตัว
+      decide(status): คำตอบที่ไม่ต้องแก้อะไร (เช่น "Cannot create: ...") หรือ None = ต้องแก้
+      loopback_xml: <Loopback> ที่จะใส่ใน edit-config
+      expect: สถานะหลังแก้สำเร็จ (เขียนลง interface_cache)
+      tolerate: error-tag ที่ถือว่าสำเร็จ (เฉพาะตอนแก้ทีละตัว)
+      pre/generation: สถานะจาก cache ตอน submit (read_cache) ใช้เป็น precheck แทน get-config
+    """
+
+    __slots__ = ("loop_num", "if_name", "decide", "loopback_xml", "expect", "success", "tolerate", "future",
+                 "pre", "generation")
+
+    def __init__(self, loop_num, if_name, decide, loopback_xml, expect, success, tolerate=None):
+        self.loop_num = loop_num
+        self.if_name = if_name
+        self.decide = decide
+        self.loopback_xml = loopback_xml
+        self.expect = expect
+        self.success = success
+        self.tolerate = tolerate
+        self.future = None
+        self.pre = None
+        self.generation = None
+
+    def read_cache(self, router_ip):
+        """สถานะจาก cache (None = ไม่มี) — จำไว้ใช้เป็น precheck ตอนถึงคิว"""
+        self.generation = running_config_cache.generation(router_ip)
+        self.pre = cached_interface_status(router_ip, self.if_name)
+        return self.pre
+
+    def cached_pre(self, router_ip):
+        """
+        precheck ที่ไม่ต้องยิง RPC: ค่าจาก read_cache ถ้า router ยังไม่ถูกเขียนคั่นตั้งแต่ตอนนั้น
+        (ถูกเขียนคั่น เช่น batch ก่อนหน้า => อ่าน cache ใหม่ที่ write-through แล้ว) ไม่มี => None
         """
-        rep2 = _safe_get_config_subtree(conn, ietf_inner)
-        r2 = etree.fromstring(rep2.xml.encode())
+        if self.generation == running_config_cache.generation(router_ip):
+            return self.pre
+        return cached_interface_status(router_ip, self.if_name)
 
-        nodes = r2.xpath(
-            "//if:interfaces/if:interface[if:name=$n]",
-            namespaces=NS_IETF,
-            n=if_name,
-        )
-        if not nodes:
-            return "not_exists"
 
-        en = nodes[0].find("{urn:ietf:params:xml:ns:yang:ietf-interfaces}enabled")
-        if en is None or (en.text or "").strip().lower() == "true":
-            return "exists_enabled"
-        else:
-            return "exists_disabled"
+def _use_candidate(conn, batch_size):
+    """
+    แก้ผ่าน candidate + commit เมื่ออุปกรณ์มี :candidate และ
+    มีหลาย edit (commit ครั้งเดียวทั้งชุด) หรือเขียน running ตรง ๆ ไม่ได้
+    """
+    caps = conn.server_capabilities
+    if ":candidate" not in caps:
+        return False
+    return batch_size > 1 or ":writable-running" not in caps
 
-    except Exception as e:
-        print(f"NETCONF get_interface_status Error: {e}")
-        return "error"
+
+async def _write(conn, configs, candidate):
+    """
+    ส่ง edit-config ตามลำดับ
+      candidate=False: เขียน running ทีละก้อน
+      candidate=True: lock -> edit candidate ทุกก้อน -> validate -> commit -> unlock
+                      พลาดตรงไหน discard-changes => running ไม่เปลี่ยนเลย
+    """
+    if not candidate:
+        for config in configs:
+            await _rpc(conn, "edit_config", target="running", config=config, default_operation="merge")
+        return
+    await _rpc(conn, "lock", target="candidate")
+    try:
+        try:
+            for config in configs:
+                await _rpc(conn, "edit_config", target="candidate", config=config, default_operation="merge")
+            if ":validate" in conn.server_capabilities:
+                await _rpc(conn, "validate", source="candidate")
+            await _rpc(conn, "commit")
+        except Exception:
+            try:
+                await _rpc(conn, "discard_changes")
+            except _BROKEN_SESSION_ERRORS:
+                raise
+            except Exception:
+                pass
+            raise
     finally:
         try:
-            conn.close_session()
+            await _rpc(conn, "unlock", target="candidate")
+        except _BROKEN_SESSION_ERRORS:
+            raise
         except Exception:
             pass
 
 
+async def _apply_one(conn, router_ip, edit):
+    """
+    precheck แล้วแก้ edit เดียว (ทางเดิมก่อนมี batch และทาง fallback เมื่อ batch ถูกปฏิเสธ)
+    precheck จาก cache ได้ => ไม่ยิง get-config
+    """
+    pre = edit.cached_pre(router_ip)
+    if pre is None:
+        pre = await _precheck_on(conn, router_ip, edit.loop_num, edit.if_name)
+    answer = edit.decide(pre)
+    if answer:
+        return answer
+    try:
+        with running_config_cache.writing(router_ip):
+            await _write(conn, [_edit_config([edit.loopback_xml])], _use_candidate(conn, 1))
+    except RPCError as e:
+        if edit.tolerate is None or getattr(e, "tag", None) != edit.tolerate:
+            raise
+    interface_cache.put(router_ip, edit.if_name, edit.expect)
+    return edit.success
+
+
+def _chunks(planned):
+    """
+    แบ่ง edit ที่ต้องแก้จริงเป็นก้อน โดยแต่ละก้อนไม่มี Loopback ซ้ำกัน
+    (เช่น create แล้ว shutdown ตัวเดียวกัน => คนละ edit-config ตามลำดับ)
+    """
+    chunks = [[]]
+    for index, edit in planned:
+        if any(other.if_name == edit.if_name for _, other in chunks[-1]):
+            chunks.append([])
+        chunks[-1].append((index, edit))
+    return [chunk for chunk in chunks if chunk]
+
+
+async def _apply_batch(conn, router_ip, batch):
+    """
+    แก้หลาย edit บน session เดียว คืนค่าผลของแต่ละ edit ตามลำดับ
+      1) สถานะเริ่มต้นของแต่ละ Loopback จาก cache ก่อน ที่เหลือใช้ get-config เดียวเอาทั้งหมด
+         (ทุกตัวอยู่ใน cache => ไม่ยิง) แล้วไล่ decide ตามลำดับ
+         (edit ก่อนหน้าใน batch เปลี่ยนสถานะที่ edit ถัดไปเห็น)
+      2) edit ที่ต้องแก้จริง รวมเป็น edit-config ก้อนเดียว (ต่อก้อนที่ Loopback ไม่ซ้ำ)
+         มี :candidate => validate/commit ครั้งเดียวทั้ง batch
+      3) อุปกรณ์ปฏิเสธ => candidate ถูก discard (หรือก้อนที่ผ่านแล้วบน running ถือว่าสำเร็จ)
+         edit ที่เหลือแก้ทีละตัวด้วย _apply_one เพื่อให้ได้ผลรายตัว
+    """
+    if len(batch) == 1 and not _use_candidate(conn, 1):
+        return [await _apply_one(conn, router_ip, batch[0])]
+
+    state = {}
+    for edit in batch:
+        if edit.if_name not in state:
+            state[edit.if_name] = edit.cached_pre(router_ip)
+    if any(status is None for status in state.values()):
+        try:
+            rep = await _safe_get_config_subtree(conn, _ALL_LOOPBACKS_FILTER)
+            root = getattr(rep, "data_ele", None)
+            if root is None:
+                root = etree.fromstring(rep.xml.encode())
+        except _BROKEN_SESSION_ERRORS:
+            raise
+        except Exception as e:
+            # เหมือน _safe_status_on: precheck พัง => "error" ให้แต่ละ edit ตัดสินเอง (ส่วนใหญ่ "ลองต่อ")
+            print(f"NETCONF get_interface_status Error: {e}")
+            root = None
+        for edit in batch:
+            if state[edit.if_name] is None:
+                status = "error" if root is None else _status_from_reply(root, edit.loop_num, edit.if_name)
+                state[edit.if_name] = status
+                interface_cache.put(router_ip, edit.if_name, status)
+
+    results = [None] * len(batch)
+    planned = []
+    for index, edit in enumerate(batch):
+        answer = edit.decide(state[edit.if_name])
+        if answer:
+            results[index] = answer
+            continue
+        planned.append((index, edit))
+        state[edit.if_name] = edit.expect
+
+    chunks = _chunks(planned)
+    candidate = _use_candidate(conn, len(planned))
+    failed = []
+    with running_config_cache.writing(router_ip):
+        if candidate and chunks:
+            try:
+                await _write(conn, [_edit_config([e.loopback_xml for _, e in chunk]) for chunk in chunks], True)
+            except RPCError as e:
+                print(f"[NETCONF] Batch commit of {len(planned)} edits on {router_ip} rejected: {e}")
+                failed = planned
+        else:
+            for n, chunk in enumerate(chunks):
+                try:
+                    await _write(conn, [_edit_config([e.loopback_xml for _, e in chunk])], False)
+                except RPCError as e:
+                    print(f"[NETCONF] Batch edit on {router_ip} rejected: {e}")
+                    failed = [item for rest in chunks[n:] for item in rest]
+                    break
+
+    failed_ids = {index for index, _ in failed}
+    for index, edit in planned:
+        if index not in failed_ids:
+            interface_cache.put(router_ip, edit.if_name, edit.expect)
+            results[index] = edit.success
+    if failed:
+        tracing.registry.inc("bot_netconf_batch_fallbacks_total")
+        for name in {edit.if_name for _, edit in failed}:
+            interface_cache.invalidate(router_ip, name)
+        for index, edit in failed:
+            try:
+                results[index] = await _apply_one(conn, router_ip, edit)
+            except _BROKEN_SESSION_ERRORS:
+                raise
+            except Exception as e:
+                interface_cache.invalidate(router_ip, edit.if_name)
+                results[index] = e
+    return results
+
+
+class NetconfEditBatcher:
+    """
+    คิว edit ต่อ router บน async_loop
+      - submit(): ใส่ edit เข้าคิวแล้วรอผลของ edit นั้นเอง
+      - router ละ 1 task ดึงคิวทีละ batch (ไม่เกิน max_batch) ไปรันบน session ของ pool
+        => ระหว่าง batch หนึ่งกำลังคุยกับอุปกรณ์ edit ใหม่สะสมรอเป็น batch ถัดไป
+        bulk change จึงใช้ RPC ตามจำนวน router ไม่ใช่ตามจำนวน edit
+    """
+
+    def __init__(self, pool, window=EDIT_BATCH_WINDOW, max_batch=EDIT_BATCH_MAX):
+        self._pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # router_ip -> list[_Edit]
+        self._drains = {}   # router_ip -> asyncio.Task
+
+    async def submit(self, router_ip, edit):
+        edit.future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(router_ip, []).append(edit)
+        if router_ip not in self._drains:
+            self._drains[router_ip] = asyncio.ensure_future(self._drain(router_ip))
+        return await edit.future
+
+    async def _drain(self, router_ip):
+        try:
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            while self._pending.get(router_ip):
+                queue = self._pending[router_ip]
+                batch, queue[:] = queue[:self.max_batch], queue[self.max_batch:]
+                await self._run(router_ip, batch)
+        finally:
+            self._drains.pop(router_ip, None)
+            if not self._pending.get(router_ip):
+                self._pending.pop(router_ip, None)
+
+    async def _run(self, router_ip, batch):
+        tracing.registry.inc("bot_netconf_edit_batches_total")
+        tracing.registry.inc("bot_netconf_edits_total", len(batch))
+        try:
+            results = await self._pool.run(router_ip, lambda conn: _apply_batch(conn, router_ip, batch))
+        except Exception as e:
+            results = [e] * len(batch)
+        for edit, result in zip(batch, results):
+            if edit.future.done():
+                continue
+            if isinstance(result, Exception):
+                edit.future.set_exception(result)
+            else:
+                edit.future.set_result(result)
+
+
+_edits = NetconfEditBatcher(_pool)
+
+
+async def _submit_edit(router_ip, edit, error_prefix):
+    try:
+        return await _edits.submit(router_ip, edit)
+    except NetconfConnectError:
+        return "Error: NETCONF Connection Failed"
+    except Exception as e:
+        interface_cache.invalidate(router_ip, edit.if_name)
+        return f"{error_prefix}: {e}"
+
+
 # ------------------------------
 # Create Loopback (Cisco Native)
 # ------------------------------
 def create_interface(router_ip, student_id: str):
+    return async_loop.run(_create_interface(router_ip, student_id))
+
+
+async def create_interface_async(router_ip, student_id: str):
+    return await async_loop.call(_create_interface(router_ip, student_id))
+
+
+async def _create_interface(router_ip, student_id: str):
     """
     สร้าง Loopback<student_id> โดยใช้ native:
       native/interface/Loopback[name=<num>]/ip/address/primary
+    pre-check และ edit ใช้ session เดียวกันจาก pool (รวม batch กับ edit อื่นของ router เดียวกันได้)
     """
-    loop_num, _ = _parse_loop_name(f"Loopback{student_id}")
+    loop_num, if_name = _parse_loop_name(f"Loopback{student_id}")
     ip, mask = _calc_ip_from_student_id(student_id)
 
-    # ตรวจสอบก่อน — ถ้าเช็กแล้ว error ให้ “ลองสร้างต่อ” ได้
-    pre = get_interface_status(router_ip, f"Loopback{student_id}")
-    if pre not in ("not_exists", "error"):
-        return f"Cannot create: Interface Loopback{student_id}"
-
-    conn = get_netconf_connection(router_ip)
-    if not conn:
-        return "Error: NETCONF Connection Failed"
-
-    config_xml = f"""
-    <config>
-      <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
-        <interface>
+    loopback_xml = f"""
           <Loopback>
             <name>{loop_num}</name>
             <description>created-by-netconf</description>
@@ -215,159 +826,119 @@ def create_interface(router_ip, student_id: str):
               </address>
             </ip>
           </Loopback>
-        </interface>
-      </native>
-    </config>
     """
 
-    try:
-        rep = conn.edit_config(target="running", config=config_xml, default_operation="merge")
-        if rep.ok:
-            return f"Interface Loopback{student_id} is created successfully using Netconf"
-        else:
-            return f"Error: Router rejected config for Loopback{student_id}."
-    except Exception as e:
-        return f"NETCONF create_interface Exception: {e}"
-    finally:
-        try:
-            conn.close_session()
-        except Exception:
-            pass
+    def _decide(pre):
+        # ถ้าเช็กแล้ว error ให้ “ลองสร้างต่อ” ได้
+        if pre not in ("not_exists", "error"):
+            return f"Cannot create: Interface Loopback{student_id}"
+        return None
+
+    edit = _Edit(loop_num, if_name, _decide, loopback_xml, "exists_enabled",
+                 f"Interface Loopback{student_id} is created successfully using Netconf")
+    # cache บอกว่ามีอยู่แล้ว => ตอบได้เลย ไม่ต้องแตะอุปกรณ์ (ไม่มี => ค่าจาก cache ใช้เป็น precheck)
+    pre = edit.read_cache(router_ip)
+    answer = _decide(pre) if pre is not None else None
+    if answer:
+        return answer
+    return await _submit_edit(router_ip, edit, "NETCONF create_interface Exception")
 
 
 # ------------------------------
 # Delete Loopback (Cisco Native)
 # ------------------------------
 def delete_interface(router_ip, student_id: str):
-    loop_num, _ = _parse_loop_name(f"Loopback{student_id}")
+    return async_loop.run(_delete_interface(router_ip, student_id))
 
-    # ตรวจสอบก่อน — ถ้าเช็กแล้ว error ให้ “ลองลบต่อ” ได้
-    pre = get_interface_status(router_ip, f"Loopback{student_id}")
-    if pre == "not_exists":
-        return f"Cannot delete: Interface Loopback{student_id}"
 
-    conn = get_netconf_connection(router_ip)
-    if not conn:
-        return "Error: NETCONF Connection Failed"
+async def delete_interface_async(router_ip, student_id: str):
+    return await async_loop.call(_delete_interface(router_ip, student_id))
 
-    config_xml = f"""
-    <config>
-      <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native"
-              xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
-        <interface>
+
+async def _delete_interface(router_ip, student_id: str):
+    loop_num, if_name = _parse_loop_name(f"Loopback{student_id}")
+
+    loopback_xml = f"""
           <Loopback nc:operation="delete">
             <name>{loop_num}</name>
           </Loopback>
-        </interface>
-      </native>
-    </config>
     """
 
-    try:
-        rep = conn.edit_config(target="running", config=config_xml)
-        if rep.ok:
-            return f"Interface Loopback{student_id} is deleted successfully using Netconf"
-        else:
-            return f"Error: Router rejected config for Loopback{student_id}."
-    except Exception as e:
-        return f"NETCONF delete_interface Error: {e}"
-    finally:
-        try:
-            conn.close_session()
-        except Exception:
-            pass
+    def _decide(pre):
+        # ถ้าเช็กแล้ว error ให้ “ลองลบต่อ” ได้
+        if pre == "not_exists":
+            return f"Cannot delete: Interface Loopback{student_id}"
+        return None
+
+    edit = _Edit(loop_num, if_name, _decide, loopback_xml, "not_exists",
+                 f"Interface Loopback{student_id} is deleted successfully using Netconf")
+    pre = edit.read_cache(router_ip)
+    answer = _decide(pre) if pre is not None else None
+    if answer:
+        return answer
+    return await _submit_edit(router_ip, edit, "NETCONF delete_interface Error")
 
 
 # ------------------------------
 # Enable / Disable (Cisco Native)
 # ------------------------------
 def set_interface_state(router_ip, student_id: str, enabled: bool):
+    return async_loop.run(_set_interface_state(router_ip, student_id, enabled))
+
+
+async def set_interface_state_async(router_ip, student_id: str, enabled: bool):
+    return await async_loop.call(_set_interface_state(router_ip, student_id, enabled))
+
+
+async def _set_interface_state(router_ip, student_id: str, enabled: bool):
     """
     ใช้ native: <shutdown/> เป็นตัวคุมสถานะ
       - disable: เพิ่ม <shutdown/>
       - enable: ลบ <shutdown/> (ถ้าไม่มีแล้ว ให้ถือว่าสำเร็จ)
-    ทำให้ idempotent: เช็กก่อน-ทำ-เช็กหลัง และ ignore data-missing สำหรับเคส enable
+    ทำให้ idempotent: เช็กก่อน (จาก cache ได้) แล้วทำ และ ignore data-missing สำหรับเคส enable
+    ผลที่เขียนสำเร็จเชื่อได้เลย (บันทึกลง cache) ไม่ต้อง get-config ซ้ำเพื่อเช็กหลัง
     """
-    loop_num, _ = _parse_loop_name(f"Loopback{student_id}")
-
-    # 1) Pre-check
-    pre = get_interface_status(router_ip, f"Loopback{student_id}")
-    if pre == "not_exists":
-        return (
-            f"Cannot enable: Interface Loopback{student_id}"
-            if enabled
-            else f"Cannot shutdown: Interface Loopback{student_id}"
-        )
-    if enabled and pre == "exists_enabled":
-        return f"Interface Loopback{student_id} is enabled successfully using Netconf (already)"
-    if (not enabled) and pre == "exists_disabled":
-        return f"Interface Loopback{student_id} is shutdowned successfully using Netconf (already)"
+    loop_num, if_name = _parse_loop_name(f"Loopback{student_id}")
 
-    conn = get_netconf_connection(router_ip)
-    if not conn:
-        return "Error: NETCONF Connection Failed"
-
-    try:
-        if enabled:
-            # ลบ shutdown ถ้ามี; ถ้าไม่มีแล้ว บางรุ่นจะตอบ data-missing — ให้มองว่าโอเค
-            config_xml = f"""
-            <config>
-              <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native"
-                      xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
-                <interface>
-                  <Loopback>
-                    <name>{loop_num}</name>
-                    <shutdown nc:operation="delete"/>
-                  </Loopback>
-                </interface>
-              </native>
-            </config>
-            """
-            try:
-                _ = conn.edit_config(
-                    target="running",
-                    config=config_xml,
-                    default_operation="merge",
-                )
-            except RPCError as e:
-                # ถ้าลบไม่เจอ (data-missing) ให้ถือว่าสำเร็จ เพราะมัน "เปิด" อยู่แล้ว
-                if getattr(e, "tag", None) != "data-missing":
-                    raise
+    if enabled:
+        # ลบ shutdown ถ้ามี; ถ้าไม่มีแล้ว บางรุ่นจะตอบ data-missing — ให้มองว่าโอเค
+        loopback_xml = f"""
+              <Loopback>
+                <name>{loop_num}</name>
+                <shutdown nc:operation="delete"/>
+              </Loopback>
+        """
+    else:
+        # ปิด: ใส่ shutdown (merge ได้ตลอด)
+        loopback_xml = f"""
+              <Loopback>
+                <name>{loop_num}</name>
+                <shutdown/>
+              </Loopback>
+        """
 
-        else:
-            # ปิด: ใส่ shutdown (merge ได้ตลอด)
-            config_xml = f"""
-            <config>
-              <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
-                <interface>
-                  <Loopback>
-                    <name>{loop_num}</name>
-                    <shutdown/>
-                  </Loopback>
-                </interface>
-              </native>
-            </config>
-            """
-            _ = conn.edit_config(
-                target="running",
-                config=config_xml,
-                default_operation="merge",
+    def _answer_from(pre):
+        if pre == "not_exists":
+            return (
+                f"Cannot enable: Interface Loopback{student_id}"
+                if enabled
+                else f"Cannot shutdown: Interface Loopback{student_id}"
             )
+        if enabled and pre == "exists_enabled":
+            return f"Interface Loopback{student_id} is enabled successfully using Netconf (already)"
+        if (not enabled) and pre == "exists_disabled":
+            return f"Interface Loopback{student_id} is shutdowned successfully using Netconf (already)"
+        return None
 
-        # 3) Post-check ยืนยันผล
-        post = get_interface_status(router_ip, f"Loopback{student_id}")
-        if enabled and post == "exists_enabled":
-            return f"Interface Loopback{student_id} is enabled successfully using Netconf"
-        if (not enabled) and post == "exists_disabled":
-            return f"Interface Loopback{student_id} is shutdowned successfully using Netconf"
-
-        # ถ้าผลตรวจหลังทำไม่ตรง เปลี่ยนไปแจ้ง error พร้อมใบ้สถานะจริง
-        return f"NETCONF set_interface_state Warning: final state = {post}"
-
-    except Exception as e:
-        return f"NETCONF set_interface_state Error: {e}"
-    finally:
-        try:
-            conn.close_session()
-        except Exception:
-            pass
\ No newline at end of file
+    # edit ผ่าน => เชื่อผลของตัวเอง (write-through ลง cache)
+    if enabled:
+        edit = _Edit(loop_num, if_name, _answer_from, loopback_xml, "exists_enabled",
+                     f"Interface Loopback{student_id} is enabled successfully using Netconf",
+                     tolerate="data-missing")
+    else:
+        edit = _Edit(loop_num, if_name, _answer_from, loopback_xml, "exists_disabled",
+                     f"Interface Loopback{student_id} is shutdowned successfully using Netconf")
+    cached_answer = _answer_from(edit.read_cache(router_ip))
+    if cached_answer:
+        return cached_answer
+    return await _submit_edit(router_ip, edit, "NETCONF set_interface_state Error")
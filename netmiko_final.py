@@ -1,33 +1,202 @@
+import os
 import re
+import threading
+from contextlib import contextmanager
+
 from netmiko import ConnectHandler
+from netmiko.exceptions import NetmikoTimeoutException, ReadTimeout
+
+import tracing
+from inventory import router_inventory
+from singleflight import device_reads
+from state_cache import running_config_cache
 
 ROUTER_USER = "admin"
 ROUTER_PASS = "cisco"
 DEVICE_TYPE = "cisco_ios"
 
-def _connect(ip: str):
+# ค่าเริ่มต้นของการเชื่อมต่อ/จังหวะการอ่าน (override รายเครื่องได้ใน DEVICE_SETTINGS)
+DEFAULT_SETTINGS = {
+    "username": ROUTER_USER,
+    "password": ROUTER_PASS,
+    "port": 22,
+    "fast_cli": True,
+    "global_delay_factor": 1,
+    "conn_timeout": 10,
+    "read_timeout": 20,          # send_command ปกติ
+    "showrun_delay_factor": 2,   # show running-config ยาว ให้รอนานขึ้น
+}
+DEVICE_SETTINGS = {
+    # "10.0.15.61": {"fast_cli": False, "global_delay_factor": 2},
+}
+
+# error ที่แปลว่า channel เสียแล้ว ต้องทิ้งแล้วต่อใหม่
+_BROKEN_CHANNEL_ERRORS = (OSError, EOFError, NetmikoTimeoutException, ReadTimeout)
+
+
+def _inventory_settings(ip: str) -> dict:
+    """
+    ค่าจาก inventory: ansible_user/ansible_password/ansible_port + ตัวแปร netmiko_<key>
+    เช่น CSR1KV-Pod1-1 ansible_host=10.0.15.61 netmiko_fast_cli=false
+    """
+    device = router_inventory.by_ip(ip)
+    if device is None:
+        return {}
+    overrides = {}
+    for key, var in (("username", "ansible_user"), ("password", "ansible_password"), ("port", "ansible_port")):
+        if device.get(var) is not None:
+            overrides[key] = device.get(var)
+    overrides.update({k: v for k, v in device.settings("netmiko_").items() if k in DEFAULT_SETTINGS})
+    return overrides
+
+
+def device_settings(ip: str) -> dict:
+    """DEFAULT_SETTINGS <- inventory <- DEVICE_SETTINGS (ตัวหลังทับตัวหน้า)"""
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(_inventory_settings(ip))
+    settings.update(DEVICE_SETTINGS.get(ip, {}))
+    return settings
+
+
+def set_device_settings(ip: str, **overrides):
+    """
+    ปรับค่า fast_cli / delay ของเครื่องนั้น ๆ
+    session ที่ค้างอยู่จะถูกต่อใหม่ตอนใช้ครั้งถัดไป (เพราะ settings เปลี่ยน)
+    """
+    DEVICE_SETTINGS.setdefault(ip, {}).update(overrides)
+
+
+def _connect(ip: str, settings: dict = None):
+    settings = settings or device_settings(ip)
     return ConnectHandler(
         device_type=DEVICE_TYPE,
         host=ip,
-        username=ROUTER_USER,
-        password=ROUTER_PASS,
+        port=settings["port"],
+        username=settings["username"],
+        password=settings["password"],
         # secret=ROUTER_PASS,  # ถ้าต้อง enter enable ให้ uncomment
-        fast_cli=False,
+        fast_cli=settings["fast_cli"],
+        global_delay_factor=settings["global_delay_factor"],
+        conn_timeout=settings["conn_timeout"],
     )
 
+
+# ------------------------------
+# Connection manager (1 channel ต่อ router)
+# ------------------------------
+class _Channel:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.settings = None
+
+
+class NetmikoConnectionManager:
+    """
+    เก็บ Netmiko channel ที่ login แล้วไว้ 1 ตัวต่อ router
+      - ก่อนใช้ซ้ำ: เช็ก is_alive() และ find_prompt() ว่ายังอยู่ที่ prompt
+      - channel เสีย/settings เปลี่ยน: disconnect แล้วต่อใหม่ให้อัตโนมัติ
+    """
+
+    def __init__(self, connect=_connect):
+        self._connect = connect
+        self._channels = {}
+        self._guard = threading.Lock()
+
+    def _channel(self, ip):
+        with self._guard:
+            ch = self._channels.get(ip)
+            if ch is None:
+                ch = self._channels[ip] = _Channel()
+            return ch
+
+    @staticmethod
+    def _drop(ch):
+        conn, ch.conn = ch.conn, None
+        if conn is None:
+            return
+        try:
+            conn.disconnect()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _usable(ch, settings):
+        if ch.conn is None or ch.settings != settings:
+            return False
+        try:
+            return ch.conn.is_alive() and bool(ch.conn.find_prompt())
+        except Exception:
+            return False
+
+    @contextmanager
+    def session(self, ip):
+        """
+        yield: (conn, settings, reused)
+        """
+        ch = self._channel(ip)
+        with ch.lock:
+            settings = device_settings(ip)
+            with tracing.span("health_check", method="netmiko", router=ip):
+                reused = self._usable(ch, settings)
+            if not reused:
+                self._drop(ch)
+                with tracing.span("connect", method="netmiko", router=ip):
+                    ch.conn = self._connect(ip, settings)
+                ch.settings = settings
+            try:
+                yield ch.conn, settings, reused
+            except _BROKEN_CHANNEL_ERRORS:
+                self._drop(ch)
+                raise
+
+    def run(self, ip, fn):
+        """
+        เรียก fn(conn, settings) บน channel ของ router นี้
+        ถ้า channel เดิมตาย (stale) จะต่อใหม่แล้วลองอีก 1 ครั้ง
+        """
+        reused = False
+        try:
+            with self.session(ip) as (conn, settings, reused):
+                with tracing.span("rpc", method="netmiko", router=ip):
+                    return fn(conn, settings)
+        except _BROKEN_CHANNEL_ERRORS:
+            if not reused:
+                raise
+        with self.session(ip) as (conn, settings, _):
+            with tracing.span("rpc", method="netmiko", router=ip):
+                return fn(conn, settings)
+
+    def disconnect(self, ip):
+        ch = self._channel(ip)
+        with ch.lock:
+            self._drop(ch)
+
+    def close_all(self):
+        with self._guard:
+            channels = list(self._channels.values())
+        for ch in channels:
+            with ch.lock:
+                self._drop(ch)
+
+
+_manager = NetmikoConnectionManager()
+
+
 def _parse_banner_from_run(run_text: str):
     """
     ดึงข้อความ banner motd จาก show running-config
     รูปแบบทั่วไป:
+      banner motd ^C<ข้อความหลายบรรทัด>^C   (IOS แสดง delimiter เป็น ^C เสมอ)
       banner motd ^<ข้อความหลายบรรทัด>^
     หรือใช้ delimiter ตัวอื่น เช่น @, #, $, !
     """
     # หา 'banner motd <delim>...<delim>' แบบ DOTALL
-    m = re.search(r"^banner\s+motd\s+(\S)\n?(.*?)\1\s*$",
+    m = re.search(r"^banner\s+motd\s+(\^C|\S)\n?(.*?)\1\s*$",
                   run_text, flags=re.MULTILINE | re.DOTALL)
     if not m:
         # บางเครื่องอาจขึ้นบรรทัดเดียว: banner motd ^ข้อความ^
-        m = re.search(r"^banner\s+motd\s+(\S)(.*?)\1\s*$",
+        m = re.search(r"^banner\s+motd\s+(\^C|\S)(.*?)\1\s*$",
                       run_text, flags=re.MULTILINE | re.DOTALL)
     if not m:
         return None
@@ -38,32 +207,209 @@ def _parse_banner_from_run(run_text: str):
     body = body.strip("\n")
     return body.strip()
 
+
+def _prompt_pattern(conn):
+    """
+    รอจนเจอ prompt ของเครื่องนี้ (เช่น R1#) แทน "#" เฉย ๆ
+    ไม่งั้น config ที่มี # (description, banner delimiter) จะตัด output กลางทาง
+    """
+    base = getattr(conn, "base_prompt", None)
+    if base:
+        return re.escape(base) + r"[>#]"
+    return r"#|\$"
+
+
+def _show_run_on(conn, settings):
+    return conn.send_command("show running-config", expect_string=_prompt_pattern(conn),
+                             read_timeout=settings["read_timeout"] * settings["showrun_delay_factor"])
+
+
+def get_running_config(ip: str, use_cache=True) -> str:
+    """
+    show running-config ของ router (ใช้ snapshot ใน running_config_cache ถ้ายังไม่เก่า)
+    error ของการเชื่อมต่อโยนต่อให้ผู้เรียก
+    """
+    if use_cache:
+        return running_config_cache.get_or_fetch(ip, lambda: _manager.run(ip, _show_run_on))
+    generation = running_config_cache.generation(ip)
+    text = _manager.run(ip, _show_run_on)
+    running_config_cache.put(ip, text, generation)
+    return text
+
+
+def hostname_from_config(run_text: str):
+    """ชื่อเครื่องจากบรรทัด 'hostname X' ใน running-config (ไม่มี => None)"""
+    m = re.search(r"^hostname\s+(\S+)", run_text or "", flags=re.MULTILINE)
+    return m.group(1) if m else None
+
+
+def _write_stream(path: str, chunks):
+    """
+    เขียนทีละ chunk ลงไฟล์ .tmp แล้วค่อย rename ทับของเดิม
+    => ไม่ต้องต่อ string ก้อนใหม่ทั้งไฟล์ และไม่มีไฟล์ครึ่ง ๆ ค้างถ้าพังกลางทาง
+    """
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="\n") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def save_running_config(ip: str, student_id: str, router_name: str = None, out_dir: str = ".") -> str:
+    """
+    backup running-config ของ router ลงไฟล์ show_run_<studentID>_<router_name>.txt
+    (ชื่อเดียวกับที่ playbook_showrun.yaml เขียน)
+      - ดึงสดผ่าน channel ที่ค้างใน _manager (ไม่ใช้ snapshot เก่า แต่เก็บผลลง snapshot ให้คำสั่งอื่น)
+      - router_name ไม่ระบุ => ใช้ hostname ใน config, ไม่มีก็ใช้ IP
+    คืนค่า path ของไฟล์, error ของการเชื่อมต่อโยนต่อให้ผู้เรียก
+    """
+    text = get_running_config(ip, use_cache=False)
+    name = router_name or hostname_from_config(text) or ip
+    path = os.path.join(out_dir, f"show_run_{student_id}_{name}.txt")
+    lines = text.replace("\r\n", "\n").splitlines(keepends=True)
+    _write_stream(path, lines)
+    return path
+
+
+def _read_motd_on(conn, settings, ip=None):
+    # ถ้ามี enable: conn.enable()
+
+    # 1) ลอง show banner motd (ถ้ามีจะตอบข้อความตรง ๆ)
+    out = conn.send_command("show banner motd", expect_string=_prompt_pattern(conn),
+                            read_timeout=settings["read_timeout"])
+    if out and "No banner configured" not in out and "% No" not in out:
+        # ทำความสะอาด
+        msg = out.strip()
+        # บางรุ่นอาจใส่ prompt ปิดท้าย ตัดบรรทัด prompt ออกถ้าจำเป็น
+        return msg
+
+    # 2) fallback: อ่านจาก show running-config แล้ว regex เอาเฉพาะตัวข้อความ
+    #    (เก็บเป็น snapshot ไว้ให้คำสั่งอ่านอื่น ๆ ใช้ต่อ)
+    generation = running_config_cache.generation(ip) if ip else None
+    run = _show_run_on(conn, settings)
+    if ip:
+        running_config_cache.put(ip, run, generation)
+    motd = _parse_banner_from_run(run)
+    if motd:
+        return motd
+
+    return "Error: No MOTD Configured"
+
+
 def read_motd(ip: str) -> str:
     """
     คืนค่า:
       - ข้อความ MOTD (string) เมื่อพบ
       - "Error: No MOTD Configured" เมื่อไม่พบ
       - "Error: <รายละเอียด>" เมื่อมีข้อผิดพลาด
+    ใช้ channel ที่ค้างไว้ใน _manager (ไม่ต้อง login SSH ใหม่ทุกครั้ง)
+    ถ้ามี running-config snapshot ที่ยังสด อ่าน banner จาก snapshot เลย ไม่แตะอุปกรณ์
     """
+    snapshot = running_config_cache.get(ip)
+    if snapshot is not None:
+        return _parse_banner_from_run(snapshot) or "Error: No MOTD Configured"
     try:
-        conn = _connect(ip)
-        # ถ้ามี enable: conn.enable()
+        return device_reads.do(device_reads.key("netmiko", ip, "motd"),
+                               lambda: _manager.run(ip, lambda conn, settings: _read_motd_on(conn, settings, ip)))
+    except Exception as e:
+        return f"Error: {e}"
+
+
+# ------------------------------
+# gigabit_status (show ip interface brief + TextFSM)
+# ------------------------------
+_IP_INT_BRIEF_TEMPLATE = "cisco_ios_show_ip_interface_brief.textfsm"
+_BRIEF_LINE = re.compile(
+    r"^(?P<INTERFACE>\S+)\s+(?P<IP_ADDRESS>\S+)\s+\w+\s+\w+\s+"
+    r"(?P<STATUS>up|down|administratively down|deleted)\s+(?P<PROTO>up|down)\s*$",
+    flags=re.MULTILINE,
+)
+
+
+class _TemplateParser:
+    """
+    compile template ของ ntc_templates ครั้งเดียวต่อ process แล้วใช้ซ้ำ
+    (send_command(use_textfsm=True) ของ Netmiko อ่าน+compile template ใหม่ทุกครั้ง)
+    TextFSM object เก็บ state ระหว่าง parse => Reset + ParseText ต้องถือ lock
+    ไม่มี ntc_templates/textfsm => ใช้ regex ที่เทียบเท่า template แทน
+    """
+
+    def __init__(self, template_name, fallback):
+        self.template_name = template_name
+        self.fallback = fallback
+        self._fsm = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        self._loaded = True
+        try:
+            import ntc_templates
+            import textfsm
+        except ImportError:
+            return
+        template_dir = os.path.join(os.path.dirname(ntc_templates.__file__), "templates")
+        try:
+            with open(os.path.join(template_dir, self.template_name), encoding="utf-8") as f:
+                self._fsm = textfsm.TextFSM(f)
+        except OSError:
+            self._fsm = None
+
+    def parse(self, text: str) -> list:
+        """คืนค่า list ของ dict (key = ชื่อ Value ใน template)"""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if self._fsm is not None:
+                self._fsm.Reset()
+                rows = self._fsm.ParseText(text)
+                return [dict(zip(self._fsm.header, row)) for row in rows]
+        return [m.groupdict() for m in self.fallback.finditer(text)]
 
-        # 1) ลอง show banner motd (ถ้ามีจะตอบข้อความตรง ๆ)
-        out = conn.send_command("show banner motd", expect_string=r"#|\$")
-        if out and "No banner configured" not in out and "% No" not in out:
-            # ทำความสะอาด
-            msg = out.strip()
-            # บางรุ่นอาจใส่ prompt ปิดท้าย ตัดบรรทัด prompt ออกถ้าจำเป็น
-            return msg
 
-        # 2) fallback: อ่านจาก show running-config แล้ว regex เอาเฉพาะตัวข้อความ
-        run = conn.send_command("show running-config", expect_string=r"#|\$", delay_factor=2)
-        motd = _parse_banner_from_run(run)
-        if motd:
-            return motd
+_ip_int_brief = _TemplateParser(_IP_INT_BRIEF_TEMPLATE, _BRIEF_LINE)
 
-        return "Error: No MOTD Configured"
 
+def format_gigabit_status(rows) -> str:
+    """
+    GigabitEthernet1 up, GigabitEthernet2 administratively down, ... -> 1 up, 0 down, 1 administratively down
+    """
+    parts = []
+    counts = {"up": 0, "down": 0, "administratively down": 0}
+    for row in rows:
+        name = row["INTERFACE"]
+        if not name.startswith("GigabitEthernet"):
+            continue
+        status = row["STATUS"]
+        parts.append(f"{name} {status}")
+        if status in counts:
+            counts[status] += 1
+    summary = ", ".join(f"{n} {status}" for status, n in counts.items())
+    return f"{', '.join(parts)} -> {summary}"
+
+
+def _gigabit_status_on(conn, settings):
+    out = conn.send_command("show ip interface brief", expect_string=_prompt_pattern(conn),
+                            read_timeout=settings["read_timeout"])
+    return _ip_int_brief.parse(out)
+
+
+def gigabit_status(ip: str) -> str:
+    """
+    สถานะ GigabitEthernet ทุกตัวของ router ในรูปแบบตาม README
+    ใช้คำสั่งเดียว (show ip interface brief) บน channel ที่ค้างใน _manager
+    คืนค่า "Error: <รายละเอียด>" เมื่อมีข้อผิดพลาด
+    """
+    try:
+        rows = device_reads.do(device_reads.key("netmiko", ip, "gigabit_status"),
+                               lambda: _manager.run(ip, _gigabit_status_on))
     except Exception as e:
         return f"Error: {e}"
+    if not any(row["INTERFACE"].startswith("GigabitEthernet") for row in rows):
+        return "Error: No GigabitEthernet interface found"
+    return format_gigabit_status(rows)
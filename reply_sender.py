@@ -0,0 +1,262 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import tracing
+from message_poller import retry_after_seconds
+
+# อัตราส่งข้อความเข้า Webex (ข้อความ/วินาที) และจำนวนที่ส่งติดกันได้ทันทีก่อนโดนจำกัด
+# ค่าเริ่มต้นใช้เฉพาะหลังโดน 429: ปกติส่งเต็มที่ (เหมือนไม่มีคิว) เพราะ Webex ไม่ได้จำกัดที่ระดับนี้
+# โดน 429 => หยุดตาม Retry-After แล้วส่งตามอัตรานี้ต่อไปอีก REPLY_THROTTLE_HOLD วินาทีนับจาก 429 ครั้งล่าสุด
+REPLY_RATE = float(os.getenv("BOT_REPLY_RATE", "1"))
+REPLY_BURST = int(os.getenv("BOT_REPLY_BURST", "5"))
+REPLY_THROTTLE_HOLD = float(os.getenv("BOT_REPLY_THROTTLE_HOLD", "60"))
+# BOT_REPLY_THROTTLE=always => จำกัดอัตราตลอดเวลา ไม่รอให้โดน 429 ก่อน
+REPLY_ALWAYS_THROTTLE = os.getenv("BOT_REPLY_THROTTLE", "after_429") == "always"
+# รอรวมคำตอบ text ที่ไปห้องเดียวกันไว้นานเท่านี้ก่อนส่ง (วินาที)
+# 0 (ค่าเริ่มต้น) = ไม่รวมเลย ส่ง 1 คำตอบต่อ 1 ข้อความเหมือนเดิม แค่เว้นจังหวะตาม rate limit
+REPLY_MERGE_WINDOW = float(os.getenv("BOT_REPLY_MERGE_WINDOW", "0"))
+# ข้อความรวมยาวไม่เกินนี้ (Webex รับ text ได้ราว 7439 bytes)
+REPLY_MAX_CHARS = int(os.getenv("BOT_REPLY_MAX_CHARS", "7000"))
+REPLY_MAX_ATTEMPTS = int(os.getenv("BOT_REPLY_MAX_ATTEMPTS", "5"))
+
+
+class TokenBucket:
+    """
+    token bucket แบบเรียกจาก thread เดียว (thread ส่งข้อความ)
+      delay(): ต้องรออีกกี่วินาทีจึงมี token (0 = มีแล้ว), take(): ใช้ 1 token
+      pause(): งดส่งจนครบเวลาที่กำหนดแล้วเริ่มเติม token จาก 0
+        limit=True (โดน 429) => จำกัดอัตราต่อไปอีก hold วินาทีหลังหยุดเสร็จ
+      hold=None: จำกัดอัตราตลอดเวลา, ตัวเลข: ไม่จำกัดจนกว่าจะโดน 429
+    """
+
+    def __init__(self, rate, burst, hold=None):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.hold = hold
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._limited_until = 0.0
+
+    def limited(self, now=None) -> bool:
+        return self.hold is None or (now or time.monotonic()) < self._limited_until
+
+    def _refill(self, now):
+        if now > self._updated:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if not self.limited(now):
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        now = time.monotonic()
+        if not self.limited(now):
+            self.tokens, self._updated = float(self.burst), now
+            return
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds, limit=True):
+        self._paused_until = time.monotonic() + seconds
+        self.tokens = 0.0
+        self._updated = self._paused_until
+        if limit and self.hold is not None:
+            self._limited_until = max(self._limited_until, self._paused_until + self.hold)
+
+
+class _Reply:
+    __slots__ = ("room_id", "text", "files", "future", "attempts", "queued")
+
+    def __init__(self, room_id, text=None, files=None, future=None):
+        self.room_id = room_id
+        self.text = text
+        self.files = files
+        self.future = future  # barrier: ไม่มี room_id => ไม่ส่งอะไร แค่ set future เมื่อถึงคิว
+        self.attempts = 0
+        self.queued = time.monotonic()
+
+    @property
+    def mergeable(self) -> bool:
+        return self.room_id is not None and not self.files and self.text is not None
+
+
+class ReplySender:
+    """
+    คิวข้อความขาออกไป Webex ส่งจาก thread เบื้องหลัง 1 ตัว (ไม่ขวาง worker ของคำสั่ง)
+      - ส่งตามลำดับที่ submit เสมอ
+      - โดน 429 => หยุดตาม Retry-After แล้วจำกัดอัตราด้วย token bucket (rate, burst) ต่ออีก hold วินาที
+        (hold=None => จำกัดอัตราตลอดเวลา)
+      - merge (ค่าเริ่มต้น = merge_window > 0): text ที่ต่อกันในคิวและไปห้องเดียวกัน
+        รวมเป็นข้อความเดียว (ยาวไม่เกิน max_chars) => ช่วงคำสั่งมาเป็นชุด ไม่ต้องยิง HTTP ทีละคำตอบ
+        ปิดอยู่ => ส่งทีละคำตอบ (1 คำสั่ง = 1 ข้อความ)
+      - ส่งไม่สำเร็จ => ลองใหม่ (429 รอตาม Retry-After, อื่น ๆ รอ 1, 2, 4... วินาที) ครบ max_attempts แล้วทิ้ง
+    send(room_id, **kwargs): ฟังก์ชันที่ส่งจริง เช่น api.messages.create(roomId=room_id, **kwargs)
+    """
+
+    def __init__(self, send, rate=REPLY_RATE, burst=REPLY_BURST, merge_window=REPLY_MERGE_WINDOW,
+                 max_chars=REPLY_MAX_CHARS, max_attempts=REPLY_MAX_ATTEMPTS, merge=None,
+                 hold=None if REPLY_ALWAYS_THROTTLE else REPLY_THROTTLE_HOLD):
+        self._send = send
+        self.bucket = TokenBucket(rate, burst, hold)
+        self.merge_window = merge_window
+        self.merge = merge_window > 0 if merge is None else merge
+        self.max_chars = max_chars
+        self.max_attempts = max_attempts
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self.sent = 0      # จำนวน HTTP post ที่สำเร็จ
+        self.merged = 0    # จำนวนคำตอบที่ถูกรวมเข้ากับข้อความอื่น (ไม่ต้อง post แยก)
+        self.dropped = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="reply-sender", daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, room_id, text=None, files=None):
+        with self._cond:
+            self._queue.append(_Reply(room_id, text, files))
+            self._cond.notify()
+
+    def barrier(self) -> Future:
+        """Future ที่เสร็จเมื่อข้อความทุกอันที่ submit ก่อนหน้านี้ ส่งแล้ว (หรือถูกทิ้ง)"""
+        future = Future()
+        with self._cond:
+            self._queue.append(_Reply(None, future=future))
+            self._cond.notify()
+        return future
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(1 for item in self._queue if item.room_id is not None)
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "merged": self.merged, "dropped": self.dropped, "pending": self.pending()}
+
+    def stop(self, timeout=10):
+        """ส่งที่ค้างในคิวให้หมด (ไม่เกิน timeout วินาที) แล้วหยุด thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.pending():
+            print(f"\n[REPLY] {self.pending()} replies not sent before shutdown")
+
+    # ------------------------------
+    # thread ส่งข้อความ
+    # ------------------------------
+    def _wait(self, seconds):
+        """นอนแบบตื่นได้เมื่อมีของใหม่เข้าคิว/สั่งหยุด (คืนค่า False เมื่อกำลังหยุด)"""
+        with self._cond:
+            if not self._stopping:
+                self._cond.wait(seconds)
+            return not self._stopping
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                first = self._queue[0]
+                stopping = self._stopping
+            if first.room_id is None:
+                self._release_barriers()
+                continue
+
+            if self.merge and first.mergeable and self.merge_window > 0 and not stopping:
+                deadline = first.queued + self.merge_window
+                while time.monotonic() < deadline and self._wait(deadline - time.monotonic()):
+                    pass
+            # ระหว่างรอ token ข้อความใหม่เข้าคิวได้ => ถูกรวมไปกับชุดนี้ (เมื่อเปิด merge)
+            delay = self.bucket.delay()
+            if delay > 0:
+                with tracing.span("rate_limit_wait"):
+                    if not self._wait(delay) and self.bucket.delay() > 0:
+                        # กำลังปิดบอท: ยังส่งได้แต่ต้องเคารพ Retry-After/อัตรา
+                        time.sleep(self.bucket.delay())
+                continue
+
+            batch = self._take_batch()
+            self._deliver(batch)
+
+    def _take_batch(self):
+        """ข้อความหัวคิว + text ที่ต่อกันไปห้องเดียวกันถ้าเปิด merge (barrier ที่คั่นอยู่ติดไปด้วย)"""
+        with self._cond:
+            batch = [self._queue.popleft()]
+            if not (self.merge and batch[0].mergeable):
+                return batch
+            room, size = batch[0].room_id, len(batch[0].text)
+            while self._queue:
+                item = self._queue[0]
+                if item.room_id is None:
+                    batch.append(self._queue.popleft())
+                    continue
+                if not item.mergeable or item.room_id != room or size + 2 + len(item.text) > self.max_chars:
+                    break
+                size += 2 + len(item.text)
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _deliver(self, batch):
+        replies = [item for item in batch if item.room_id is not None]
+        head = replies[0]
+        kwargs = {"text": "\n\n".join(item.text for item in replies)} if head.mergeable else {}
+        if not head.mergeable:
+            if head.text is not None:
+                kwargs["text"] = head.text
+            if head.files:
+                kwargs["files"] = head.files
+
+        self.bucket.take()
+        head.attempts += 1
+        try:
+            with tracing.span("webex_reply"):
+                self._send(head.room_id, **kwargs)
+        except Exception as e:
+            wait = retry_after_seconds(e)
+            if head.attempts >= self.max_attempts:
+                print(f"\n[REPLY ERROR] Giving up after {head.attempts} attempts: {e}")
+                self.dropped += len(replies)
+                tracing.registry.inc("bot_replies_dropped_total", len(replies))
+            else:
+                if wait is not None:
+                    print(f"\n[RATE LIMIT] Replies paused {wait:.0f}s")
+                    tracing.registry.inc("bot_reply_rate_limited_total")
+                    self.bucket.pause(wait)
+                else:
+                    print(f"\n[REPLY ERROR] {e} (retrying)")
+                    self.bucket.pause(min(30.0, 2.0 ** (head.attempts - 1)), limit=False)
+                # ใส่กลับหัวคิวตามลำดับเดิม (รอบหน้าอาจรวมกับข้อความที่มาเพิ่ม)
+                with self._cond:
+                    self._queue.extendleft(reversed(batch))
+                return
+        else:
+            self.sent += 1
+            self.merged += len(replies) - 1
+            if len(replies) > 1:
+                tracing.registry.inc("bot_replies_merged_total", len(replies) - 1)
+        for item in batch:
+            if item.future is not None:
+                item.future.set_result(None)
+
+    def _release_barriers(self):
+        with self._cond:
+            while self._queue and self._queue[0].room_id is None:
+                self._queue.popleft().future.set_result(None)
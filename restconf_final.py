@@ -1,8 +1,25 @@
+import asyncio
+import contextvars
 import json
+import os
+import time
+from urllib.parse import urlsplit
+
 import requests
 from requests.auth import HTTPBasicAuth
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
+import async_loop
+import tracing
+from inventory import router_inventory
+from singleflight import device_reads
+from state_cache import cached_interface_status, interface_cache, running_config_cache
+
+try:
+    import aiohttp  # optional: ไม่มี => ใช้ requests ใน thread pool แทน (ผลเหมือนกัน)
+except ImportError:
+    aiohttp = None
+
 # ปิดคำเตือนเรื่อง cert self-signed
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
@@ -10,27 +27,146 @@ ROUTER_USER = "admin"
 ROUTER_PASS = "cisco"
 TIMEOUT = 15  # วินาที
 
+# Optimistic writes: ไม่ GET ก่อนเขียน ยิงคำสั่งเขียนเลยแล้วแปลผลจาก status code
+#   create  => POST ไปที่ collection (มีอยู่แล้ว = 409)
+#   delete  => DELETE (ไม่มี = 404)
+#   enable/disable => PATCH + If-Match: * (ไม่มี = 404/412, ไม่สร้าง interface ใหม่)
+# ตั้ง RESTCONF_OPTIMISTIC=0 เพื่อกลับไปใช้แบบ GET ก่อนเขียน
+OPTIMISTIC_WRITES = os.getenv("RESTCONF_OPTIMISTIC", "1") != "0"
+# enable/disable แบบ PATCH + If-Match: * ยังไม่ได้ยืนยันกับ IOS-XE จริง
+# (ถ้าอุปกรณ์ไม่สน If-Match, PATCH แบบ merge จะสร้าง Loopback ใหม่) => ปิดไว้ก่อน ใช้ GET ก่อนเขียน
+# ตั้ง RESTCONF_OPTIMISTIC_STATE=1 เพื่อเปิด (มีผลเมื่อ OPTIMISTIC_WRITES เปิดอยู่ด้วย)
+OPTIMISTIC_STATE_WRITES = os.getenv("RESTCONF_OPTIMISTIC_STATE", "0") == "1"
+
+# จำนวน HTTP connection ที่เปิดพร้อมกันได้ (ทั้งหมด / ต่อ router)
+# request ที่เกินจะรอคิวใน event loop ไม่กิน thread
+MAX_CONNECTIONS = int(os.getenv("RESTCONF_MAX_CONNECTIONS", "100"))
+PER_HOST_CONNECTIONS = int(os.getenv("RESTCONF_PER_HOST_CONNECTIONS", "4"))
+
 # เตรียม Session ใช้ซ้ำทุกคำขอ
 _session = requests.Session()
 _session.verify = False  # สำคัญ! กัน SSL: CERTIFICATE_VERIFY_FAILED
-_session.auth = HTTPBasicAuth(ROUTER_USER, ROUTER_PASS)
 _session.headers.update({
     "Accept": "application/yang-data+json"
 })
 
+def _trace_response(r, *args, **kwargs):
+    """
+    response hook: บันทึกเวลา request -> ได้ header กลับ (r.elapsed) เป็น span "rpc"
+    (request ที่ error ก่อนได้ response จะไม่ถูกนับ)
+    """
+    router = r.url.split("/", 3)[2] if "://" in r.url else ""
+    tracing.record("rpc", r.elapsed.total_seconds(), r.status_code >= 500,
+                   method="restconf", router=router)
+
+_session.hooks["response"].append(_trace_response)
+
+# ------------------------------
+# ค่าต่อเครื่องจาก inventory
+# ------------------------------
+def _credentials(router_ip: str):
+    """(username, password) จาก inventory (ansible_user/ansible_password) ไม่มี => ROUTER_USER/ROUTER_PASS"""
+    device = router_inventory.by_ip(router_ip)
+    if device is None:
+        return ROUTER_USER, ROUTER_PASS
+    return device.username or ROUTER_USER, device.password or ROUTER_PASS
+
+def _base_url(router_ip: str) -> str:
+    """https://<ip>[:restconf_port] (restconf_port จาก inventory ไม่ระบุ => 443)"""
+    device = router_inventory.by_ip(router_ip)
+    port = device.get("restconf_port") if device is not None else None
+    return f"https://{router_ip}:{port}" if port else f"https://{router_ip}"
+
+# ------------------------------
+# Async transport (aiohttp ถ้ามี, ไม่งั้น requests ใน thread pool)
+# ------------------------------
+_REQUEST_ERRORS = (requests.RequestException, asyncio.TimeoutError) + (
+    (aiohttp.ClientError,) if aiohttp is not None else ()
+)
+
+class _Response:
+    """ผลตอบกลับที่อ่าน body ครบแล้ว (หน้าตาเดียวกันทั้งจาก aiohttp และ requests)"""
+
+    __slots__ = ("status_code", "text")
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+_aio_session = None
+_host_slots = {}  # router -> asyncio.Semaphore (ใช้กับทาง requests)
+
+def _get_aio_session():
+    global _aio_session
+    if _aio_session is None or _aio_session.closed:
+        _aio_session = aiohttp.ClientSession(
+            headers={"Accept": "application/yang-data+json"},
+            connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS, limit_per_host=PER_HOST_CONNECTIONS,
+                                           ssl=False),
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+            trust_env=_session.trust_env,  # อ่าน proxy จาก env เหมือน _session (ปิดได้ที่ _session.trust_env)
+        )
+    return _aio_session
+
+async def _close_aio_session():
+    global _aio_session
+    session, _aio_session = _aio_session, None
+    _host_slots.clear()
+    if session is not None and not session.closed:
+        await session.close()
+
+async_loop.on_shutdown(_close_aio_session)
+
+async def _request(method, url, headers=None, data=None) -> _Response:
+    """
+    ยิง 1 request บน loop กลาง (async_loop) แล้วคืน _Response
+    error ของการเชื่อมต่อโยนเป็นชนิดใดชนิดหนึ่งใน _REQUEST_ERRORS
+    """
+    parts = urlsplit(url)
+    router = parts.netloc
+    username, password = _credentials(parts.hostname)
+    if aiohttp is None:
+        # requests เป็น blocking => ยกไปรันใน thread pool, จำกัดต่อ router ด้วย semaphore
+        slot = _host_slots.get(router)
+        if slot is None:
+            slot = _host_slots[router] = asyncio.Semaphore(PER_HOST_CONNECTIONS)
+        async with slot:
+            ctx = contextvars.copy_context()  # ให้ response hook เห็น trace ของคำสั่งนี้
+            r = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: ctx.run(_session.request, method, url, headers=headers, data=data,
+                                      auth=HTTPBasicAuth(username, password), timeout=TIMEOUT))
+        return _Response(r.status_code, r.text)
+
+    t0 = time.perf_counter()
+    async with _get_aio_session().request(method, url, headers=headers, data=data,
+                                              auth=aiohttp.BasicAuth(username, password)) as resp:
+        # span "rpc" = request -> ได้ header กลับ (เทียบเท่า r.elapsed ของ requests)
+        tracing.record("rpc", time.perf_counter() - t0, resp.status >= 500,
+                       method="restconf", router=router)
+        return _Response(resp.status, await resp.text())
+
 def _if_res_path(router_ip: str, interface_name: str) -> str:
     """
     เส้นทาง resource อินเทอร์เฟซหนึ่งตัว (RESTCONF data resource)
     """
-    return f"https://{router_ip}/restconf/data/ietf-interfaces:interfaces/interface={interface_name}"
+    return f"{_base_url(router_ip)}/restconf/data/ietf-interfaces:interfaces/interface={interface_name}"
 
 def _interfaces_collection(router_ip: str) -> str:
     """
-    เส้นทางคอลเลกชัน interfaces (เผื่อใช้ POST ถ้าต้องการ)
+    เส้นทางคอลเลกชัน interfaces (ใช้ POST ตอน optimistic create)
     """
-    return f"https://{router_ip}/restconf/data/ietf-interfaces:interfaces"
+    return f"{_base_url(router_ip)}/restconf/data/ietf-interfaces:interfaces"
+
+def get_interface_status(router_ip, interface_name, use_cache=True):
+    return async_loop.run(_get_interface_status(router_ip, interface_name, use_cache))
 
-def get_interface_status(router_ip, interface_name):
+async def get_interface_status_async(router_ip, interface_name, use_cache=True):
+    return await async_loop.call(_get_interface_status(router_ip, interface_name, use_cache))
+
+async def _get_interface_status(router_ip, interface_name, use_cache=True):
     """
     ตรวจสอบสถานะของ interface
     Returns:
@@ -38,11 +174,23 @@ def get_interface_status(router_ip, interface_name):
         - "exists_disabled"
         - "not_exists"
         - "error"
+    use_cache=True: ถ้ามีใน interface_cache หรือ running-config snapshot (ยังไม่หมดอายุ) ตอบเลยโดยไม่ยิง GET
     """
+    if use_cache:
+        cached = cached_interface_status(router_ip, interface_name)
+        if cached is not None:
+            return cached
+    # คำถามเดียวกันที่ยังรอ GET อยู่ => รอผลเดียวกัน ไม่ยิงซ้ำ
+    status = await device_reads.do_async(device_reads.key("restconf", router_ip, "status", interface_name),
+                                         lambda: _fetch_interface_status(router_ip, interface_name))
+    interface_cache.put(router_ip, interface_name, status)
+    return status
+
+async def _fetch_interface_status(router_ip, interface_name):
     url = _if_res_path(router_ip, interface_name)
     try:
-        r = _session.get(url, timeout=TIMEOUT)
-    except requests.RequestException as e:
+        r = await _request("GET", url)
+    except _REQUEST_ERRORS as e:
         print(f"[RESTCONF][status] Request error: {e}")
         return "error"
 
@@ -72,6 +220,17 @@ def get_interface_status(router_ip, interface_name):
         print(f"[RESTCONF][status] HTTP {r.status_code}: {r.text[:300]}")
         return "error"
 
+async def _precheck(router_ip, interface_name, optimistic=None):
+    """
+    สถานะก่อนเขียน:
+      - optimistic: ดูแค่ cache (miss => None แล้วให้ status code ของการเขียนตัดสินเอง)
+      - ปกติ: get_interface_status (cache หรือ GET)
+    optimistic ไม่ส่ง => OPTIMISTIC_WRITES
+    """
+    if OPTIMISTIC_WRITES if optimistic is None else optimistic:
+        return cached_interface_status(router_ip, interface_name)
+    return await _get_interface_status(router_ip, interface_name)
+
 def _calc_ip_from_student_id(student_id: str):
     last_3 = student_id[-3:]
     x = int(last_3[0])
@@ -79,15 +238,22 @@ def _calc_ip_from_student_id(student_id: str):
     return f"172.{x}.{y}.1", "255.255.255.0"
 
 def create_interface(router_ip, student_id):
+    return async_loop.run(_create_interface(router_ip, student_id))
+
+async def create_interface_async(router_ip, student_id):
+    return await async_loop.call(_create_interface(router_ip, student_id))
+
+async def _create_interface(router_ip, student_id):
     """
-    สร้าง Loopback interface ด้วย PUT ไปที่ resource โดยตรง
-    (idempotent, คาดเดาได้)
+    สร้าง Loopback interface
+      - optimistic: POST ไปที่ collection ครั้งเดียว (409 = มีอยู่แล้ว)
+      - ปกติ: เช็กก่อนแล้ว PUT ไปที่ resource โดยตรง (idempotent, คาดเดาได้)
     """
     interface_name = f"Loopback{student_id}"
 
     # เช็กก่อน
-    status = get_interface_status(router_ip, interface_name)
-    if status not in ("not_exists", "error"):
+    status = await _precheck(router_ip, interface_name)
+    if status not in ("not_exists", "error", None):
         return f"Cannot create: Interface {interface_name}"
 
     ip_address, netmask = _calc_ip_from_student_id(student_id)
@@ -108,83 +274,144 @@ def create_interface(router_ip, student_id):
     }
 
     try:
-        r = _session.put(
-            url,
-            headers={"Content-Type": "application/yang-data+json"},
-            data=json.dumps(payload),
-            timeout=TIMEOUT,
-        )
-    except requests.RequestException as e:
+        with running_config_cache.writing(router_ip):
+            if OPTIMISTIC_WRITES:
+                r = await _request(
+                    "POST",
+                    _interfaces_collection(router_ip),
+                    headers={"Content-Type": "application/yang-data+json"},
+                    data=json.dumps(payload),
+                )
+            else:
+                r = await _request(
+                    "PUT",
+                    url,
+                    headers={"Content-Type": "application/yang-data+json"},
+                    data=json.dumps(payload),
+                )
+    except _REQUEST_ERRORS as e:
+        interface_cache.invalidate(router_ip, interface_name)
         return f"Error creating interface (Restconf): {e}"
 
     # 201 Created (หรือบางรุ่น 204 No Content ถ้า replace ได้)
     if r.status_code in (200, 201, 204):
+        interface_cache.put(router_ip, interface_name, "exists_enabled")
         return f"Interface {interface_name} is created successfully using Restconf"
 
     # 409 Conflict => มีอยู่แล้ว (ถือว่าสร้างสำเร็จหรือแจ้งเตือนตามตรง)
     if r.status_code == 409:
+        interface_cache.invalidate(router_ip, interface_name)
         return f"Cannot create: Interface {interface_name}"
 
     # อื่น ๆ แสดงข้อความจากอุปกรณ์ (ถ้ามี)
+    interface_cache.invalidate(router_ip, interface_name)
     return f"Error: Router rejected config ({r.status_code}) for {interface_name}. {r.text[:300]}"
 
 def delete_interface(router_ip, student_id):
+    return async_loop.run(_delete_interface(router_ip, student_id))
+
+async def delete_interface_async(router_ip, student_id):
+    return await async_loop.call(_delete_interface(router_ip, student_id))
+
+async def _delete_interface(router_ip, student_id):
     interface_name = f"Loopback{student_id}"
 
-    # เช็กก่อน
-    status = get_interface_status(router_ip, interface_name)
+    # เช็กก่อน (optimistic: ดูแค่ cache แล้ว DELETE เลย, 404 = ไม่มี)
+    status = await _precheck(router_ip, interface_name)
     if status == "not_exists":
         return f"Cannot delete: Interface {interface_name}"
 
     url = _if_res_path(router_ip, interface_name)
     try:
-        r = _session.delete(url, timeout=TIMEOUT)
-    except requests.RequestException as e:
+        with running_config_cache.writing(router_ip):
+            r = await _request("DELETE", url)
+    except _REQUEST_ERRORS as e:
+        interface_cache.invalidate(router_ip, interface_name)
         return f"Error deleting interface (Restconf): {e}"
 
     if r.status_code == 204:
+        interface_cache.put(router_ip, interface_name, "not_exists")
         return f"Interface {interface_name} is deleted successfully using Restconf"
 
-    if r.status_code == 404:
+    # 404 หรือ 409 data-missing => ไม่มี interface นี้
+    if r.status_code == 404 or (r.status_code == 409 and "data-missing" in r.text):
+        interface_cache.put(router_ip, interface_name, "not_exists")
         return f"Cannot delete: Interface {interface_name}"
 
+    interface_cache.invalidate(router_ip, interface_name)
     return f"Delete failed: {r.status_code} {r.text[:300]}"
 
+def _interface_absent(r) -> bool:
+    """
+    คำตอบของการเขียนที่แปลว่า "ไม่มี interface นี้" (แต่ละรุ่น/แต่ละ method ตอบไม่เหมือนกัน)
+      404 Not Found, 409 (data-missing), 412 (If-Match: * ไม่ผ่าน), 400 missing-element
+    """
+    if r.status_code in (404, 409, 412):
+        return True
+    return r.status_code == 400 and "missing-element" in r.text
+
 def set_interface_state(router_ip, student_id, enabled: bool):
+    return async_loop.run(_set_interface_state(router_ip, student_id, enabled))
+
+async def set_interface_state_async(router_ip, student_id, enabled: bool):
+    return await async_loop.call(_set_interface_state(router_ip, student_id, enabled))
+
+async def _set_interface_state(router_ip, student_id, enabled: bool):
     """
-    เปิด/ปิด (enabled leaf) ด้วย PUT ไปยัง leaf-resource โดยตรง
+    เปิด/ปิด (enabled leaf)
+      - optimistic (OPTIMISTIC_STATE_WRITES): PATCH (merge) ไปที่ interface resource พร้อม If-Match: *
+        => อุปกรณ์ต้องมี interface อยู่แล้ว ไม่งั้นตอบ 404/412 (ไม่สร้างใหม่)
+      - ปกติ (ค่าเริ่มต้น): เช็กก่อนแล้ว PUT ไปยัง leaf-resource โดยตรง
+    อุปกรณ์ตอบว่าไม่มี interface (404/409/412, 400 missing-element) => "Cannot ..." เหมือน pre-check
     """
+    optimistic = OPTIMISTIC_WRITES and OPTIMISTIC_STATE_WRITES
     interface_name = f"Loopback{student_id}"
+    cannot = (
+        f"Cannot enable: Interface {interface_name}"
+        if enabled
+        else f"Cannot shutdown: Interface {interface_name}"
+    )
 
     # เช็กก่อน
-    status = get_interface_status(router_ip, interface_name)
+    status = await _precheck(router_ip, interface_name, optimistic)
     if status == "not_exists":
-        if enabled:
-            return f"Cannot enable: Interface {interface_name}"
-        else:
-            return f"Cannot shutdown: Interface {interface_name}"
-
-    url = _if_res_path(router_ip, interface_name) + "/enabled"
-    payload = {"ietf-interfaces:enabled": bool(enabled)}
+        return cannot
 
     try:
-        r = _session.put(
-            url,
-            headers={"Content-Type": "application/yang-data+json"},
-            data=json.dumps(payload),
-            timeout=TIMEOUT,
-        )
-    except requests.RequestException as e:
+        with running_config_cache.writing(router_ip):
+            if optimistic:
+                r = await _request(
+                    "PATCH",
+                    _if_res_path(router_ip, interface_name),
+                    headers={"Content-Type": "application/yang-data+json", "If-Match": "*"},
+                    data=json.dumps({"ietf-interfaces:interface": {
+                        "name": interface_name, "enabled": bool(enabled),
+                    }}),
+                )
+            else:
+                r = await _request(
+                    "PUT",
+                    _if_res_path(router_ip, interface_name) + "/enabled",
+                    headers={"Content-Type": "application/yang-data+json"},
+                    data=json.dumps({"ietf-interfaces:enabled": bool(enabled)}),
+                )
+    except _REQUEST_ERRORS as e:
+        interface_cache.invalidate(router_ip, interface_name)
         return f"Error setting interface state: {e}"
 
     if r.status_code in (200, 204):
+        interface_cache.put(router_ip, interface_name,
+                            "exists_enabled" if enabled else "exists_disabled")
         return (
             f"Interface {interface_name} is enabled successfully using Restconf"
             if enabled
             else f"Interface {interface_name} is shutdowned successfully using Restconf"
         )
 
-    if r.status_code == 404:
-        return f"Set state failed: Interface {interface_name} not found"
+    if _interface_absent(r):
+        interface_cache.put(router_ip, interface_name, "not_exists")
+        # ข้อความเดียวกับตอนที่ pre-check บอกว่าไม่มี
+        return cannot
 
+    interface_cache.invalidate(router_ip, interface_name)
     return f"Set state failed: {r.status_code} {r.text[:300]}"
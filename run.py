@@ -1,20 +1,53 @@
 import os
-import time
+import queue
+from collections import OrderedDict
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from webexteamssdk import WebexTeamsAPI
 
-# Import ทุกไฟล์ที่เราจะใช้
-import restconf_final 
-import netconf_final
-import netmiko_final
-import ansible_final
+# backend (ncclient, netmiko, ansible ฯลฯ) โหลดตอนใช้ครั้งแรก => บอทพร้อมรับข้อความเร็ว
+import backends
+from backends import restconf_final, netconf_final, netmiko_final, ansible_final
+import tracing
+from checkpoint import CheckpointStore
+from dispatcher import CommandDispatcher
+from inventory import router_inventory # router ที่สั่งได้ (ไฟล์ hosts หรือ BOT_INVENTORY) แทน VALID_IPS
+from message_poller import AdaptivePoller
+from reply_sender import ReplySender
+from singleflight import device_reads
+from state_cache import interface_cache, running_config_cache
+from webhook_receiver import WebhookReceiver, ensure_webex_webhook
 
 # --- 1. ตั้งค่า Global ---
 load_dotenv()
 WEBEX_TOKEN = os.getenv("WEBEX_TEAMS_ACCESS_TOKEN")
 ROOM_ID = "Y2lzY29zcGFyazovL3VybjpURUFNOnVzLXdlc3QtMl9yL1JPT00vYmQwODczMTAtNmMyNi0xMWYwLWE1MWMtNzkzZDM2ZjZjM2Zm" # ห้อง IPA2025
 MY_STUDENT_ID = "66070039"
-VALID_IPS = ["10.0.15.61", "10.0.15.62", "10.0.15.63", "10.0.15.64", "10.0.15.65"]
+# จำนวนคำสั่งที่รันพร้อมกันได้ แยกตาม lane (อ่าน / แก้ config / งานนานอย่าง ansible, showrun)
+LANES = {
+    "read": int(os.getenv("BOT_READ_WORKERS", "4")),
+    "write": int(os.getenv("BOT_WRITE_WORKERS", "2")),
+    "slow": int(os.getenv("BOT_SLOW_WORKERS", "2")),
+}
+SHOWRUN_DIR = os.getenv("SHOWRUN_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+# Webhook mode (ไม่ตั้ง WEBHOOK_PORT = ใช้ polling อย่างเดียวเหมือนเดิม)
+WEBHOOK_PORT = os.getenv("WEBHOOK_PORT")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webex")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_TARGET_URL = os.getenv("WEBHOOK_TARGET_URL") # URL สาธารณะที่ Webex เรียกเข้ามา (ถ้าตั้ง จะลงทะเบียนให้)
+WEBHOOK_FALLBACK_POLL = int(os.getenv("WEBHOOK_FALLBACK_POLL", "30")) # เงียบนานเท่านี้ค่อย poll กันตกหล่น
+
+# Polling: เร็วหลังมีข้อความ, ค่อย ๆ ห่างขึ้นเมื่อเงียบ (วินาที)
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "15"))
+POLL_PAGE_SIZE = int(os.getenv("POLL_PAGE_SIZE", "50"))
+
+# Metrics endpoint (Prometheus text) ไม่ตั้ง = ไม่เปิด port
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# หลัง restart: ไล่ข้อความที่ค้าง (ตั้งแต่ checkpoint) ด้วยหน้าใหญ่หน้าเดียว
+POLL_DRAIN_PAGE_SIZE = int(os.getenv("POLL_DRAIN_PAGE_SIZE", "1000"))
 
 current_method = None # สถานะเริ่มต้น
 
@@ -24,7 +57,9 @@ if not WEBEX_TOKEN:
 
 # --- 2. (แก้ไข!) สร้าง API พร้อม Timeout 10 วินาที ---
 try:
-    api = WebexTeamsAPI(access_token=WEBEX_TOKEN) 
+    api = WebexTeamsAPI(access_token=WEBEX_TOKEN) # SDK รอ 429 ให้เอง (people.me, prime, webhook, messages.get)
+    # client แยกของ poller/ส่งข้อความ: ไม่ให้ SDK นอนรอ 429 => ทั้งสองจัดการ Retry-After เอง
+    paced_api = WebexTeamsAPI(access_token=WEBEX_TOKEN, wait_on_rate_limit=False)
     # ลองทดสอบเชื่อมต่อ (เพื่อเช็ค Token และ Network)
     print("Connecting to Webex...")
     api.people.me() 
@@ -34,170 +69,483 @@ except Exception as e:
     print(e)
     exit()
 
-# --- 3. (แก้ไข!) ฟังก์ชัน Helper (เราจะใช้ฟังก์ชันจากไฟล์อื่นโดยตรง) ---
-# (เราลบ handle_part1_command และ handle_part2_command ทิ้งไป)
-# (เราจะย้าย Logic ไปไว้ใน Loop หลักแทน เพื่อให้จัดการง่ายขึ้น)
+# --- 3. ฟังก์ชันทำงานกับอุปกรณ์ (รันใน worker thread ของ dispatcher) ---
+def run_interface_command(method, ip_address, command):
+    """create/delete/enable/disable/status ผ่าน restconf_final หรือ netconf_final"""
+    if method == "restconf":
+        backend, label = restconf_final, "Restconf"
+    else: # (method == "netconf")
+        backend, label = netconf_final, "Netconf"
 
-# --- 4. (ใหม่!) "Priming" - อ่านข้อความล่าสุดก่อนเริ่ม Loop ---
-try:
-    print("Initializing... Fetching last message ID to avoid spam.")
-    messages = api.messages.list(roomId=ROOM_ID, max=1)
-    last_message = next(iter(messages), None)
-    if last_message:
-        last_processed_message_id = last_message.id
-        print(f"Initialization complete. Ignoring messages before: {last_message.text[:20]}...")
+    if command == "create": content = backend.create_interface(ip_address, MY_STUDENT_ID)
+    elif command == "delete": content = backend.delete_interface(ip_address, MY_STUDENT_ID)
+    elif command == "enable": content = backend.set_interface_state(ip_address, MY_STUDENT_ID, enabled=True)
+    elif command == "disable": content = backend.set_interface_state(ip_address, MY_STUDENT_ID, enabled=False)
+    else: # (command == "status")
+        status = backend.get_interface_status(ip_address, f"Loopback{MY_STUDENT_ID}")
+        if status == "exists_enabled": content = f"Interface loopback {MY_STUDENT_ID} is enabled (checked by {label})"
+        elif status == "exists_disabled": content = f"Interface loopback {MY_STUDENT_ID} is disabled (checked by {label})"
+        elif status == "not_exists": content = f"No Interface loopback {MY_STUDENT_ID} (checked by {label})"
+        else: content = f"Error checking status ({label})."
+    return 'text', content
+
+def run_read_motd(ip_address):
+    result = netmiko_final.read_motd(ip_address)
+    if result is None: content = f"Error: No MOTD Configured on {ip_address}"
+    elif result.startswith("Error:"): content = result
+    else: content = result
+    return 'text', content
+
+def run_write_motd(ip_address, message):
+    result = ansible_final.write_motd(MY_STUDENT_ID, ip_address, message)
+    if result.startswith("Error:"):
+        return 'error', result
+    return 'text', result # "Ok: success"
+
+def run_write_motd_many(ip_addresses, message):
+    """เขียน motd ทุก router พร้อมกัน (playbook ของแต่ละ router รันบน worker ของตัวเอง)"""
+    results = ansible_final.write_motd_many(MY_STUDENT_ID, ip_addresses, message)
+    return [('error', result) if result.startswith("Error:") else ('text', result) for result in results]
+
+def run_gigabit_status(ip_address):
+    result = netmiko_final.gigabit_status(ip_address)
+    if result.startswith("Error:"):
+        return 'error', result
+    return 'text', result
+
+def run_showrun(ip_address):
+    device = router_inventory.by_ip(ip_address)
+    try:
+        path = netmiko_final.save_running_config(ip_address, MY_STUDENT_ID,
+                                                 device.name if device else None, SHOWRUN_DIR)
+    except Exception as e:
+        # ข้อความตามโจทย์ (README): backup ไม่สำเร็จ => 'Error: Ansible' ไม่แนบไฟล์
+        print(f"[SHOWRUN] {ip_address}: {e}")
+        return 'error', 'Error: Ansible'
+    return 'file', path
+
+# คำตอบทั้งหมดเข้าคิวแล้วส่งจาก thread เดียว (rate limit + Retry-After + รวมข้อความ) => worker ไม่ต้องรอ HTTP
+reply_sender = ReplySender(lambda room_id, **kwargs: paced_api.messages.create(roomId=room_id, **kwargs)).start()
+
+def post_reply(msg_type, content):
+    """ส่งคำตอบกลับเข้าห้อง Webex (เข้าคิวของ reply_sender)"""
+    if msg_type == 'file':
+        # content = path เดียว หรือ list ของ path (Webex แนบได้ 1 ไฟล์ต่อข้อความ => ส่งทีละไฟล์)
+        for path in ([content] if isinstance(content, str) else content):
+            print(f"Sending file: {path}")
+            reply_sender.submit(ROOM_ID, files=[path], text=f"Here is the config for {MY_STUDENT_ID}")
     else:
-        last_processed_message_id = None
-        print("Initialization complete. Room is empty.")
-except Exception as e:
-    print(f"Warning: Could not prime last message ID: {e}")
-    last_processed_message_id = None # ถ้าล้มเหลว ก็เริ่มจากศูนย์
+        print(f"Sending text: {content}")
+        reply_sender.submit(ROOM_ID, text=content)
+
+dispatcher = CommandDispatcher(post_reply, lanes=LANES)
+
+INTERFACE_COMMANDS = ['create', 'delete', 'enable', 'disable', 'status']
+
+def parse_targets(token):
+    """
+    ตีความ router เป้าหมาย: "10.0.15.61" | "CSR1KV-Pod1-1" | "all" | "10.0.15.61,CSR1KV-Pod1-2"
+    คืนค่า: (list ของ IP, IP/ชื่อที่ไม่อยู่ใน inventory ตัวแรก หรือ None)
+    """
+    if token.lower() == 'all':
+        return router_inventory.ips(), None
+    targets = []
+    seen = set()
+    for name in token.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        device = router_inventory.resolve(name)
+        if device is None:
+            return [], name
+        if device.ip not in seen:
+            seen.add(device.ip)
+            targets.append(device.ip)
+    if not targets:
+        return [], token
+    return targets, None
+
+def device_method(ip, chosen):
+    """
+    method ที่ใช้กับเครื่องนี้: method ที่ผู้ใช้เลือกในห้อง (chosen) มาก่อนเสมอ
+    ยังไม่ได้เลือก => bot_method ใน inventory (restconf/netconf), ไม่มีทั้งคู่ => None
+    """
+    if chosen is not None:
+        return chosen
+    device = router_inventory.by_ip(ip)
+    method = device.method if device is not None else None
+    return method if method in ('restconf', 'netconf') else None
+
+def make_device_job(command, args, targets):
+    """
+    คืนค่า (job, error): job(ip) -> (msg_type, content) สำหรับรันกับ router ตัวหนึ่ง
+    """
+    if not args:
+        if command in INTERFACE_COMMANDS:
+            # จำ method ณ ตอนรับคำสั่งไว้ (เผื่อมีคนสลับ method ระหว่างรอคิว)
+            methods = {ip: device_method(ip, current_method) for ip in targets}
+            if None in methods.values():
+                return None, ('error', 'Error: No method specified')
+            return (lambda ip: run_interface_command(methods[ip], ip, command)), None
+        if command == 'motd':
+            return run_read_motd, None
+        if command == 'gigabit_status':
+            return run_gigabit_status, None
+        if command == 'showrun':
+            return run_showrun, None
+        return None, ('error', f"Error: Unknown command '{command}'")
+
+    if command == 'motd':
+        message = " ".join(args)
+        return (lambda ip: run_write_motd(ip, message)), None
+    return None, ('error', 'Error: Invalid command structure.')
+
+def command_method(command, args, ip=None):
+    """
+    backend ที่คำสั่งนี้จะใช้กับ router ip (label ของ trace/metrics และ key ของ coalesce)
+    ip=None (trace รวมของ fan-out) => method ที่ผู้ใช้เลือก
+    """
+    if command in INTERFACE_COMMANDS:
+        return device_method(ip, current_method) if ip is not None else current_method
+    if command == 'motd':
+        return 'ansible' if args else 'netmiko'
+    if command in ('gigabit_status', 'showrun'):
+        return 'netmiko'
+    return None
+
+def command_lane(command, args):
+    """
+    lane ของ dispatcher ตามต้นทุนของคำสั่ง
+      read:  status / motd / gigabit_status (มักเป็น cache หรือ show สั้น ๆ)
+      write: create / delete / enable / disable
+      slow:  เขียน motd (ansible playbook) และ showrun (ดึง running-config ทั้งไฟล์)
+    """
+    if (command == 'motd' and args) or command == 'showrun':
+        return 'slow'
+    if command in INTERFACE_COMMANDS and command != 'status':
+        return 'write'
+    return 'read'
+
+def command_keys(ip_address, command, args):
+    """
+    key ของ dispatcher = สิ่งที่คำสั่งแตะบน router นั้น (คำสั่งที่แตะคนละอย่างไม่ต้องรอกัน)
+      loopback: create/delete/enable/disable/status, motd: อ่าน/เขียน banner, gigabit: show ip int brief
+      showrun อ่าน config ทั้งเครื่อง => ต้องต่อคิวหลังการเขียนทุกอย่างที่มาก่อน (หลาย key => list)
+    """
+    if command in INTERFACE_COMMANDS:
+        return (ip_address, 'loopback')
+    if command == 'motd':
+        return (ip_address, 'motd')
+    if command == 'gigabit_status':
+        return (ip_address, 'gigabit')
+    return [(ip_address, 'loopback'), (ip_address, 'motd')]
+
+def command_coalesce(command, args, ip):
+    """
+    คำสั่งอ่านให้ผลเหมือนกันไม่ว่าใครถาม => คำถามเดียวกันที่ค้างท้ายคิวของ router รอผลร่วมกัน
+    (key รวม method ของ router นั้นด้วย: status ผ่าน restconf กับ netconf ไม่รวมกัน)
+    """
+    if command_lane(command, args) == 'read':
+        return (command, command_method(command, args, ip))
+    return None
+
+def format_fan_out(command, targets, results):
+    """รวมผลจากหลาย router เป็นข้อความเดียว (ตาราง IP | ผลลัพธ์)"""
+    width = max(len(ip) for ip in targets)
+    lines = [f"{command} on {len(targets)} routers:"]
+    for ip, (_, content) in zip(targets, results):
+        lines.append(f"{ip.ljust(width)} | {content}")
+    return 'text', "\n".join(lines)
+
+def combine_showrun(targets, results):
+    """
+    ไฟล์ของทุก router ที่ backup สำเร็จ => ส่งเป็น 'file' ชุดเดียว
+    router ที่ล้มเหลวแจ้งเป็นข้อความแยก (ไม่มีไฟล์เลย => 'Error: Ansible' อย่างเดียว)
+    """
+    files = [content for msg_type, content in results if msg_type == 'file']
+    failed = [(ip, content) for ip, (msg_type, content) in zip(targets, results) if msg_type != 'file']
+    if not failed:
+        return 'file', files
+    if not files:
+        return 'error', 'Error: Ansible'  # ไม่สำเร็จเลยสักตัว => ข้อความเดียวกับ router ตัวเดียว
+    width = max(len(ip) for ip, _ in failed)
+    text = "\n".join([f"showrun failed on {len(failed)} of {len(targets)} routers:"] +
+                     [f"{ip.ljust(width)} | {content}" for ip, content in failed])
+    dispatcher.reply('error', text)
+    return 'file', files
+
+def handle_command(parts):
+    """
+    Parse คำสั่ง (รันใน main loop เพื่อให้ current_method เปลี่ยนตามลำดับข้อความ)
+    - คำสั่งที่ไม่ต้องแตะอุปกรณ์ => ส่ง reply ทันที
+    - คำสั่งที่ต้องแตะอุปกรณ์ => ส่งเข้า dispatcher (key = router + สิ่งที่แตะ ดู command_keys)
+    - เป้าหมายหลายตัว ("all" หรือ IP คั่นด้วย ,) => รันทุกตัวพร้อมกัน ตอบรวมครั้งเดียว
+    คืนค่า Future ของงานใน dispatcher (เสร็จเมื่อส่ง reply แล้ว) หรือ None ถ้าตอบไปแล้ว
+    """
+    global current_method
+    msg_type = 'error'
+    content = 'Error: Invalid command structure.'
 
-# --- 5. Main Loop (อัปเกรดให้ดักจับ Network Error) ---
+    # --- (Logic การ Parse จากโค้ดเดิมของคุณ) ---
+    if len(parts) == 2:
+        cmd_or_ip = parts[1].lower()
+        if cmd_or_ip == 'restconf':
+            current_method = 'restconf'
+            checkpoint_store.set('method', current_method)
+            msg_type, content = ('text', 'Ok: Restconf')
+        elif cmd_or_ip == 'netconf':
+            current_method = 'netconf'
+            checkpoint_store.set('method', current_method)
+            msg_type, content = ('text', 'Ok: Netconf')
+        elif cmd_or_ip == 'showrun':
+            # "/studentID showrun" = backup ทุก router ใน pod พร้อมกัน
+            return handle_command([parts[0], 'all', 'showrun'])
+        elif parse_targets(cmd_or_ip)[0]:
+            msg_type, content = ('error', 'Error: No command found.')
+        else: 
+            if current_method is None:
+                msg_type, content = ('error', 'Error: No method specified')
+            else:
+                msg_type, content = ('error', 'Error: No IP specified')
+
+    elif len(parts) >= 3:
+        targets, bad_ip = parse_targets(parts[1])
+        command = parts[2].lower()
+        
+        if bad_ip is not None:
+            msg_type, content = ('error', f"Error: Invalid IP: {bad_ip}")
+        else:
+            job, error = make_device_job(command, parts[3:], targets)
+            if error:
+                msg_type, content = error
+            elif len(targets) == 1:
+                ip_address = targets[0]
+                method = command_method(command, parts[3:], ip_address)
+                key = command_keys(ip_address, command, parts[3:])
+                if isinstance(key, list):
+                    return dispatcher.submit_group(key, lambda: job(ip_address),
+                                                   trace=tracing.Trace(command, method, ip_address),
+                                                   lane=command_lane(command, parts[3:]))
+                return dispatcher.submit(key, lambda: job(ip_address),
+                                         trace=tracing.Trace(command, method, ip_address),
+                                         lane=command_lane(command, parts[3:]),
+                                         coalesce=command_coalesce(command, parts[3:], ip_address))
+            elif command == 'motd' and parts[3:]:
+                # งานเดียวถือคิวของทุก router: playbook รันพร้อมกันทุกตัว ไม่ต้องรอ worker ของ lane ทีละ router
+                message = " ".join(parts[3:])
+                return dispatcher.submit_group(
+                    [command_keys(ip, command, parts[3:]) for ip in targets], lambda: format_fan_out(command, targets, run_write_motd_many(targets, message)),
+                    trace=tracing.Trace(command, 'ansible', "fan-out"),
+                    lane=command_lane(command, parts[3:]),
+                )
+            else:
+                methods = {ip: command_method(command, parts[3:], ip) for ip in targets}
+                fan_out_method = methods[targets[0]] if len(set(methods.values())) == 1 else 'mixed'
+                return dispatcher.submit_all(
+                    [(command_keys(ip, command, parts[3:]), lambda ip=ip: job(ip),
+                      tracing.Trace(command, methods[ip], ip), command_coalesce(command, parts[3:], ip))
+                     for ip in targets],
+                    (lambda results: combine_showrun(targets, results)) if command == 'showrun'
+                    else (lambda results: format_fan_out(command, targets, results)),
+                    trace=tracing.Trace(command, fan_out_method, "fan-out"),
+                    lane=command_lane(command, parts[3:]),
+                )
+
+    dispatcher.reply(msg_type, content)
+
+# --- 4. (ใหม่!) เริ่มต่อจาก checkpoint หรือ "Priming" - อ่านข้อความล่าสุดก่อนเริ่ม Loop ---
+poller = AdaptivePoller(paced_api, ROOM_ID, page_size=POLL_PAGE_SIZE,
+                        min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL)
+checkpoint_store = CheckpointStore()
+resume = checkpoint_store.load()
+if resume.last_id:
+    # warm restart: ไม่ต้องถาม Webex ว่าข้อความล่าสุดคืออะไร และไม่ข้ามข้อความที่มาระหว่างบอทดับ
+    poller.last_id = resume.last_id
+    poller.last_created = resume.last_created_datetime()
+    current_method = resume.values.get('method')
+    print(f"Resuming from checkpoint ({len(resume.inflight)} unfinished commands, method={current_method}).")
+else:
+    try:
+        print("Initializing... Fetching last message ID to avoid spam.")
+        messages = api.messages.list(roomId=ROOM_ID, max=1)
+        last_message = next(iter(messages), None)
+        if last_message:
+            poller.mark_processed(last_message)
+            checkpoint_store.message(last_message)
+            print(f"Initialization complete. Ignoring messages before: {(last_message.text or '')[:20]}...")
+        else:
+            print("Initialization complete. Room is empty.")
+    except Exception as e:
+        # ถ้าล้มเหลว poller จะรับเฉพาะข้อความที่มาหลังบอทเริ่ม
+        print(f"Warning: Could not prime last message ID: {e}")
+
+# --- 5. รับข้อความ (polling + webhook ใช้ pipeline เดียวกัน) ---
+_seen_message_ids = OrderedDict() # กันประมวลผลซ้ำในช่วงที่ webhook กับ poll สำรองเห็นข้อความเดียวกัน
+
+def command_parts(msg):
+    """คืนค่า parts ถ้าเป็นคำสั่งของเรา ไม่งั้น None (พิมพ์เหตุผลที่ข้าม)"""
+    if not msg.text:
+        print("Skipping message with no text content.")
+        return None
+        
+    cleaned_text = msg.text.strip()
+    # --- (Logic เดิมในการ Parse และ Filter) ---
+    if not cleaned_text.startswith("/"):
+        print("Message is not a command.")
+        return None
+
+    parts = cleaned_text.split()
+    command_student_id = parts[0][1:]
+
+    if command_student_id != MY_STUDENT_ID:
+        print(f"Ignoring command for other student: {command_student_id}")
+        return None
+    return parts
+
+def run_command(msg_id, parts):
+    """รันคำสั่ง แล้วบันทึก done ลง checkpoint เมื่อ reply ของคำสั่งนั้นถูกส่งออกไปแล้ว"""
+    print(f"Processing command for {MY_STUDENT_ID}...")
+
+    try:
+        pending = handle_command(parts)
+    except Exception as e:
+        print(f"!!! UNHANDLED ERROR: {e} !!!")
+        dispatcher.reply('error', f'Internal Bot Error: {e}')
+        pending = None
+    def _mark_done(_=None):
+        # reply เข้าคิวก่อนงานเสร็จเสมอ => barrier ที่สร้างตอนนี้เสร็จหลัง reply ถูกส่งจริง
+        reply_sender.barrier().add_done_callback(lambda _: checkpoint_store.done(msg_id))
+
+    if pending is None:
+        _mark_done()
+    else:
+        pending.add_done_callback(_mark_done)
+
+def _remember(msg_id):
+    _seen_message_ids[msg_id] = True
+    if len(_seen_message_ids) > 1000:
+        _seen_message_ids.popitem(last=False)
+
+def process_message(msg):
+    if msg.id in _seen_message_ids:
+        return
+    _remember(msg.id)
+
+    print(f"\nNew message detected: {msg.text}")
+    created = getattr(msg, "created", None)
+    if created is not None:
+        # เวลาที่ข้อความค้างอยู่ใน Webex ก่อนบอทเห็น (ช่วง poll / webhook delivery)
+        tracing.registry.observe("bot_receive_lag_seconds",
+                                 max(0.0, (datetime.now(timezone.utc) - created).total_seconds()))
+
+    parts = command_parts(msg)
+    # บันทึกก่อนลงมือ: ถ้าบอทดับกลางคำสั่ง รอบหน้าจะรันคำสั่งนี้ซ้ำ
+    checkpoint_store.message(msg, command=parts is not None, method=current_method)
+    if parts is not None:
+        run_command(msg.id, parts)
+
+def poll_once(page_size=None):
+    # ไล่อ่านทุกหน้าจนถึงข้อความล่าสุดที่ทำไปแล้ว (ไม่จำกัด 5 ข้อความเหมือนเดิม)
+    with tracing.span("webex_fetch"):
+        new_messages = poller.poll(page_size)
+    for msg in new_messages:
+        process_message(msg)
+        poller.mark_processed(msg)
+
+webhook_inbox = None
+webhook = None
+if WEBHOOK_PORT:
+    webhook_inbox = queue.Queue()
+    try:
+        webhook = WebhookReceiver(webhook_inbox.put, port=int(WEBHOOK_PORT), path=WEBHOOK_PATH,
+                                  secret=WEBHOOK_SECRET, room_id=ROOM_ID).start()
+        print(f"Webhook receiver listening on {webhook.url}")
+        if WEBHOOK_TARGET_URL:
+            ensure_webex_webhook(api, WEBHOOK_TARGET_URL, ROOM_ID, secret=WEBHOOK_SECRET)
+    except Exception as e:
+        print(f"Warning: Webhook mode unavailable, falling back to polling: {e}")
+        webhook_inbox = None
+
+metrics_server = None
+if METRICS_PORT:
+    tracing.registry.gauge("bot_dispatcher_pending", dispatcher.pending,
+                           "Device commands queued or running")
+    tracing.registry.gauge("bot_reply_queue", reply_sender.pending,
+                           "Replies waiting to be sent to Webex")
+    tracing.registry.gauge("bot_lane_queued", lambda: {k: v["queued"] for k, v in dispatcher.lane_stats().items()},
+                           "Device jobs accepted but not started, per lane", label="lane")
+    tracing.registry.gauge("bot_lane_running", lambda: {k: v["running"] for k, v in dispatcher.lane_stats().items()},
+                           "Device jobs running, per lane", label="lane")
+    tracing.registry.gauge("bot_state_cache_hit_ratio", lambda: interface_cache.stats()["hit_rate"],
+                           "Interface state cache hit ratio")
+    try:
+        metrics_server = tracing.MetricsServer(port=int(METRICS_PORT)).start()
+        print(f"Metrics endpoint on {metrics_server.url}")
+    except Exception as e:
+        print(f"Warning: Metrics endpoint unavailable: {e}")
+
+# --- 6. คำสั่งที่ค้างจากรอบก่อน + backlog ระหว่างบอทดับ ---
+def replay_command(record):
+    """รันคำสั่งที่ค้างด้วย method ณ ตอนที่รับคำสั่งนั้น (ไม่ใช่ค่าล่าสุดที่ restore มา)"""
+    global current_method
+    parts = record["text"].strip().split()
+    latest = current_method
+    current_method = record.get("method", latest)
+    run_command(record["id"], parts)
+    # คำสั่งเลือก method เอง (/id restconf) => เก็บค่าที่มันตั้งไว้, อื่น ๆ คืนค่าเดิม
+    if not (len(parts) == 2 and parts[1].lower() in ('restconf', 'netconf')):
+        current_method = latest
+
+for record in list(resume.inflight.values()):
+    print(f"\nReplaying unfinished command: {record['text']}")
+    _remember(record["id"])
+    replay_command(record)
+if resume.last_id:
+    poll_once(POLL_DRAIN_PAGE_SIZE)
+
+# --- 7. Main Loop (อัปเกรดให้ดักจับ Network Error) ---
+print(f"Inventory: {len(router_inventory)} routers from {router_inventory.path}")
 print(f"Bot is running... ONLY listening for ID {MY_STUDENT_ID}. Press Ctrl+C to stop.")
+backends.prewarm() # โหลด backend ต่อใน thread เบื้องหลัง (BOT_PREWARM)
 
 try:
     while True:
-        print(".", end="", flush=True) # พิมพ์จุดเพื่อเช็คว่า Loop ยัง "หายใจ"
+        if webhook_inbox is None:
+            print(".", end="", flush=True) # พิมพ์จุดเพื่อเช็คว่า Loop ยัง "หายใจ"
+            poll_once()
+            poller.sleep() # นอนตามจังหวะที่ poller คำนวณ (1 วินาที ถึง POLL_MAX_INTERVAL)
+            continue
 
+        # --- โหมด webhook: รอ event, ถ้าเงียบนานก็ poll หนึ่งรอบเผื่อ event หาย ---
         try:
-            # --- ดึงข้อความ (ที่อาจจะค้าง) ---
-            messages = api.messages.list(roomId=ROOM_ID, max=5) 
-        
-        except Exception as e: # ดักจับ Timeout, Network Error
-            print(f"\n[NETWORK ERROR] Failed to fetch messages: {e}")
-            print("...Will retry in 5 seconds...")
-            time.sleep(5) # Sleep นานขึ้นถ้าเน็ตล่ม
-            continue # ข้ามไปเริ่ม Loop ใหม่
-
-        # --- (Logic เดิมในการหาข้อความใหม่) ---
-        new_messages = []
-        for msg in messages:
-            if msg.id == last_processed_message_id:
-                break
-            new_messages.append(msg)
-
-        if new_messages:
-            for msg in reversed(new_messages):
-                print(f"\nNew message detected: {msg.text}")
-                
-                if not msg.text:
-                    print("Skipping message with no text content.")
-                    continue
-                    
-                cleaned_text = msg.text.strip()
-                # --- (Logic เดิมในการ Parse และ Filter) ---
-                if not cleaned_text.startswith("/"):
-                    print("Message is not a command.")
-                    continue
-
-                parts = cleaned_text.split()
-                command_student_id = parts[0][1:]
-
-                if command_student_id != MY_STUDENT_ID:
-                    print(f"Ignoring command for other student: {command_student_id}")
-                    continue
-                    
-                print(f"Processing command for {MY_STUDENT_ID}...")
-                
-                msg_type = 'error'
-                content = 'Error: Invalid command structure.'
-
-                try:
-                    # --- (Logic การ Parse จากโค้ดเดิมของคุณ) ---
-                    if len(parts) == 2:
-                        cmd_or_ip = parts[1].lower()
-                        if cmd_or_ip == 'restconf':
-                            current_method = 'restconf'
-                            msg_type, content = ('text', 'Ok: Restconf')
-                        elif cmd_or_ip == 'netconf':
-                            current_method = 'netconf'
-                            msg_type, content = ('text', 'Ok: Netconf')
-                        elif cmd_or_ip in VALID_IPS:
-                            msg_type, content = ('error', 'Error: No command found.')
-                        else: 
-                            if current_method is None:
-                                msg_type, content = ('error', 'Error: No method specified')
-                            else:
-                                msg_type, content = ('error', 'Error: No IP specified')
-
-                    elif len(parts) == 3:
-                        ip_address = parts[1]
-                        command = parts[2].lower()
-                        
-                        if ip_address not in VALID_IPS:
-                            msg_type, content = ('error', f"Error: Invalid IP: {ip_address}")
-                        elif command in ['create', 'delete', 'enable', 'disable', 'status']:
-                            if current_method is None:
-                                msg_type, content = ('error', 'Error: No method specified')
-                            else:
-                                # (เรียกฟังก์ชันจากไฟล์อื่นโดยตรง)
-                                if current_method == "restconf":
-                                    if command == "create": content = restconf_final.create_interface(ip_address, MY_STUDENT_ID)
-                                    elif command == "delete": content = restconf_final.delete_interface(ip_address, MY_STUDENT_ID)
-                                    elif command == "enable": content = restconf_final.set_interface_state(ip_address, MY_STUDENT_ID, enabled=True)
-                                    elif command == "disable": content = restconf_final.set_interface_state(ip_address, MY_STUDENT_ID, enabled=False)
-                                    elif command == "status":
-                                        status = restconf_final.get_interface_status(ip_address, f"Loopback{MY_STUDENT_ID}")
-                                        if status == "exists_enabled": content = f"Interface loopback {MY_STUDENT_ID} is enabled (checked by Restconf)"
-                                        elif status == "exists_disabled": content = f"Interface loopback {MY_STUDENT_ID} is disabled (checked by Restconf)"
-                                        elif status == "not_exists": content = f"No Interface loopback {MY_STUDENT_ID} (checked by Restconf)"
-                                        else: content = "Error checking status (Restconf)."
-                                else: # (current_method == "netconf")
-                                    if command == "create": content = netconf_final.create_interface(ip_address, MY_STUDENT_ID)
-                                    elif command == "delete": content = netconf_final.delete_interface(ip_address, MY_STUDENT_ID)
-                                    elif command == "enable": content = netconf_final.set_interface_state(ip_address, MY_STUDENT_ID, enabled=True)
-                                    elif command == "disable": content = netconf_final.set_interface_state(ip_address, MY_STUDENT_ID, enabled=False)
-                                    elif command == "status":
-                                        status = netconf_final.get_interface_status(ip_address, f"Loopback{MY_STUDENT_ID}")
-                                        if status == "exists_enabled": content = f"Interface loopback {MY_STUDENT_ID} is enabled (checked by Netconf)"
-                                        elif status == "exists_disabled": content = f"Interface loopback {MY_STUDENT_ID} is disabled (checked by Netconf)"
-                                        elif status == "not_exists": content = f"No Interface loopback {MY_STUDENT_ID} (checked by Netconf)"
-                                        else: content = "Error checking status (Netconf)."
-                                msg_type = 'text'
-
-                        elif command == 'motd':
-                            result = netmiko_final.read_motd(ip_address)
-                            if result is None: content = f"Error: No MOTD Configured on {ip_address}"
-                            elif result.startswith("Error:"): content = result
-                            else: content = result
-                            msg_type = 'text'
-                        
-                        else:
-                            msg_type, content = ('error', f"Error: Unknown command '{command}'")
-
-                    elif len(parts) > 3:
-                        ip_address = parts[1]
-                        command = parts[2].lower()
-                        
-                        if ip_address not in VALID_IPS:
-                            msg_type, content = ('error', f"Error: Invalid IP: {ip_address}")
-                        elif command == 'motd':
-                            message = " ".join(parts[3:])
-                            result = ansible_final.write_motd(MY_STUDENT_ID, ip_address, message)
-                            if result.startswith("Error:"):
-                                msg_type, content = ('error', result)
-                            else:
-                                msg_type, content = ('text', result) # "Ok: success"
-                        else:
-                            msg_type, content = ('error', 'Error: Invalid command structure.')
-                    
-                except Exception as e:
-                    print(f"!!! UNHANDLED ERROR: {e} !!!")
-                    msg_type, content = ('error', f'Internal Bot Error: {e}')
-
-                # --- ส่งคำตอบกลับ ---
-                if msg_type == 'file':
-                    print(f"Sending file: {content}")
-                    api.messages.create(roomId=ROOM_ID, files=[content], text=f"Here is the config for {MY_STUDENT_ID}")
-                else:
-                    print(f"Sending text: {content}")
-                    api.messages.create(roomId=ROOM_ID, text=content)
-            
-            # --- จบ Loop 'for msg' ---
-            last_processed_message_id = new_messages[0].id 
-
-        time.sleep(1) # นอน 1 วินาที
+            event = webhook_inbox.get(timeout=WEBHOOK_FALLBACK_POLL)
+        except queue.Empty:
+            print(".", end="", flush=True)
+            poll_once()
+            continue
+
+        try:
+            with tracing.span("webex_fetch"):
+                msg = api.messages.get(event["id"])
+        except Exception as e:
+            print(f"\n[NETWORK ERROR] Failed to fetch message {event['id']}: {e}")
+            continue
+        process_message(msg)
+        # เลื่อน cursor ของ poller ตามด้วย => poll สำรองเริ่มจากข้อความนี้ ไม่ย้อนไปรันคำสั่งเก่าซ้ำ
+        poller.mark_processed(msg)
 
 except KeyboardInterrupt:
-    print("\nBot stopped by user.")
\ No newline at end of file
+    print("\nBot stopped by user.")
+    print(f"Interface state cache: {interface_cache.stats()}")
+    print(f"Running-config cache: {running_config_cache.stats()}")
+    print(f"Dispatcher lanes: {dispatcher.lane_stats()}")
+    print(f"Coalesced device reads: {device_reads.stats()}")
+    if webhook is not None:
+        webhook.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+    dispatcher.shutdown(wait=False)
+    reply_sender.stop() # ส่งคำตอบที่ค้างในคิวก่อนปิด
+    print(f"Replies: {reply_sender.stats()}")
+    backends.shutdown()
+    checkpoint_store.close()
@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import Future
+
+import tracing
+from state_cache import running_config_cache
+
+
+class SingleFlight:
+    """
+    รวมคำถามเดียวกันที่ยิงพร้อมกันให้เหลือการคุยกับอุปกรณ์ครั้งเดียว
+    key = (backend, router_ip, query, ...) — คนแรกเป็นคนยิงจริง คนที่มาระหว่างนั้นรอผลเดียวกัน
+    (รวมถึง exception) พอเสร็จแล้ว key ถูกลบทันที => ไม่ใช่ cache คำถามถัดไปยิงใหม่เสมอ
+      - do(): โค้ดแบบ thread (netmiko)
+      - do_async(): coroutine บน event loop กลาง (restconf / netconf)
+    key(): เติม generation ของ router ให้เอง — ถ้ามีการเขียน config คั่น (running_config_cache.writing)
+    คำถามหลังการเขียนจะไม่ไปรอผลที่เริ่มก่อนการเขียน
+    """
+
+    def __init__(self):
+        self._calls = {}        # key -> concurrent.futures.Future (thread)
+        self._tasks = {}        # key -> asyncio.Future (event loop)
+        self._lock = threading.Lock()
+        self.leaders = 0        # จำนวนครั้งที่คุยกับอุปกรณ์จริง
+        self.shared = 0         # จำนวนคำถามที่ได้ผลจากคนอื่น
+
+    @staticmethod
+    def key(backend, router_ip, *query):
+        return (backend, router_ip, running_config_cache.generation(router_ip)) + query
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            with tracing.span("coalesced"):
+                return call.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key, coro_fn):
+        """coro_fn() -> coroutine; ต้องเรียกจาก loop เดียวกันทุกครั้ง (async_loop)"""
+        import asyncio  # โหลดแล้วแน่นอนเมื่อมาถึงตรงนี้ (ไม่ให้ run.py จ่ายค่า import asyncio ตอนเริ่ม)
+
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = self._tasks[key] = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        with self._lock:
+            if leader:
+                self.leaders += 1
+            else:
+                self.shared += 1
+        # shield: คนที่รอถูก cancel (timeout) ไม่ทำให้คนอื่นที่รอ key เดียวกันโดน cancel ไปด้วย
+        if leader:
+            return await asyncio.shield(task)
+        with tracing.span("coalesced"):
+            return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.shared
+            return {
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "shared_rate": (self.shared / total) if total else 0.0,
+            }
+
+
+device_reads = SingleFlight()
@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+STATE_CACHE_TTL = float(os.getenv("STATE_CACHE_TTL", "30"))  # วินาที
+RUNNING_CONFIG_MAX_AGE = float(os.getenv("RUNNING_CONFIG_MAX_AGE", "300"))  # วินาที
+
+# สถานะที่ cache ได้ (ตรงกับค่าที่ get_interface_status คืน)
+_CACHEABLE = ("exists_enabled", "exists_disabled", "not_exists")
+
+
+class InterfaceStateCache:
+    """
+    cache สถานะ interface ต่อ (router, interface) ใช้ร่วมกันทั้ง restconf_final และ netconf_final
+      - get(): เจอและยังไม่หมดอายุ => hit (ไม่ต้องยิง RPC ไปที่อุปกรณ์)
+      - put(): ผลจากอุปกรณ์ หรือผลจากการเขียนของบอทเองที่สำเร็จ (write-through)
+        ค่า "error" => ลบ entry ทิ้ง (ไม่เชื่อค่าเดิมอีก)
+    """
+
+    def __init__(self, ttl=STATE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # (router_ip, interface) -> (status, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(router_ip, interface_name):
+        return router_ip, interface_name.lower()
+
+    def get(self, router_ip, interface_name):
+        key = self._key(router_ip, interface_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, router_ip, interface_name, status):
+        if status not in _CACHEABLE:
+            self.invalidate(router_ip, interface_name)
+            return
+        with self._lock:
+            self._entries[self._key(router_ip, interface_name)] = (status, time.monotonic() + self.ttl)
+
+    def invalidate(self, router_ip, interface_name=None):
+        with self._lock:
+            if interface_name is not None:
+                self._entries.pop(self._key(router_ip, interface_name), None)
+                return
+            for key in [k for k in self._entries if k[0] == router_ip]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,            # = จำนวน RPC ที่ประหยัดได้
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+# instance เดียวที่ทุก backend ใช้ร่วมกัน
+interface_cache = InterfaceStateCache()
+
+
+def interface_status_from_config(run_text: str, interface_name: str):
+    """
+    อ่านสถานะ interface จาก show running-config
+    คืนค่า: "exists_enabled" | "exists_disabled" | "not_exists"
+    """
+    m = re.search(rf"^interface {re.escape(interface_name)}[ \t]*\r?$(.*?)(?:^(?=\S)|\Z)",
+                  run_text, flags=re.MULTILINE | re.DOTALL | re.IGNORECASE)
+    if not m:
+        return "not_exists"
+    if re.search(r"^\s+shutdown\s*$", m.group(1), flags=re.MULTILINE):
+        return "exists_disabled"
+    return "exists_enabled"
+
+
+class RunningConfigCache:
+    """
+    snapshot ของ show running-config ต่อ router ใช้ร่วมกันระหว่างคำสั่งอ่าน
+    (banner motd, showrun, สถานะ interface) => ไม่ต้องดึง config ยาว ๆ ผ่าน SSH ซ้ำ
+      - get(): คืน snapshot ที่อายุไม่เกิน max_age
+      - get_or_fetch(): ไม่มี/เก่า => fetch() ครั้งเดียวต่อ router (thread อื่นรอใช้ผลเดียวกัน)
+      - writing(): ครอบจังหวะที่บอทเขียน config ของ router นั้น => ทิ้ง snapshot
+        ทั้งก่อนและหลังเขียน และ fetch ที่เริ่มก่อนหน้าจะไม่ถูกเก็บ (เช็ก generation)
+    """
+
+    def __init__(self, max_age=RUNNING_CONFIG_MAX_AGE):
+        self.max_age = max_age
+        self._entries = {}      # router_ip -> (text, fetched_at)
+        self._generation = {}   # router_ip -> int (เพิ่มทุกครั้งที่ invalidate)
+        self._fetch_locks = {}  # router_ip -> Lock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+
+    def generation(self, router_ip):
+        with self._lock:
+            return self._generation.get(router_ip, 0)
+
+    def get(self, router_ip):
+        with self._lock:
+            entry = self._entries.get(router_ip)
+            if entry is not None and time.monotonic() - entry[1] <= self.max_age:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, router_ip, text, generation=None):
+        """generation: ค่าจาก generation() ตอนเริ่ม fetch — ถ้ามีการเขียนคั่นกลางจะไม่เก็บ"""
+        with self._lock:
+            if generation is not None and generation != self._generation.get(router_ip, 0):
+                return False
+            self._entries[router_ip] = (text, time.monotonic())
+            self.fetches += 1
+            return True
+
+    def get_or_fetch(self, router_ip, fetch):
+        text = self.get(router_ip)
+        if text is not None:
+            return text
+        with self._lock:
+            lock = self._fetch_locks.setdefault(router_ip, threading.Lock())
+        with lock:
+            # ระหว่างรอ lock อาจมี thread อื่น fetch เสร็จแล้ว
+            with self._lock:
+                entry = self._entries.get(router_ip)
+                if entry is not None and time.monotonic() - entry[1] <= self.max_age:
+                    return entry[0]
+            generation = self.generation(router_ip)
+            text = fetch()
+            self.put(router_ip, text, generation)
+            return text
+
+    def invalidate(self, router_ip):
+        with self._lock:
+            self._entries.pop(router_ip, None)
+            self._generation[router_ip] = self._generation.get(router_ip, 0) + 1
+
+    @contextmanager
+    def writing(self, router_ip):
+        self.invalidate(router_ip)
+        try:
+            yield
+        finally:
+            self.invalidate(router_ip)
+
+    def interface_status(self, router_ip, interface_name):
+        """สถานะ interface จาก snapshot ที่ยังสด (ไม่มี snapshot => None)"""
+        text = self.get(router_ip)
+        if text is None:
+            return None
+        return interface_status_from_config(text, interface_name)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "fetches": self.fetches,   # จำนวนครั้งที่ดึง running-config จริง
+                "entries": len(self._entries),
+            }
+
+
+running_config_cache = RunningConfigCache()
+
+
+def cached_interface_status(router_ip, interface_name):
+    """
+    สถานะที่ตอบได้โดยไม่แตะอุปกรณ์: interface_cache ก่อน แล้วค่อยดู running-config snapshot
+    ไม่มีทั้งคู่ => None
+    """
+    status = interface_cache.get(router_ip, interface_name)
+    if status is not None:
+        return status
+    status = running_config_cache.interface_status(router_ip, interface_name)
+    if status is not None:
+        interface_cache.put(router_ip, interface_name, status)
+    return status
@@ -0,0 +1,17 @@
+"""
+Strategy 'linear_persistent' = linear ปกติ แต่ตอนจบ run ไม่ reset
+persistent connection (network_cli) ทิ้ง
+
+ansible_final รัน play ใน worker process ของ router ซ้ำ ๆ ด้วย pid เดิม socket path
+ของ ansible-connection จึงเป็นตัวเดิม ถ้าไม่ reset ตัว SSH ไปที่ router
+จะค้างอยู่ให้ run ถัดไปใช้ต่อ จนกว่าจะ idle เกิน persistent_connect_timeout
+"""
+from ansible.plugins.strategy.linear import StrategyModule as _LinearStrategyModule
+
+
+class StrategyModule(_LinearStrategyModule):
+
+    def cleanup(self):
+        # ปล่อย socket ไว้ (ไม่เรียก reset) แล้วค่อยทำ cleanup ส่วนอื่นตามปกติ
+        self._active_connections.clear()
+        super().cleanup()
@@ -0,0 +1,290 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# พิมพ์สรุป span ของแต่ละคำสั่งลง console (BOT_TRACE=0 เพื่อปิด)
+TRACE_PRINT = os.getenv("BOT_TRACE", "1") != "0"
+
+# ขอบ bucket ของ histogram (วินาที) ครอบตั้งแต่ cache hit ถึง playbook ที่ช้าที่สุด
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+SPAN_LABELS = ("phase", "command", "method", "router")
+
+
+# ------------------------------
+# Metrics (histogram / counter / gauge) + Prometheus text format
+# ------------------------------
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels_text(labels, extra=None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    เก็บ metric ทั้งหมดของบอทใน memory (thread-safe)
+      - observe(): histogram เช่น bot_span_seconds{phase,command,method,router}
+      - inc(): counter เช่น bot_commands_total{...,result}
+      - gauge(): ค่าที่อ่านสด ๆ ตอน scrape (เช่นจำนวนงานในคิว)
+    render() คืน text format ที่ Prometheus scrape ได้
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # name -> {labels tuple: _Histogram}
+        self._counters = {}    # name -> {labels tuple: float}
+        self._gauges = {}      # name -> fn() -> float
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(self.buckets)
+            hist.observe(value)
+
+    def inc(self, name, value=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def gauge(self, name, fn, text=None, label=None):
+        """
+        label=None: fn() คืนตัวเลขตัวเดียว
+        label="lane": fn() คืน dict {ค่า label: ตัวเลข} => 1 series ต่อค่า เช่น name{lane="read"}
+        """
+        self._gauges[name] = (fn, label)
+        if text:
+            self.describe(name, text)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._histograms):
+                self._header(lines, name, "histogram")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, n in zip(hist.buckets, hist.counts):
+                        cumulative += n
+                        lines.append(f"{name}_bucket{_labels_text(key, ('le', repr(float(bound))))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels_text(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{name}_sum{_labels_text(key)} {hist.total:.6f}")
+                    lines.append(f"{name}_count{_labels_text(key)} {hist.count}")
+            for name in sorted(self._counters):
+                self._header(lines, name, "counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_labels_text(key)} {value:g}")
+        for name in sorted(self._gauges):
+            fn, label = self._gauges[name]
+            try:
+                values = fn()
+                series = ([(((label, k),), float(v)) for k, v in sorted(values.items())] if label
+                          else [((), float(values))])
+            except Exception:
+                continue
+            self._header(lines, name, "gauge")
+            for key, value in series:
+                lines.append(f"{name}{_labels_text(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+registry = MetricsRegistry()
+registry.describe("bot_span_seconds", "Time spent in one phase of a bot command")
+registry.describe("bot_span_errors_total", "Phases that ended with an exception")
+registry.describe("bot_command_seconds", "Time from receiving a device command to sending its reply")
+registry.describe("bot_commands_total", "Device commands handled, by reply type")
+registry.describe("bot_receive_lag_seconds", "Time from message creation in Webex to the bot seeing it")
+registry.describe("bot_coalesced_total", "Device jobs answered with the result of an identical job already queued")
+registry.describe("bot_lane_wait_seconds", "Time a device job waited (router queue + lane queue) before it started")
+
+
+# ------------------------------
+# Tracing (1 Trace ต่อ 1 คำสั่ง ส่งต่อไปยัง backend ผ่าน contextvar)
+# ------------------------------
+_current = contextvars.ContextVar("bot_trace", default=None)
+
+
+class Trace:
+    """
+    span ทั้งหมดของคำสั่งหนึ่ง (เช่น status บน 10.0.15.61 ด้วย netconf)
+      - สร้างตอนรับคำสั่ง => queue_wait = เวลารอคิวใน dispatcher
+      - activate(): ระหว่างนี้ span() ในทุก backend จะติด label ของคำสั่งนี้
+      - finish(): บันทึกเวลารวม + พิมพ์สรุป 1 บรรทัด
+    """
+
+    def __init__(self, command, method=None, router=None):
+        self.labels = {"command": command or "", "method": method or "", "router": router or ""}
+        self.created = time.perf_counter()
+        self.spans = []  # [(phase, seconds)]
+        self._started = False
+
+    @contextmanager
+    def activate(self, first_phase="queue_wait"):
+        """first_phase: ชื่อช่วงตั้งแต่สร้าง trace ถึง activate ครั้งแรก"""
+        if not self._started:
+            self._started = True
+            self.record(first_phase, time.perf_counter() - self.created)
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def record(self, phase, seconds, error=False, **labels):
+        self.spans.append((phase, seconds))
+        _observe_span(phase, seconds, error, dict(labels, **{k: v for k, v in self.labels.items() if v}))
+
+    def finish(self, result="text"):
+        total = time.perf_counter() - self.created
+        registry.observe("bot_command_seconds", total, **self.labels)
+        registry.inc("bot_commands_total", result=result, **self.labels)
+        if TRACE_PRINT:
+            print(f"\n[TRACE] {self.summary(total)}")
+
+    def summary(self, total=None) -> str:
+        if total is None:
+            total = time.perf_counter() - self.created
+        phases = {}
+        for phase, seconds in self.spans:
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        head = " ".join(v for v in (self.labels["command"], self.labels["method"], self.labels["router"]) if v)
+        body = " ".join(f"{p}={s * 1000:.0f}ms" for p, s in phases.items())
+        return f"{head} total={total * 1000:.0f}ms {body}".rstrip()
+
+
+def _observe_span(phase, seconds, error, labels):
+    labels = {k: labels.get(k, "") for k in SPAN_LABELS[1:]}
+    registry.observe("bot_span_seconds", seconds, phase=phase, **labels)
+    if error:
+        registry.inc("bot_span_errors_total", phase=phase, **labels)
+
+
+def current():
+    return _current.get()
+
+
+def activate(trace, first_phase="queue_wait"):
+    """ใช้ใน dispatcher: trace=None => ไม่ทำอะไร"""
+    return trace.activate(first_phase) if trace is not None else nullcontext()
+
+
+def record(phase, seconds, error=False, **labels):
+    """บันทึก span ที่วัดเวลามาแล้ว (เช่น response.elapsed ของ requests)"""
+    trace = _current.get()
+    if trace is not None:
+        trace.record(phase, seconds, error, **labels)
+    else:
+        _observe_span(phase, seconds, error, labels)
+
+
+@contextmanager
+def span(phase, **labels):
+    """
+    จับเวลา 1 phase เช่น with tracing.span("connect", method="netconf"): ...
+    label ของคำสั่งที่ active อยู่ (command/method/router) จะถูกเติมให้เอง
+    """
+    t0 = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(phase, time.perf_counter() - t0, error, **labels)
+
+
+# ------------------------------
+# HTTP endpoint (/metrics)
+# ------------------------------
+class MetricsServer:
+    """
+    เปิด GET /metrics (Prometheus text format) ให้ scrape หรือ curl ดูได้
+    """
+
+    def __init__(self, host="0.0.0.0", port=9100, path="/metrics", metrics=registry):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.metrics = metrics
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host = "127.0.0.1" if self.host in ("", "0.0.0.0") else self.host
+        return f"http://{host}:{self.port}{self.path}"
+
+    def start(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != server.path:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = server.metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
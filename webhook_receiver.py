@@ -0,0 +1,142 @@
+import hashlib
+import hmac
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urlrequest
+from urllib.error import HTTPError
+
+
+def _signature(secret: str, body: bytes) -> str:
+    # Webex เซ็น body ด้วย HMAC-SHA1 แล้วส่งมาใน header X-Spark-Signature
+    return hmac.new(secret.encode(), body, hashlib.sha1).hexdigest()
+
+
+class WebhookReceiver:
+    """
+    HTTP server ฝังในบอท รับ Webex webhook (resource=messages, event=created)
+    แล้วส่ง payload["data"] (มี id, roomId, personEmail ... แต่ไม่มี text)
+    ต่อให้ on_message — ฝั่งบอทค่อยไป api.messages.get(id) เอาข้อความเอง
+      - secret: ถ้าตั้งไว้ จะตรวจ X-Spark-Signature และตอบ 403 ถ้าไม่ตรง
+      - room_id: ถ้าตั้งไว้ รับเฉพาะ event ของห้องนั้น
+    """
+
+    def __init__(self, on_message, host="0.0.0.0", port=8080, path="/webex",
+                 secret=None, room_id=None):
+        self.on_message = on_message
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.room_id = room_id
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host = "127.0.0.1" if self.host in ("", "0.0.0.0") else self.host
+        return f"http://{host}:{self.port}{self.path}"
+
+    def _handle(self, headers, body: bytes) -> int:
+        """คืนค่า HTTP status ที่จะตอบกลับ"""
+        if self.secret:
+            got = headers.get("X-Spark-Signature", "")
+            if not hmac.compare_digest(got, _signature(self.secret, body)):
+                return 403
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return 400
+
+        if payload.get("resource") != "messages" or payload.get("event") != "created":
+            return 204  # event อื่นไม่สนใจ แต่ตอบรับไว้ไม่ให้ Webex retry
+        data = payload.get("data") or {}
+        if not data.get("id"):
+            return 400
+        if self.room_id and data.get("roomId") != self.room_id:
+            return 204
+
+        self.on_message(data)
+        return 204
+
+    def start(self):
+        receiver = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?", 1)[0] != receiver.path:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length)
+                try:
+                    status = receiver._handle(self.headers, body)
+                except Exception as e:
+                    print(f"\n[WEBHOOK ERROR] {e}")
+                    status = 500
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, fmt, *args):
+                pass  # ไม่ต้อง log ทุก request ลง console
+
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.port = self._server.server_address[1]  # เผื่อใช้ port=0
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="webhook-receiver", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def ensure_webex_webhook(api, target_url: str, room_id: str, secret=None,
+                         name="ipa-bot-messages"):
+    """
+    ลงทะเบียน webhook messages/created ของห้องนี้กับ Webex (ถ้ายังไม่มี)
+    """
+    room_filter = f"roomId={room_id}"
+    for hook in api.webhooks.list():
+        if hook.targetUrl == target_url and hook.resource == "messages" \
+                and hook.event == "created" and hook.filter == room_filter:
+            return hook
+    return api.webhooks.create(name=name, targetUrl=target_url, resource="messages",
+                               event="created", filter=room_filter, secret=secret)
+
+
+def post_test_event(url: str, message_id: str, room_id: str, secret=None) -> int:
+    """
+    ตัวแทน Webex สำหรับทดสอบในเครื่อง: POST payload หน้าตาเดียวกับของจริง
+    คืนค่า HTTP status ที่ receiver ตอบ (รวม 4xx/5xx เช่น 400 payload ผิด, 403 signature ไม่ตรง)
+    """
+    body = json.dumps({
+        "name": "local-stand-in",
+        "resource": "messages",
+        "event": "created",
+        "data": {"id": message_id, "roomId": room_id},
+    }).encode()
+    req = urlrequest.Request(url, data=body, method="POST",
+                             headers={"Content-Type": "application/json"})
+    if secret:
+        req.add_header("X-Spark-Signature", _signature(secret, body))
+    try:
+        with urlrequest.urlopen(req, timeout=10) as resp:
+            return resp.status
+    except HTTPError as e:
+        e.close()
+        return e.code
+
+
+if __name__ == "__main__":
+    # ใช้: python webhook_receiver.py <receiver_url> <message_id> <room_id> [secret]
+    if len(sys.argv) < 4:
+        print("usage: python webhook_receiver.py <receiver_url> <message_id> <room_id> [secret]")
+        sys.exit(1)
+    print(post_test_event(*sys.argv[1:5]))